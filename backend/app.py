@@ -1,12 +1,29 @@
-from fastapi import FastAPI
-from utils.data_loader import load_default_data
-from utils.data_loader import load_5lakh_data
-from ml.timeseries import peak_sales_insights
+from fastapi import Body, FastAPI, File, Header, HTTPException, Query, UploadFile
+from fastapi.responses import Response, StreamingResponse
+import pandas as pd
+from utils.data_loader import load_default_data, data_version
+from utils.data_loader import DATASETS, DEFAULT_DATASET, FULL_DATASET, UnknownDataset
+from utils.data_loader import DERIVED_COLUMNS
+from utils.feature_store import get_customer_features, get_customer_row
+from utils.ingest import get_live_aggregates, ingest_rows
+from utils.transactions import get_transaction_store
+from utils.response_cache import RESPONSE_CACHE, cached_response, cached_response_async, dumps
+from utils.model_registry import MODELS
+from utils.workers import SCHEDULER, SchedulerBusy, JobTimeout, WorkerCrashed, fit_customer_model, shutdown_workers
+from utils.jobs import JOBS, TERMINAL
+from utils.serialization import FORMATS, n_rows, negotiate, records, select, table_response
 from ml.knn import build_knn, recommend
-# from ml.apriori import run_apriori
-from ml.kmeans import run_kmeans
-from ml.decision_tree import run_decision_tree
-from ml.pca import run_pca
+from ml.ann import N_PROBES
+from ml.similarity_table import MAX_PAGE, load_or_build_table, page
+from ml.apriori import ranked_rules
+from ml.rule_index import load_rule_index
+from ml.forecast import HORIZON, forecast_catalogue, forecast_rows
+from utils.warmup import RESOURCES
+from utils.metrics import PROFILER, REQUESTS, STAGES, MetricsMiddleware, prometheus_text, stage
+# ml.kmeans / ml.pca / ml.decision_tree (scikit-learn) are imported where
+# they are used, so importing the app stays fast; the warm-up loads them.
+import asyncio
+import importlib
 import json
 import gzip
 import os
@@ -22,6 +39,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost: request latencies include CORS handling
+app.add_middleware(MetricsMiddleware)
 
 
 # ---------------------------------------------------------
@@ -32,17 +51,43 @@ def home():
     return {"status": "API is running!"}
 
 
+# ---------------------------------------------------------
+# HEALTH
+# ---------------------------------------------------------
+@app.get("/health/live")
+def health_live():
+    # The process answers: nothing else is checked
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    200 once every required resource is loaded, 503 while warming up;
+    the body has the state and load time of each resource.
+    """
+    status = RESOURCES.status()
+    return Response(dumps(status), status_code=200 if status["ready"] else 503, media_type="application/json")
+
+
 # --------------------------------------------------------
-# Load Apriori output once when the server starts
+# Apriori output (loaded on first use or by the warm-up)
 # --------------------------------------------------------
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 APR_PATH = os.path.join(BASE_DIR, "cached", "apriori_output.json.gz")
 
-print("[INFO] Loading Apriori data:", APR_PATH)
 
-with gzip.open(APR_PATH, "rt", encoding="utf-8") as f:
-    APRIORI_DATA = json.load(f)
+def read_apriori_body():
+    # Served as stored: the JSON is never parsed for /apriori
+    print("[INFO] Loading Apriori data:", APR_PATH)
+    with gzip.open(APR_PATH, "rb") as f:
+        return f.read()
+
+
+# Itemsets indexed by item / support so rules can be queried on demand
+RULES = RESOURCES.register("rules", lambda: load_rule_index(APR_PATH))
+APRIORI_BODY = RESOURCES.register("apriori_output", read_apriori_body, required=False)
 
 
 # --------------------------------------------------------
@@ -51,14 +96,70 @@ with gzip.open(APR_PATH, "rt", encoding="utf-8") as f:
 
 @app.get("/apriori")
 def get_apriori_results():
-    return APRIORI_DATA
+    return Response(APRIORI_BODY.get(), media_type="application/json")
+
+
+@app.get("/apriori/rules")
+def get_apriori_rules(
+    antecedent: list[str] = Query(None),
+    consequent: list[str] = Query(None),
+    min_support: float = 0.0,
+    min_confidence: float = 0.0,
+    min_lift: float = 0.0,
+    top_k: int = 20,
+    sort_by: str = "lift"
+):
+    """
+    Rules derived on demand from the indexed itemsets, e.g.
+    /apriori/rules?antecedent=X&min_confidence=0.3&min_lift=2&top_k=20
+    """
+    if sort_by not in ("support", "confidence", "lift"):
+        raise HTTPException(status_code=400, detail="sort_by must be support, confidence or lift")
+
+    rule_index = RULES.get()
+    return {
+        "rules": rule_index.rules(
+            antecedent, consequent, min_support, min_confidence, min_lift, top_k, sort_by
+        ),
+        "meta": {
+            "mined_min_support": rule_index.min_support,
+            "itemsets": rule_index.n_itemsets,
+        },
+    }
+
+
+@app.get("/apriori/itemsets")
+def get_apriori_itemsets(product: str, min_support: float = 0.0, top_k: int = 20):
+    return RULES.get().itemsets_with(product, min_support, top_k)
+
+# ---------------------------------------------------------
+# DATASETS
+# ---------------------------------------------------------
+def load_dataset(name):
+    # Every data endpoint takes dataset= (a name from GET /datasets)
+    try:
+        return DATASETS.get(name)
+    except UnknownDataset as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/datasets")
+def list_datasets():
+    """
+    Registered datasets (source, row range, sample), which are loaded and
+    their size against the memory budget.
+    """
+    return DATASETS.status()
+
 
 # ---------------------------------------------------------
 # DEFAULT DATA PREVIEW
 # ---------------------------------------------------------
 @app.get("/default-data")
-def get_default_data():
-    df = load_default_data()
+def get_default_data(dataset: str = DEFAULT_DATASET):
+    df = load_dataset(dataset).drop(columns=DERIVED_COLUMNS)
     return {
         "rows": df.shape[0],
         "columns": df.columns.tolist(),
@@ -70,114 +171,534 @@ def get_default_data():
 # PEAK SALES INSIGHTS
 # ---------------------------------------------------------
 @app.get("/peak-sales")
-def get_peak_sales():
-    df = load_default_data()
-    return peak_sales_insights(df)
+def get_peak_sales(dataset: str = DEFAULT_DATASET):
+    # Served from the live hour / weekday counters, no rescan of the data
+    df = load_dataset(dataset)
+    return cached_response("peak-sales", {}, df, get_live_aggregates(df).peak_insights)
+
+
+@app.get("/sales-cube")
+def get_sales_cube(
+    start: str = None,
+    end: str = None,
+    country: str = None,
+    product: str = None,
+    granularity: str = "hour",
+    measure: str = "revenue",
+    dataset: str = DEFAULT_DATASET,
+):
+    """
+    Quantity / revenue / lines per hour, weekday, day, week, month or
+    country for any date range (inclusive), optionally of one country and /
+    or product, e.g. ?country=United Kingdom&start=2011-09-01&end=2011-11-30.
+    Answered from prefix sums of the live sales cube, no scan of the data.
+    """
+    cube = get_live_aggregates(load_dataset(dataset)).cube
+    try:
+        return cube.query(start, end, country, product, granularity, measure)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/sales-cube/status")
+def sales_cube_status(dataset: str = DEFAULT_DATASET):
+    return get_live_aggregates(load_dataset(dataset)).cube.status()
+
+
+@app.get("/transactions/status")
+def transactions_status(dataset: str = DEFAULT_DATASET):
+    # Sizes of the integer-coded transaction store of the current data
+    return get_transaction_store(load_dataset(dataset)).status()
+
+
+# ---------------------------------------------------------
+# DEMAND FORECAST
+# ---------------------------------------------------------
+@app.get("/forecast")
+def get_forecast(
+    by: str = "product",
+    measure: str = "quantity",
+    model: str = "ets",
+    horizon: int = HORIZON,
+    series: str = None,
+    hourly: bool = False,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000),
+    dataset: str = DEFAULT_DATASET,
+):
+    """
+    Daily forecast of every product (or country) for the next horizon days,
+    largest first, or of one series. The whole catalogue is forecast at once
+    per data version; hourly=true adds each series' hour-of-day shares.
+    """
+    df = load_dataset(dataset)
+    live = get_live_aggregates(df)
+    params = {
+        "by": by, "measure": measure, "model": model, "horizon": horizon,
+        "series": series, "hourly": hourly, "offset": offset, "limit": limit,
+    }
+
+    def compute():
+        result = forecast_catalogue(live.cube, data_version(df), by, measure, model, horizon)
+        return {
+            "by": by,
+            "measure": measure,
+            "model": model,
+            "dates": result["dates"],
+            "total_series": len(result["names"]),
+            "series": forecast_rows(result, series, hourly, offset, limit),
+        }
+
+    try:
+        return cached_response("forecast", params, df, compute)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ---------------------------------------------------------
+# LIVE INGESTION (append new invoice lines)
+# ---------------------------------------------------------
+@app.post("/ingest")
+def ingest(rows: list[dict], dataset: str = DEFAULT_DATASET):
+    """
+    Append invoice lines (JSON records with the dataset's columns).
+    They are folded into the live aggregates without a full recompute.
+    """
+    df = load_dataset(dataset)
+    try:
+        result = ingest_rows(df, pd.DataFrame(rows))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    retrain_models(df)
+    return result
+
+
+@app.post("/ingest/csv")
+def ingest_csv(file: UploadFile = File(...), dataset: str = DEFAULT_DATASET):
+    df = load_dataset(dataset)
+    try:
+        result = ingest_rows(df, pd.read_csv(file.file))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    retrain_models(df)
+    return result
+
+
+def retrain_models(df):
+    # A new data version: its spend models (every backend fitted so far)
+    # train now, not on the next request
+    from ml.decision_tree import retrain_in_background
+    retrain_in_background(df)
+
+
+@app.get("/live/status")
+def live_status(dataset: str = DEFAULT_DATASET):
+    return get_live_aggregates(load_dataset(dataset)).status()
+
+
+@app.get("/live/customers/{customer_id}")
+def live_customer(customer_id: float, dataset: str = DEFAULT_DATASET):
+    row = get_customer_row(load_dataset(dataset), customer_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Unknown customer")
+    return row
+
+
+@app.get("/live/pairs")
+def live_pairs(product: str, top_k: int = 10, dataset: str = DEFAULT_DATASET):
+    return get_live_aggregates(load_dataset(dataset)).top_pairs(product, top_k)
 
 
 # ---------------------------------------------------------
 # KNN SIMILAR PRODUCTS (Startup Cache)
 # ---------------------------------------------------------
-products = []
-products = []
+catalogue = None
 knn_model = None
 sparse_matrix = None
+similar_indices = None
+similar_scores = None
 
 
-@app.on_event("startup")
-def prepare_knn():
-    global products, knn_model, sparse_matrix
+def load_knn():
+    global catalogue, knn_model, sparse_matrix, similar_indices, similar_scores
     df = load_default_data()
-    products, knn_model, sparse_matrix = build_knn(df)
-    print("KNN model loaded with", len(products), "products")
+    catalogue, knn_model, sparse_matrix = build_knn(df)
+    print("KNN model loaded with", len(catalogue), "products")
+
+    similar_indices, similar_scores = load_or_build_table(sparse_matrix)
+    print("Similar-products table ready:", similar_indices.shape)
+    return True
+
+
+def import_models():
+    for module in ("ml.kmeans", "ml.pca", "ml.decision_tree"):
+        importlib.import_module(module)
+
+
+# Warm-up order: what most requests need first. Models and indexes come
+# from memory-mapped files (Arrow cache, cached/models/), so several
+# server processes share their pages instead of each holding a copy.
+RESOURCES.register("data", load_default_data)
+KNN = RESOURCES.register("knn", load_knn)
+RESOURCES.register("customer_features", lambda: get_customer_features(load_default_data()), required=False)
+RESOURCES.register("live_aggregates", lambda: get_live_aggregates(load_default_data()), required=False)
+RESOURCES.register("ml_modules", import_models, required=False)
+
+
+@app.on_event("startup")
+def load_jobs():
+    # Status of the jobs of earlier runs (kept out of import time)
+    JOBS.load_saved()
+
+
+@app.on_event("startup")
+def warm_up():
+    # STARTUP_MODE=background (default): requests are accepted right away
+    # and resources load in a thread; eager: wait for them; lazy: first use
+    RESOURCES.start()
+
+
+def require_knn():
+    # KNN endpoints answer 503 until the index is ready instead of waiting
+    if KNN.peek() is None:
+        if KNN.state in ("cold", "failed"):
+            RESOURCES.warm_in_background(["knn"])
+        raise HTTPException(status_code=503, detail="Similar-products index is warming up")
+
+
+def knn_index(dataset):
+    """
+    (catalogue, model) of a dataset: the warm index for the default one,
+    else built on first use (and then read from cached/models/).
+    """
+    if dataset == DEFAULT_DATASET:
+        require_knn()
+        return catalogue, knn_model
+    dataset_catalogue, model, _ = DATASETS.derived(dataset, "knn", load_dataset(dataset), build_knn)
+    return dataset_catalogue, model
 
 
 # ---------------------------------------------------------
 # KNN ENDPOINTS
 # ---------------------------------------------------------
 @app.get("/similar-products")
-def similar(product: str):
-    return recommend(product, products, knn_model, sparse_matrix)
+def similar(
+    product: str,
+    top_k: int = 5,
+    n_probes: int = N_PROBES,
+    fuzzy: bool = False,
+    dataset: str = DEFAULT_DATASET
+):
+    """
+    n_probes trades latency for recall (neighbouring LSH buckets searched).
+    fuzzy=true falls back to the closest catalogue name when there is no
+    exact / normalized match.
+    """
+    products, model = knn_index(dataset)
+    if fuzzy and products.lookup(product) is None:
+        matches = products.search(product, limit=1)
+        if matches:
+            product = matches[0]
+    return recommend(product, products, model, top_k=top_k, n_probes=n_probes)
 
-# Here limit to first 50 .
-@app.get("/similar-products/all")
-def all_similar():
-    result = {}
-    limit = 50  # avoid API timeout
 
-    for product in products[:limit]:
-        result[product] = recommend(product, products, knn_model, sparse_matrix, top_k=5)
+@app.get("/similar-products/search")
+def search_products(q: str, limit: int = 10, dataset: str = DEFAULT_DATASET):
+    """
+    Catalogue names by prefix, then by trigram similarity (typo tolerant).
+    """
+    products, _ = knn_index(dataset)
+    return products.search(q, limit)
 
-    return result
+# Whole catalogue, one page at a time, from the precomputed top-k table
+@app.get("/similar-products/all")
+def all_similar(
+    cursor: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=MAX_PAGE),
+    top_k: int = Query(5, ge=1),
+    dataset: str = DEFAULT_DATASET
+):
+    if dataset != DEFAULT_DATASET:
+        # Kept on the dataset's registry entry: pages don't rebuild anything
+        df = load_dataset(dataset)
+        products, _, matrix = DATASETS.derived(dataset, "knn", df, build_knn)
+        indices, scores = DATASETS.derived(dataset, "similarity", df, lambda frame: load_or_build_table(matrix))
+        return page(products.names, indices, scores, cursor, limit, top_k)
+
+    # Starts the index load (lazy startup) and answers 503 until it's ready
+    require_knn()
+    if similar_indices is None:
+        raise HTTPException(status_code=503, detail="Similar-products table is warming up")
+
+    return page(catalogue.names, similar_indices, similar_scores, cursor, limit, top_k)
 
 
 # ---------------------------------------------------------
 # APRIORI – Frequently Bought Together
 # ---------------------------------------------------------
-# @app.get("/frequently-bought-together")
-# def get_fbt(
-#     min_support: float = 0.001,
-#     min_confidence: float = 0.01,
-#     top_k: int = 20
-# ):
-#     df =load_5lakh_data()
-
-#     result = run_apriori(df, min_support, min_confidence)
-    
-#     # run_apriori returns {"message": "...", "rules": [...]}
-#     rules = result.get("rules", [])
-    
-#     # Sort by combination_size (descending) first, then by lift (descending)
-#     # This prioritizes showing 3-4 item combinations before 2-item ones
-#     sorted_rules = sorted(
-#         rules, 
-#         key=lambda x: (x.get("combination_size", 0), x["lift"]), 
-#         reverse=True
-#     )
-    
-#     return {
-#         "message": result.get("message", "Success"),
-#         "rules": sorted_rules[:top_k]
-#     }
+@app.get("/frequently-bought-together")
+def get_fbt(
+    min_support: float = 0.001,
+    min_confidence: float = 0.01,
+    top_k: int = 20,
+    dataset: str = FULL_DATASET
+):
+    # Full dataset: the sparse FP-Growth basket no longer needs nrows=10000
+    df = load_dataset(dataset)
+
+    def compute():
+        # Rules are mined once per data version and thresholds, sorted by
+        # combination_size then lift: 3-4 item combinations before pairs
+        result = ranked_rules(df, min_support, min_confidence)
+        return {
+            "message": result.get("message", "Success"),
+            "rules": result["rules"][:top_k]
+        }
+
+    params = {"min_support": min_support, "min_confidence": min_confidence, "top_k": top_k}
+    return cached_response("frequently-bought-together", params, df, compute)
 
 
 
+# ---------------------------
+# MODEL FITS (worker processes)
+# ---------------------------
+async def fit_in_worker(df, func, *args):
+    # Fits run in the worker pool so the event loop keeps serving requests
+    try:
+        return await fit_customer_model(df, func, *args)
+    except (SchedulerBusy, WorkerCrashed) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except JobTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        # Parameters the fit can't take (raised in the worker)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[ERROR] Fit {func.__name__} failed: {type(e).__name__}: {e}")
+        raise HTTPException(status_code=500, detail=f"{func.__name__} failed: {type(e).__name__}: {e}")
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    shutdown_workers()
+    JOBS.shutdown()
+
+
+@app.get("/workers/stats")
+def worker_stats():
+    return SCHEDULER.stats()
+
+
+@app.get("/models/stats")
+def model_stats():
+    # Registry of the API process (workers keep their own mapped copies)
+    return MODELS.stats()
+
+
+async def customer_table(endpoint, params, df, fit, split, fmt, accept, fields, offset, limit):
+    """
+    Per-customer output of a fit in one of the serialization FORMATS,
+    taken from the format parameter or else negotiated from Accept.
+    split(result) -> (envelope or None, columns). The plain JSON document
+    is cached whole; pages / field subsets / other formats are cut from
+    the (memoized) fit result.
+    """
+    fmt = fmt or negotiate(accept)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+
+    if fmt == "json" and not fields and offset == 0 and limit is None:
+        async def document():
+            envelope, columns = split(await fit())
+            with stage(f"{endpoint}.records"):
+                data = records(columns)
+            return data if envelope is None else {**envelope, "data": data}
+        return await cached_response_async(endpoint, params, df, document)
+
+    envelope, columns = split(await fit())
+    try:
+        part = select(columns, fields, offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return table_response(part, fmt, envelope, total=n_rows(columns))
+
+
+def pca_split(result):
+    # pca_table already returns (envelope, columns)
+    envelope, columns = result
+    return envelope, columns
+
+
 # ---------------------------
 # KMEANS ENDPOINT
 # ---------------------------
+def require_kmeans_mode(mode):
+    from ml.kmeans import MODES as KMEANS_MODES
+    if mode not in KMEANS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(KMEANS_MODES)}")
+
+
 @app.get("/customer-segmentation")
-def customer_segmentation(k: int = 3):
+async def customer_segmentation(k: int = Query(3, ge=1), mode: str = "full", dataset: str = DEFAULT_DATASET):
     """
     Run K-Means clustering for customer segmentation.
-    Returns cluster summaries.
+    Returns cluster summaries. mode=minibatch uses mini-batch KMeans, warm
+    started from k - 1 and updated (not refit) when new customers arrive.
     """
-    df = load_default_data()
-    result = run_kmeans(df, k)
-    return result
+    require_kmeans_mode(mode)
+    from ml.kmeans import kmeans_segments
+    df = load_dataset(dataset)
+    return await cached_response_async(
+        "customer-segmentation", {"k": k, "mode": mode}, df,
+        lambda: fit_in_worker(df, kmeans_segments, k, mode)
+    )
+
+
+@app.get("/customer-segmentation/sweep")
+async def customer_segmentation_sweep(
+    k_min: int = Query(2, ge=2),
+    k_max: int = Query(10, ge=2, le=50),
+    mode: str = "full",
+    dataset: str = DEFAULT_DATASET
+):
+    """
+    Inertia / silhouette curves over k_min..k_max (elbow and best k).
+    """
+    require_kmeans_mode(mode)
+    if k_min > k_max:
+        raise HTTPException(status_code=400, detail="k_min must not exceed k_max")
+
+    from ml.kmeans import kmeans_sweep
+    df = load_dataset(dataset)
+    return await cached_response_async(
+        "customer-segmentation-sweep", {"k_min": k_min, "k_max": k_max, "mode": mode}, df,
+        lambda: fit_in_worker(df, kmeans_sweep, k_min, k_max, mode)
+    )
 
 # ---------------------------
 # DECISION TREE ENDPOINT
 # ---------------------------
 
+def require_spend_model(model):
+    from ml.decision_tree import BACKENDS
+    if model not in BACKENDS:
+        raise HTTPException(status_code=400, detail=f"model must be one of {', '.join(BACKENDS)}")
+
+
 @app.get("/customer-spend-prediction")
-def spend_prediction():
-    df = load_default_data()
-    result = run_decision_tree(df)
-    return result
+async def spend_prediction(
+    model: str = "tree",
+    format: str = None,
+    accept: str = Header(None),
+    fields: list[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    dataset: str = DEFAULT_DATASET
+):
+    """
+    model: tree | hist_gradient_boosting | gradient_boosting, trained once
+    per data version. format: json | chunked | ndjson | columnar | arrow |
+    float32, or by Accept (application/vnd.apache.arrow.stream,
+    application/octet-stream for float32, application/x-ndjson). fields /
+    offset / limit select columns and a page (the total is in X-Total-Count).
+    """
+    require_spend_model(model)
+    from ml.decision_tree import spend_predictions
+    df = load_dataset(dataset)
+    return await customer_table(
+        "customer-spend-prediction", {"model": model}, df, lambda: fit_in_worker(df, spend_predictions, model),
+        lambda columns: (None, columns), format, accept, fields, offset, limit
+    )
+
+
+@app.get("/customer-spend-prediction/metrics")
+async def spend_prediction_metrics(model: str = "tree", dataset: str = DEFAULT_DATASET):
+    """
+    MAE / RMSE / R2 of the served model on the customers held out of its
+    training, and the MAE of always predicting the mean for comparison.
+    """
+    require_spend_model(model)
+    from ml.decision_tree import spend_model_metrics
+    df = load_dataset(dataset)
+    return {"version": data_version(df), **await fit_in_worker(df, spend_model_metrics, model)}
+
+
+@app.post("/customer-spend-prediction/score")
+def spend_prediction_score(
+    customer_ids: list[float] = Body(None),
+    rows: list[dict] = Body(None),
+    model: str = "tree",
+    dataset: str = DEFAULT_DATASET
+):
+    """
+    Batch scoring with the trained model (no refit): {"customer_ids": [...]}
+    and / or {"rows": [{total_spend, total_items, total_orders,
+    avg_order_value, recency}, ...]}, all scored in one vectorized call.
+    """
+    require_spend_model(model)
+    if customer_ids is None and rows is None:
+        raise HTTPException(status_code=400, detail="Send customer_ids and / or rows")
+
+    from ml.decision_tree import score_customers
+    customer_df = get_customer_features(load_dataset(dataset))
+    try:
+        return score_customers(customer_df, customer_ids, rows, model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ---------------------------
 # PCA ENDPOINT
 # ---------------------------
+def require_pca_mode(mode):
+    from ml.pca import MODES as PCA_MODES
+    if mode not in PCA_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PCA_MODES)}")
+
+
 @app.get("/pca-visualization")
-def pca_visualization():
+async def pca_visualization(
+    mode: str = "full",
+    format: str = None,
+    accept: str = Header(None),
+    fields: list[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    dataset: str = DEFAULT_DATASET
+):
     """
     Run PCA for customer visualization.
-    Returns 2D coordinates for each customer.
+    Returns 2D coordinates for each customer (formats as for
+    /customer-spend-prediction). mode: full | randomized (randomized SVD)
+    | incremental (IncrementalPCA over chunks of the feature table).
+    After ingests the components are carried over (incremental: partial_fit
+    on the new customers) and refit past a share of changed customers;
+    "components" gives the version they were fitted on and the customers
+    they haven't seen.
     """
-    df = load_default_data()
-    result = run_pca(df)
-    return result
+    require_pca_mode(mode)
+    from ml.pca import pca_table
+    df = load_dataset(dataset)
+    return await customer_table(
+        "pca-visualization", {"mode": mode}, df, lambda: fit_in_worker(df, pca_table, 2, mode),
+        pca_split, format, accept, fields, offset, limit
+    )
+
+
+@app.post("/pca-visualization/project")
+def pca_project(rows: list[dict], mode: str = "full", dataset: str = DEFAULT_DATASET):
+    """
+    Coordinates of customers given as {total_spend, total_items,
+    total_orders} records, using the saved components (no refit).
+    """
+    require_pca_mode(mode)
+    from ml.pca import project_customers
+    customer_df = get_customer_features(load_dataset(dataset))
+    try:
+        return project_customers(customer_df, rows, 2, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 # ---------------------------
@@ -185,7 +706,161 @@ def pca_visualization():
 # ---------------------------
 
 @app.get("/customer-behavior")
-def customer_behavior():
-    df = load_default_data()
-    result = run_pca(df)
-    return result
\ No newline at end of file
+async def customer_behavior(
+    mode: str = "full",
+    format: str = None,
+    accept: str = Header(None),
+    fields: list[str] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    dataset: str = DEFAULT_DATASET
+):
+    require_pca_mode(mode)
+    from ml.pca import pca_table
+    df = load_dataset(dataset)
+    # Same computation as /pca-visualization, so it shares its cache entry
+    return await customer_table(
+        "pca-visualization", {"mode": mode}, df, lambda: fit_in_worker(df, pca_table, 2, mode),
+        pca_split, format, accept, fields, offset, limit
+    )
+
+
+# ---------------------------
+# RESPONSE CACHE
+# ---------------------------
+@app.get("/cache/stats")
+def cache_stats():
+    return RESPONSE_CACHE.stats()
+
+
+# ---------------------------
+# METRICS + PROFILING
+# ---------------------------
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus text format: request latency histograms, stage timings
+    and a few gauges and counters of the caches and the worker pool.
+    """
+    cache = RESPONSE_CACHE.stats()
+    workers = SCHEDULER.stats()
+    gauges = {
+        "response_cache_bytes": ("Bytes of cached response bodies.", cache["bytes"]),
+        "worker_jobs_in_flight": ("Fit jobs running or queued on the worker pool.", workers["in_flight"]),
+    }
+    counters = {
+        "response_cache_hits_total": ("Response cache hits since startup.", cache["hits"]),
+        "response_cache_misses_total": ("Response cache misses since startup.", cache["misses"]),
+        "worker_jobs_completed_total": ("Fit jobs completed since startup.", workers["completed"]),
+    }
+    return Response(prometheus_text(gauges, counters), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/summary")
+def metrics_summary():
+    # p50 / p95 / p99 per endpoint and per stage, as JSON
+    return {"requests": REQUESTS.stats(), "stages": STAGES.stats()}
+
+
+@app.post("/profiling")
+def set_profiling(enabled: bool):
+    """
+    Switches the sampling profiler on or off. While on, a request sent
+    with the header "X-Profile: 1" is profiled (see GET /profiles).
+    """
+    PROFILER.enabled = enabled
+    return {"enabled": PROFILER.enabled, "interval": PROFILER.interval}
+
+
+@app.get("/profiles")
+def list_profiles():
+    return {"enabled": PROFILER.enabled, "profiles": PROFILER.list()}
+
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    # Collapsed stacks: flamegraph.pl, speedscope or inferno draw them as is
+    text = PROFILER.collapsed(profile_id)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    return Response(text, media_type="text/plain")
+
+
+# ---------------------------
+# BACKGROUND JOBS
+# ---------------------------
+@app.post("/jobs", status_code=202)
+def submit_job(kind: str, params: dict = Body(None)):
+    """
+    Queue a long-running analysis, e.g. POST /jobs?kind=apriori with
+    {"min_support": 0.002} as body. Poll GET /jobs/{id} for its progress.
+    """
+    try:
+        return JOBS.submit(kind, params).to_dict()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/jobs")
+def list_jobs():
+    return [job.to_dict() for job in JOBS.list()]
+
+
+def require_job(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return require_job(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, interval: float = 0.5):
+    """
+    Status of the job as NDJSON, one line per change, until it finishes.
+    """
+    job = require_job(job_id)
+
+    async def events():
+        last = None
+        while True:
+            status = job.to_dict()
+            if status != last:
+                yield json.dumps(status) + "\n"
+                last = status
+            if status["status"] in TERMINAL:
+                return
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(None, ge=0)):
+    """
+    Result rows of a finished job, streamed from disk as NDJSON.
+    """
+    job = require_job(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+
+    return StreamingResponse(
+        JOBS.iter_results(job, offset, limit),
+        media_type="application/x-ndjson",
+        headers={"X-Total-Rows": str(job.rows)},
+    )
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancels a queued / running job, or deletes a finished one.
+    """
+    job = JOBS.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.to_dict()
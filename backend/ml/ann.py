@@ -0,0 +1,92 @@
+import math
+import numpy as np
+
+# Hyperplane LSH defaults. More tables / probes = better recall, slower queries.
+N_TABLES = 16
+N_PROBES = 3
+BUCKET_SIZE = 16     # target number of products per bucket when picking n_bits
+
+
+# =============================================================================
+# RANDOM-PROJECTION LSH (cosine)
+# =============================================================================
+class LSHIndex:
+    """
+    Approximate cosine nearest neighbours over the rows of a sparse matrix.
+
+    Every row is hashed in n_tables tables by the signs of n_bits random
+    projections; rows sharing a bucket with the query (or with one of its
+    n_probes closest neighbouring buckets) are re-ranked by exact cosine.
+    Bucket lookups are binary searches over sorted codes, so query cost
+    depends on bucket sizes, not on the number of rows.
+    """
+
+    def __init__(self, n_tables=N_TABLES, n_bits=None, seed=42):
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.seed = seed
+
+    def fit(self, matrix):
+        from scipy.sparse import csr_matrix           # deferred: keeps scipy /
+        from sklearn.preprocessing import normalize   # sklearn out of startup
+        self.matrix = csr_matrix(normalize(matrix), dtype=np.float32)
+        n_rows, n_features = self.matrix.shape
+
+        if self.n_bits is None:
+            self.n_bits = int(min(30, max(4, math.log2(max(n_rows, 1) / BUCKET_SIZE))))
+
+        rng = np.random.default_rng(self.seed)
+        self.planes = rng.standard_normal((n_features, self.n_tables * self.n_bits)).astype(np.float32)
+
+        self.codes = self.hash_rows(self.matrix @ self.planes)
+        self.order = np.argsort(self.codes, axis=0, kind="stable")
+        self.sorted_codes = np.take_along_axis(self.codes, self.order, axis=0)
+        return self
+
+    def hash_rows(self, projections):
+        """
+        (n, n_tables * n_bits) projections -> (n, n_tables) int64 bucket codes.
+        """
+        bits = (np.asarray(projections) > 0).reshape(-1, self.n_tables, self.n_bits)
+        weights = 1 << np.arange(self.n_bits, dtype=np.int64)
+        return (bits * weights).sum(axis=2)
+
+    def probe_codes(self, row, n_probes):
+        """
+        The row's own bucket code per table plus n_probes neighbours, made
+        by flipping the bits whose projection was closest to zero.
+        """
+        n_probes = min(n_probes, self.n_bits)
+        projection = np.asarray(self.matrix[row] @ self.planes).reshape(self.n_tables, self.n_bits)
+        own = self.codes[row]
+
+        flips = np.argsort(np.abs(projection), axis=1)[:, :n_probes]
+        probes = own[:, None] ^ (1 << flips.astype(np.int64))
+        return np.concatenate([own[:, None], probes], axis=1)
+
+    def candidates(self, row, n_probes):
+        found = []
+        for table, codes in enumerate(self.probe_codes(row, n_probes)):
+            column = self.sorted_codes[:, table]
+            starts = np.searchsorted(column, codes, side="left")
+            ends = np.searchsorted(column, codes, side="right")
+            for start, end in zip(starts, ends):
+                found.append(self.order[start:end, table])
+        return np.unique(np.concatenate(found))
+
+    def query(self, row, k, n_probes=N_PROBES):
+        """
+        Top-k (ids, cosine similarities) for an indexed row, itself excluded.
+        """
+        candidates = self.candidates(row, n_probes)
+        candidates = candidates[candidates != row]
+        if len(candidates) == 0:
+            return candidates, np.zeros(0, dtype=np.float32)
+
+        sims = (self.matrix[candidates] @ self.matrix[row].T).toarray().ravel()
+        if len(candidates) > k:
+            top = np.argpartition(-sims, k)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return candidates[top], sims[top]
@@ -1,16 +1,27 @@
 import os
 import json
 import gzip
+import threading
+from collections import OrderedDict
 import pandas as pd
-from mlxtend.frequent_patterns import fpgrowth, association_rules
+
+from ml.fpgrowth import mine
+from utils.data_loader import data_version
+from utils.metrics import timed
+from utils.transactions import get_transaction_store
 
 # =============================================================================
 # CONFIG (for ~8k invoices, 2.7k items)
 # =============================================================================
+# MIN_SUPPORT is the floor for everything /apriori/rules can answer: the
+# frequent itemsets are saved at this support and rules are derived from
+# them per query (ml/rule_index.py), so keep it at the lowest useful value.
 MIN_SUPPORT = 0.0005        # 0.05%
 MIN_CONFIDENCE = 0.05
 TOP_K_RULES = 300
 OUTPUT_FILENAME = "apriori_output.json.gz"
+# Rule sets of /frequently-bought-together kept per (data version, thresholds)
+MAX_MINED = 8
 
 
 def get_root():
@@ -39,59 +50,26 @@ def load_uci_retail():
     return df
 
 
-# =============================================================================
-# BUILD BASKET
-# =============================================================================
-def preprocess(df):
-    print("[INFO] Building Invoice × Item matrix…")
-
-    basket = (
-        df.groupby(['InvoiceNo', 'Description'])['Description']
-        .count()
-        .unstack()
-        .fillna(0)
-    )
-
-    basket = basket.astype(bool)
-
-    print("[INFO] Basket shape:", basket.shape)
-    return basket
-
-
 # =============================================================================
 # RUN FP-GROWTH + RULES
 # =============================================================================
-def run_mba():
+def run_mba(n_jobs=1, progress=None):
     df = load_uci_retail()
-    basket = preprocess(df)
-
-    print(f"[INFO] Running FP-Growth (min_support={MIN_SUPPORT})…")
-    freq_items = fpgrowth(basket, min_support=MIN_SUPPORT, use_colnames=True)
 
-    print("[INFO] Frequent itemsets:", len(freq_items))
+    print(f"[INFO] Running sparse FP-Growth (min_support={MIN_SUPPORT})…")
+    result = mine(df, MIN_SUPPORT, MIN_CONFIDENCE, n_jobs=n_jobs, progress=progress)
 
-    # Convert frozenset → list for JSON
-    freq_items["itemsets"] = freq_items["itemsets"].apply(list)
+    print("[INFO] Frequent itemsets:", len(result["frequent_itemsets"]))
+    print("[INFO] Rules generated:", len(result["rules"]))
 
-    print(f"[INFO] Generating rules (min_conf={MIN_CONFIDENCE})…")
-    rules = association_rules(freq_items, metric="confidence", min_threshold=MIN_CONFIDENCE)
-
-    print("[INFO] Rules generated:", len(rules))
-
-    if rules.empty:
+    if not result["rules"]:
         print("⚠️ No rules found — try lowering MIN_CONFIDENCE further")
 
-    rules = rules[["antecedents", "consequents", "support", "confidence", "lift"]]
-
-    # frozenset → list
-    rules["antecedents"] = rules["antecedents"].apply(list)
-    rules["consequents"] = rules["consequents"].apply(list)
-
-    rules = rules.sort_values(by="lift", ascending=False).head(TOP_K_RULES)
+    rules = sorted(result["rules"], key=lambda r: r["lift"], reverse=True)[:TOP_K_RULES]
 
     return {
-        "frequent_itemsets": freq_items.to_dict(orient="records"),
-        "rules": rules.to_dict(orient="records"),
+        "frequent_itemsets": result["frequent_itemsets"],
+        "rules": rules,
         "meta": {
             "min_support": MIN_SUPPORT,
             "min_confidence": MIN_CONFIDENCE,
@@ -101,6 +79,67 @@ def run_mba():
     }
 
 
+# =============================================================================
+# ON-DEMAND RULES (/frequently-bought-together)
+# =============================================================================
+@timed("apriori.mine")
+def run_apriori(df, min_support=0.001, min_confidence=0.01, max_len=4, n_jobs=1, progress=None):
+    """
+    Mine rules straight from a transaction frame (any size, the basket
+    stays sparse). Each rule also carries combination_size, the number of
+    distinct items it involves. progress(fraction) follows the mining.
+    """
+    # The basket comes from the integer-coded store (built once per version)
+    result = mine(
+        get_transaction_store(df), min_support, min_confidence, max_len=max_len, n_jobs=n_jobs, progress=progress
+    )
+
+    rules = result["rules"]
+    for rule in rules:
+        rule["combination_size"] = len(rule["antecedents"]) + len(rule["consequents"])
+
+    return {
+        "message": f"Found {len(rules)} rules from {result['transactions']} invoices",
+        "rules": rules,
+    }
+
+
+_mined = OrderedDict()
+_mined_lock = threading.Lock()
+
+
+def ranked_rules(df, min_support=0.001, min_confidence=0.01, max_len=4):
+    """
+    run_apriori with its rules sorted for /frequently-bought-together
+    (bigger combinations first, then by lift), mined once per data version
+    and thresholds. Frames without a version are mined every time.
+    """
+    def compute():
+        result = run_apriori(df, min_support, min_confidence, max_len)
+        result["rules"] = sorted(
+            result["rules"], key=lambda r: (r["combination_size"], r["lift"]), reverse=True
+        )
+        return result
+
+    version = data_version(df)
+    if version is None:
+        return compute()
+
+    key = (version, min_support, min_confidence, max_len)
+    with _mined_lock:
+        result = _mined.get(key)
+        if result is not None:
+            _mined.move_to_end(key)
+            return result
+
+    result = compute()
+    with _mined_lock:
+        _mined[key] = result
+        while len(_mined) > MAX_MINED:
+            _mined.popitem(last=False)
+    return result
+
+
 # =============================================================================
 # SAVE .JSON.GZ
 # =============================================================================
@@ -0,0 +1,121 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+import numpy as np
+
+
+def normalize_name(name):
+    """
+    Lookup key of a description: upper case, single spaces, no padding
+    ("glass heart t-light holder " == "GLASS HEART T-LIGHT HOLDER").
+    """
+    return re.sub(r"\s+", " ", str(name)).strip().upper()
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# =============================================================================
+# PRODUCT CATALOGUE
+# =============================================================================
+class ProductCatalogue:
+    """
+    Distinct products (one row per normalized description) with:
+      - a hash index name / key -> row id, for O(1) exact lookups
+      - a sorted key list for prefix search
+      - a trigram index for fuzzy search
+    The prefix / trigram structures are built on first use.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = [normalize_name(name) for name in self.names]
+        self.key_ids = {key: i for i, key in enumerate(self.keys)}
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+
+        self.lock = threading.Lock()
+        self.sorted_keys = None
+        self.grams = None
+
+    @classmethod
+    def from_descriptions(cls, descriptions):
+        """
+        Catalogue of a Description column: first spelling of every
+        normalized key wins.
+        """
+        seen = {}
+        for name in descriptions:
+            seen.setdefault(normalize_name(name), name)
+        return cls(seen.values())
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, name):
+        """
+        Row id of a product by exact or normalized name, else None.
+        """
+        row = self.name_ids.get(name)
+        if row is None:
+            row = self.key_ids.get(normalize_name(name))
+        return row
+
+    def build_search_index(self):
+        with self.lock:
+            if self.grams is not None:
+                return
+
+            order = sorted(range(len(self.keys)), key=self.keys.__getitem__)
+            postings = defaultdict(list)
+            gram_counts = np.zeros(len(self.keys), dtype=np.int32)
+            for row, key in enumerate(self.keys):
+                grams = trigrams(key)
+                gram_counts[row] = len(grams)
+                for gram in grams:
+                    postings[gram].append(row)
+
+            self.gram_counts = gram_counts
+            self.sorted_keys = ([self.keys[i] for i in order], order)
+            self.grams = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def prefix(self, text, limit=10):
+        self.build_search_index()
+        keys, order = self.sorted_keys
+        key = normalize_name(text)
+
+        rows = []
+        i = bisect_left(keys, key)
+        while i < len(keys) and len(rows) < limit and keys[i].startswith(key):
+            rows.append(order[i])
+            i += 1
+        return rows
+
+    def fuzzy(self, text, limit=10):
+        """
+        Rows ranked by trigram Dice similarity to text (typos, word order).
+        """
+        self.build_search_index()
+        query = trigrams(normalize_name(text))
+
+        hits = [self.grams[g] for g in query if g in self.grams]
+        if not hits:
+            return []
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.keys))
+        rows = np.flatnonzero(shared)
+        scores = 2 * shared[rows] / (len(query) + self.gram_counts[rows])
+
+        top = rows[np.argsort(-scores, kind="stable")[:limit]]
+        return top.tolist()
+
+    def search(self, text, limit=10):
+        """
+        Prefix matches first, then fuzzy matches, without duplicates.
+        """
+        rows = self.prefix(text, limit)
+        if len(rows) < limit:
+            rows += [r for r in self.fuzzy(text, limit) if r not in rows][:limit - len(rows)]
+        return [self.names[r] for r in rows]
@@ -1,50 +1,166 @@
+import threading
+import numpy as np
 import pandas as pd
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 from sklearn.tree import DecisionTreeRegressor
 from sklearn.model_selection import train_test_split
 
+from utils.data_loader import data_version
+from utils.feature_store import get_customer_features
+from utils.metrics import stage, timed
+from utils.model_registry import MODELS
+from utils.serialization import records
 
-def prepare_customer_features(raw_df):
-    df = raw_df.dropna(subset=["CustomerID"]).copy()
-    df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"])
+FEATURES = ["total_spend", "total_items", "total_orders", "avg_order_value", "recency"]
+TARGET = "next_month_spend"
+# tree:                   a single decision tree (the original model)
+# hist_gradient_boosting: boosted trees on binned features, fits fast on
+#                         large customer bases
+# gradient_boosting:      classic boosted trees, slower but often closer
+BACKENDS = ("tree", "hist_gradient_boosting", "gradient_boosting")
+# Share of the customers held out to score the fitted model
+TEST_SIZE = 0.2
 
-    df["Amount"] = df["Quantity"] * df["UnitPrice"]
 
-    customer = df.groupby("CustomerID").agg(
-        total_spend=("Amount", "sum"),
-        total_items=("Quantity", "sum"),
-        total_orders=("InvoiceNo", "nunique"),   
-        avg_order_value=("Amount", "mean"),
-        last_purchase=("InvoiceDate", "max")
-    ).reset_index()
+def make_regressor(backend):
+    if backend == "hist_gradient_boosting":
+        return HistGradientBoostingRegressor(random_state=42)
+    if backend == "gradient_boosting":
+        return GradientBoostingRegressor(random_state=42)
+    return DecisionTreeRegressor(random_state=42)
 
-    max_date = df["InvoiceDate"].max()
-    customer["recency"] = (max_date - customer["last_purchase"]).dt.days
 
-    df_recent = df[df["InvoiceDate"] >= max_date - pd.Timedelta(days=30)]
-    recent_spend = df_recent.groupby("CustomerID")["Amount"].sum()
-    customer["next_month_spend"] = customer["CustomerID"].map(recent_spend).fillna(0)
+def holdout_metrics(y_train, y_test, predictions):
+    # Errors on the held-out customers, next to always predicting the train mean
+    return {
+        "mae": round(float(mean_absolute_error(y_test, predictions)), 4),
+        "rmse": round(float(np.sqrt(mean_squared_error(y_test, predictions))), 4),
+        "r2": round(float(r2_score(y_test, predictions)), 4) if len(y_test) > 1 else None,
+        "baseline_mae": round(float(np.abs(y_test - y_train.mean()).mean()), 4),
+        "n_train": len(y_train),
+        "n_test": len(y_test),
+    }
 
-    return customer
 
+@timed("spend_prediction.fit")
+def fit_spend_model(X, Y, backend="tree"):
+    """
+    The model fitted on the training split and its metrics on the test
+    split (the model served is the one the metrics describe).
+    """
+    X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=TEST_SIZE, random_state=42)
 
-def run_decision_tree(df):
-    customer = prepare_customer_features(df)
+    model = make_regressor(backend)
+    model.fit(X_train, y_train)
+    return {"model": model, "metrics": holdout_metrics(y_train, y_test, model.predict(X_test))}
 
-    X = customer[["total_spend", "total_items", "total_orders", "avg_order_value", "recency"]]
-    Y = customer["next_month_spend"]
 
-    X_train, X_test, y_train, y_test = train_test_split(X, Y, test_size=0.2, random_state=42)
+def spend_model(customer, backend="tree"):
+    """
+    {model, metrics} for a customer feature table, fitted once per dataset
+    version and backend, then reused from the registry. A new ingested
+    revision is a new version, so it gets a freshly trained model.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"model must be one of {', '.join(BACKENDS)}")
 
-    model = DecisionTreeRegressor(random_state=42)
-    model.fit(X_train, y_train)
+    with stage("spend_prediction.model"):
+        return MODELS.get_or_fit(
+            "spend_model", customer.attrs.get("data_version"), {"backend": backend},
+            lambda: fit_spend_model(customer[FEATURES], customer[TARGET], backend)
+        )
+
+
+_retraining = threading.Lock()
+
+
+def fitted_backends(version):
+    """
+    The backends to keep current for a data version: "tree" (the default)
+    and every other backend with a model for an earlier revision of it.
+    """
+    return [
+        backend for backend in BACKENDS
+        if backend == "tree" or MODELS.previous("spend_model", version, {"backend": backend}) is not None
+    ]
+
+
+def retrain_in_background(df):
+    """
+    Trains the models of df's current data version in a thread, for every
+    backend fitted before (fitted_backends), so the first prediction after
+    an ingest doesn't wait for the fit or get an older version's model.
+    Versions appended while it trains are picked up before the thread ends.
+    """
+    def retrain():
+        if not _retraining.acquire(blocking=False):
+            return
+        try:
+            trained = None
+            while data_version(df) != trained:
+                trained = data_version(df)
+                customer = get_customer_features(df)
+                for backend in fitted_backends(trained):
+                    spend_model(customer, backend)
+                    print(f"[INFO] Spend model ({backend}) trained for {trained}")
+        except Exception as e:
+            print(f"[ERROR] Spend model retrain failed: {type(e).__name__}: {e}")
+        finally:
+            _retraining.release()
+
+    threading.Thread(target=retrain, name="spend-retrain", daemon=True).start()
+
+
+def run_decision_tree(df, backend="tree"):
+    return records(spend_predictions(get_customer_features(df), backend))
+
+
+def spend_predictions(customer, backend="tree"):
+    """
+    Predicted next-month spend per customer of a feature table
+    (runs in a worker process), as columns ({field: NumPy array}).
+    """
+    model = spend_model(customer, backend)["model"]
+
+    with stage("spend_prediction.predict"):
+        predictions = model.predict(customer[FEATURES])
+
+    return {
+        "CustomerID": customer["CustomerID"].to_numpy().astype("int64"),
+        "predicted_spend": predictions.round(2),
+    }
+
+
+def spend_model_metrics(customer, backend="tree"):
+    return {"model": backend, **spend_model(customer, backend)["metrics"]}
+
+
+@timed("spend_prediction.score")
+def score_customers(customer, customer_ids=None, rows=None, backend="tree"):
+    """
+    Predicted spend of many customers in one predict() call: known
+    customers by ID (unknown ones get None) and / or feature rows with
+    the FEATURES fields. Raises ValueError when a feature is missing.
+    """
+    model = spend_model(customer, backend)["model"]
+    result = {"model": backend}
 
-    predictions = model.predict(X)
+    if customer_ids is not None:
+        positions = pd.Index(customer["CustomerID"]).get_indexer(customer_ids)
+        known = positions >= 0
+        predicted = np.full(len(positions), np.nan)
+        if known.any():
+            predicted[known] = model.predict(customer[FEATURES].iloc[positions[known]])
+        result["customer_ids"] = list(customer_ids)
+        result["predicted_spend"] = [None if np.isnan(p) else p for p in predicted.round(2).tolist()]
 
-    result = []
-    for cust_id, pred in zip(customer["CustomerID"], predictions):
-        result.append({
-            "CustomerID": int(cust_id),
-            "predicted_spend": round(float(pred), 2)
-        })
+    if rows is not None:
+        features = pd.DataFrame(rows)
+        missing = [col for col in FEATURES if col not in features.columns]
+        if missing:
+            raise ValueError(f"Missing features: {', '.join(missing)}")
+        predicted = model.predict(features[FEATURES].astype("float64")) if len(features) else np.zeros(0)
+        result["row_predictions"] = predicted.round(2).tolist()
 
     return result
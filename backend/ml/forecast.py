@@ -0,0 +1,171 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from ml.sales_cube import MEASURES
+from utils.metrics import timed
+from utils.workers import SCHEDULER
+
+# seasonal_naive: every future day repeats the same weekday of the last week
+# ets:            additive exponential smoothing, level + weekday season
+#                 (Holt-Winters without trend), parameters picked per series
+FORECAST_MODELS = ("seasonal_naive", "ets")
+SEASON = 7
+HORIZON = 14
+MAX_HORIZON = 90
+# Smoothing parameters tried for every series at once (alpha x gamma grid)
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.8)
+GAMMAS = (0.0, 0.05, 0.1, 0.3)
+# Series per block; with n_jobs > 1 blocks go to the shared worker pool
+BLOCK_ROWS = 512
+# Catalogue forecasts kept per (data version, by, measure, model, horizon)
+MAX_FORECASTS = 8
+
+
+# =============================================================================
+# MODELS (series are rows, every step is one vector op over all of them)
+# =============================================================================
+def seasonal_naive(Y, horizon=HORIZON, season=SEASON):
+    last = Y[:, -season:]
+    return np.tile(last, (1, -(-horizon // season)))[:, :horizon]
+
+
+def ets(Y, horizon=HORIZON, season=SEASON):
+    """
+    Additive level + seasonal smoothing of every row of Y, fitted for the
+    whole (alpha, gamma) grid in the same pass; each row keeps the pair
+    with the smallest one-step-ahead squared error.
+    """
+    n, T = Y.shape
+    if T < 2 * season:
+        return seasonal_naive(Y, horizon, season)
+
+    grid = np.array([(a, g) for a in ALPHAS for g in GAMMAS])
+    alpha = grid[:, 0, None]
+    gamma = grid[:, 1, None]
+
+    # Start from the first season: its mean and the offsets around it
+    first = Y[:, :season]
+    level = np.broadcast_to(first.mean(axis=1), (len(grid), n)).copy()
+    seasonal = np.broadcast_to((first - first.mean(axis=1, keepdims=True)).T[:, None], (season, len(grid), n)).copy()
+    sse = np.zeros((len(grid), n))
+
+    for t in range(season, T):
+        s = seasonal[t % season]
+        error = Y[:, t] - (level + s)
+        sse += error ** 2
+        new_level = level + alpha * error
+        seasonal[t % season] = s + gamma * (Y[:, t] - new_level - s)
+        level = new_level
+
+    best = sse.argmin(axis=0)
+    columns = np.arange(n)
+    steps = np.arange(T, T + horizon) % season
+    forecast = level[best, columns][:, None] + seasonal[steps][:, best, columns].T
+    return np.maximum(forecast, 0)
+
+
+def forecast_block(args):
+    Y, model, horizon = args
+    if model == "seasonal_naive":
+        return seasonal_naive(Y, horizon)
+    return ets(Y, horizon)
+
+
+@timed("forecast.matrix")
+def forecast_matrix(Y, model="ets", horizon=HORIZON, n_jobs=1):
+    """
+    Forecast of every row of Y (series x days) for the next horizon days.
+    Rows are cut into blocks of BLOCK_ROWS; n_jobs > 1 runs them on the
+    scheduler's worker pool (bounded, started once) instead of in-thread.
+    """
+    if model not in FORECAST_MODELS:
+        raise ValueError(f"model must be one of {', '.join(FORECAST_MODELS)}")
+
+    blocks = [Y[start:start + BLOCK_ROWS] for start in range(0, len(Y), BLOCK_ROWS)]
+    if n_jobs == 1 or len(blocks) <= 1:
+        parts = [forecast_block((block, model, horizon)) for block in blocks]
+    else:
+        parts = SCHEDULER.map(forecast_block, [(block, model, horizon) for block in blocks])
+
+    return np.vstack(parts) if parts else np.zeros((0, horizon))
+
+
+# =============================================================================
+# CATALOGUE FORECASTS
+# =============================================================================
+_forecasts = OrderedDict()
+_forecasts_lock = threading.Lock()
+
+
+def check_params(by, measure, model, horizon):
+    # Raises ValueError for parameters forecast_catalogue can not take
+    if by not in ("product", "country"):
+        raise ValueError("by must be product or country")
+    if measure not in MEASURES:
+        raise ValueError(f"measure must be one of {', '.join(MEASURES)}")
+    if model not in FORECAST_MODELS:
+        raise ValueError(f"model must be one of {', '.join(FORECAST_MODELS)}")
+    if not 1 <= horizon <= MAX_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_HORIZON}")
+
+
+def forecast_catalogue(cube, version, by="product", measure="quantity", model="ets", horizon=HORIZON, n_jobs=1):
+    """
+    Daily forecast of every product (or country) of the sales cube, plus
+    its hour-of-day profile (the daily forecast times a share gives the
+    hourly one). Computed once per data version and parameters.
+    """
+    check_params(by, measure, model, horizon)
+    key = (version, by, measure, model, horizon)
+    with _forecasts_lock:
+        result = _forecasts.get(key)
+        if result is not None:
+            _forecasts.move_to_end(key)
+            return result
+
+    if cube.first_day is None:
+        # No sales at all: nothing to forecast (and no last day to count from)
+        return {"names": [], "dates": [], "forecast": np.zeros((0, horizon)),
+                "hour_profile": np.zeros((0, 24)), "history_days": 0}
+
+    names, first_day, Y = cube.daily_matrix(by, measure)
+    last_day = np.datetime64(first_day) + np.timedelta64(Y.shape[1] - 1, "D")
+    result = {
+        "names": names,
+        "dates": [str(last_day + np.timedelta64(d, "D")) for d in range(1, horizon + 1)],
+        "forecast": forecast_matrix(Y, model, horizon, n_jobs),
+        "hour_profile": cube.hour_profile(by, measure),
+        "history_days": Y.shape[1],
+    }
+
+    if version is not None:
+        with _forecasts_lock:
+            _forecasts[key] = result
+            while len(_forecasts) > MAX_FORECASTS:
+                _forecasts.popitem(last=False)
+    return result
+
+
+def forecast_rows(result, series=None, hourly=False, offset=0, limit=None):
+    """
+    One row per series (name, daily forecast, optional hour shares),
+    ordered by forecast total. Raises ValueError for an unknown series.
+    """
+    names = result["names"]
+    if series is not None:
+        if series not in names:
+            raise ValueError(f"Unknown series: {series}")
+        order = [names.index(series)]
+    else:
+        order = np.argsort(-result["forecast"].sum(axis=1), kind="stable")
+        order = order[offset:None if limit is None else offset + limit].tolist()
+
+    forecast = result["forecast"].round(2)
+    rows = []
+    for i in order:
+        row = {"name": names[i], "total": round(float(forecast[i].sum()), 2), "forecast": forecast[i].tolist()}
+        if hourly:
+            row["hour_profile"] = result["hour_profile"][i].round(4).tolist()
+        rows.append(row)
+    return rows
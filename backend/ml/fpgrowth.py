@@ -0,0 +1,314 @@
+import math
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+
+from utils.transactions import TransactionStore
+from utils.workers import MAX_WORKERS, SCHEDULER, in_worker_process
+
+
+# =============================================================================
+# SPARSE BASKET
+# =============================================================================
+def build_sparse_basket(df):
+    """
+    Invoice × item basket as a boolean CSR matrix, built straight from the
+    integer codes of InvoiceNo / Description (no dense unstack).
+
+    Returns (basket, items) where items[j] is the description of column j.
+    A TransactionStore gives the same basket straight from its codes.
+    """
+    if isinstance(df, TransactionStore):
+        basket, _, items = df.basket()
+        return basket, items
+
+    from scipy.sparse import csr_matrix   # deferred: keeps scipy out of startup
+    df = df[df["Description"].notna()]
+    if "Quantity" in df.columns:
+        df = df[df["Quantity"] > 0]
+
+    invoice_codes, invoices = pd.factorize(df["InvoiceNo"])
+    item_codes, items = pd.factorize(df["Description"])
+
+    basket = csr_matrix(
+        (np.ones(len(item_codes), dtype=bool), (invoice_codes, item_codes)),
+        shape=(len(invoices), len(items)),
+    )
+    # Duplicate (invoice, item) lines were summed by the constructor; it's a set
+    basket.sum_duplicates()
+    basket.data[:] = True
+
+    return basket, np.asarray(items, dtype=object)
+
+
+def transactions(basket, columns):
+    """
+    Rows of the basket as tuples of column ranks, keeping only `columns`
+    (ranked by position in that array). Empty rows are dropped.
+    """
+    rank = np.full(basket.shape[1], -1, dtype=np.int64)
+    rank[columns] = np.arange(len(columns))
+
+    mapped = rank[basket.indices]
+    rows = []
+    for i in range(basket.shape[0]):
+        row = mapped[basket.indptr[i]:basket.indptr[i + 1]]
+        row = np.sort(row[row >= 0])
+        if len(row):
+            rows.append(tuple(row.tolist()))
+    return rows
+
+
+# =============================================================================
+# FP-GROWTH (projected databases)
+# =============================================================================
+def grow(db, suffix, min_count, max_len, out, progress=None):
+    """
+    Pattern growth over a projected database {path: count}. Paths are
+    tuples of item ranks in ascending order (most frequent first), so the
+    conditional base of an item is the prefix of every path holding it —
+    the same thing an FP-tree's header links give, with identical paths
+    merged by the dict. progress(fraction) is called before each item of
+    the top level; deeper levels call it again with their top-level item's
+    fraction, so a callback that raises (cancelled job) stops them too.
+    """
+    counts = defaultdict(int)
+    occurrences = defaultdict(list)
+    for path, count in db.items():
+        for item in path:
+            counts[item] += count
+            occurrences[item].append(path)
+
+    for done, (item, count) in enumerate(counts.items()):
+        if progress is not None:
+            progress(done / len(counts))
+        if count < min_count:
+            continue
+
+        itemset = suffix + (item,)
+        out[itemset] = count
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+
+        conditional = defaultdict(int)
+        for path in occurrences[item]:
+            prefix = path[:bisect_left(path, item)]
+            if prefix:
+                conditional[prefix] += db[path]
+
+        if conditional:
+            inner = None if progress is None else (lambda _, at=done / len(counts): progress(at))
+            grow(conditional, itemset, min_count, max_len, out, inner)
+
+
+def mine_counts(basket, min_count, max_len=None, progress=None):
+    """
+    Frequent itemsets of a basket as {tuple of column ids: count}.
+    progress(fraction) is called per frequent item grown.
+    """
+    item_counts = np.bincount(basket.indices, minlength=basket.shape[1])
+    frequent = np.flatnonzero(item_counts >= min_count)
+    frequent = frequent[np.argsort(-item_counts[frequent], kind="stable")]
+
+    db = defaultdict(int)
+    for row in transactions(basket, frequent):
+        db[row] += 1
+
+    ranked = {}
+    grow(db, (), min_count, max_len, ranked, progress)
+
+    return {
+        tuple(sorted(int(frequent[r]) for r in itemset)): count
+        for itemset, count in ranked.items()
+    }
+
+
+# =============================================================================
+# SON PARTITIONED COUNTING
+# =============================================================================
+MIN_LOCAL_COUNT = 5
+
+
+def mine_partition(args):
+    basket, min_support, max_len = args
+    min_count = max(1, math.ceil(min_support * basket.shape[0]))
+    return list(mine_counts(basket, min_count, max_len))
+
+
+def count_partition(args):
+    """
+    Exact counts of candidate itemsets within one partition, intersecting
+    the row lists of each item's column.
+    """
+    basket, candidates = args
+    csc = basket.tocsc()
+    columns = {
+        j: csc.indices[csc.indptr[j]:csc.indptr[j + 1]]
+        for j in {j for itemset in candidates for j in itemset}
+    }
+
+    counts = []
+    for itemset in candidates:
+        rows = columns[itemset[0]]
+        for j in itemset[1:]:
+            rows = np.intersect1d(rows, columns[j], assume_unique=True)
+        counts.append(len(rows))
+    return counts
+
+
+def partitions(basket, n_partitions):
+    bounds = np.linspace(0, basket.shape[0], n_partitions + 1).astype(int)
+    return [basket[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def mine_son(basket, min_support, max_len=None, n_jobs=None, n_partitions=None, progress=None):
+    """
+    SON two-pass mining: every partition is mined locally at the same
+    relative support (an itemset frequent overall is frequent in at least
+    one partition), then the union of local results is counted exactly
+    over all partitions. Each worker only ever holds its own slice.
+
+    Partitions are capped so the local threshold stays >= MIN_LOCAL_COUNT;
+    at a local count of 1 every subset of every basket is "frequent".
+
+    Partitions run on the scheduler's worker pool (utils/workers.py),
+    shared with the model fits instead of a pool of their own; mining
+    that already runs in one of its workers (a job) stays single-process.
+
+    progress(fraction) is called as each partition finishes a pass; when
+    it raises (e.g. a cancelled job), the partitions not started yet are
+    dropped and the exception propagates.
+    """
+    n_jobs = n_jobs or MAX_WORKERS
+    min_count = max(1, math.ceil(min_support * basket.shape[0]))
+    n_partitions = min(n_partitions or n_jobs, min_count // MIN_LOCAL_COUNT)
+    if n_partitions <= 1 or in_worker_process():
+        return mine_counts(basket, min_count, max_len, progress)
+
+    parts = partitions(basket, n_partitions)
+    pool = SCHEDULER.worker_pool()
+
+    def run_pass(func, args, start):
+        futures = [pool.submit(func, a) for a in args]
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                if progress is not None:
+                    progress(start + 0.5 * done / len(futures))
+            return [future.result() for future in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    try:
+        candidates = set()
+        for local in run_pass(mine_partition, [(part, min_support, max_len) for part in parts], 0.0):
+            candidates.update(local)
+
+        candidates = sorted(candidates)
+        totals = np.zeros(len(candidates), dtype=np.int64)
+        for counts in run_pass(count_partition, [(part, candidates) for part in parts], 0.5):
+            totals += counts
+    except BrokenProcessPool:
+        SCHEDULER.pool_broken(pool)
+        raise
+
+    return {
+        itemset: int(count)
+        for itemset, count in zip(candidates, totals) if count >= min_count
+    }
+
+
+# =============================================================================
+# FREQUENT ITEMSETS + RULES
+# =============================================================================
+def frequent_itemsets(basket, min_support, max_len=None, n_jobs=1, progress=None):
+    """
+    {tuple of column ids: count} for every itemset with support >= min_support.
+    n_jobs > 1 switches to SON partitioned counting over worker processes.
+    """
+    if n_jobs == 1:
+        min_count = max(1, math.ceil(min_support * basket.shape[0]))
+        return mine_counts(basket, min_count, max_len, progress)
+    return mine_son(basket, min_support, max_len, n_jobs=n_jobs, progress=progress)
+
+
+# Itemsets / rules handled between two progress() calls
+PROGRESS_EVERY = 10000
+
+
+def association_rules(itemset_counts, n_transactions, min_confidence, progress=None):
+    """
+    Rules A -> C for every frequent itemset split into two non-empty parts.
+    Subsets of a frequent itemset are frequent too, so every count needed
+    is already in itemset_counts.
+    """
+    rules = []
+    for done, (itemset, count) in enumerate(itemset_counts.items()):
+        if progress is not None and done % PROGRESS_EVERY == 0:
+            progress(done / len(itemset_counts))
+        if len(itemset) < 2:
+            continue
+
+        support = count / n_transactions
+        for size in range(1, len(itemset)):
+            for antecedent in subsets(itemset, size):
+                confidence = count / itemset_counts[antecedent]
+                if confidence < min_confidence:
+                    continue
+
+                consequent = tuple(j for j in itemset if j not in antecedent)
+                consequent_support = itemset_counts[consequent] / n_transactions
+                rules.append((antecedent, consequent, support, confidence, confidence / consequent_support))
+    return rules
+
+
+def subsets(itemset, size):
+    if size == 0:
+        yield ()
+        return
+    for i in range(len(itemset) - size + 1):
+        for rest in subsets(itemset[i + 1:], size - 1):
+            yield (itemset[i],) + rest
+
+
+def mine(df, min_support, min_confidence, max_len=None, n_jobs=1, progress=None):
+    """
+    Full pipeline: sparse basket -> frequent itemsets -> rules, returned as
+    records with item names (same layout as the apriori cache file).
+    progress(fraction) is called all along: itemsets, rules, then records.
+    """
+    def between(start, end):
+        if progress is None:
+            return None
+        return lambda fraction: progress(start + (end - start) * fraction)
+
+    basket, items = build_sparse_basket(df)
+    n = basket.shape[0]
+
+    counts = frequent_itemsets(basket, min_support, max_len=max_len, n_jobs=n_jobs, progress=between(0.0, 0.6))
+    rules = association_rules(counts, n, min_confidence, progress=between(0.6, 0.8))
+
+    records = []
+    report = between(0.8, 1.0)
+    for done, (a, c, support, confidence, lift) in enumerate(rules):
+        if report is not None and done % PROGRESS_EVERY == 0:
+            report(done / len(rules))
+        records.append({
+            "antecedents": items[list(a)].tolist(),
+            "consequents": items[list(c)].tolist(),
+            "support": support,
+            "confidence": confidence,
+            "lift": lift,
+        })
+
+    return {
+        "frequent_itemsets": [
+            {"support": count / n, "itemsets": items[list(itemset)].tolist()}
+            for itemset, count in counts.items()
+        ],
+        "rules": records,
+        "transactions": n,
+    }
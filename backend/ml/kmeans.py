@@ -1,41 +1,199 @@
-import pandas as pd
-from sklearn.cluster import KMeans
+import copy
+import itertools
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
 
+from utils.feature_store import get_customer_features
+from utils.metrics import timed
+from utils.model_registry import MODELS
 
-def prepare_customer_features(raw_df):
-    df = raw_df.dropna(subset=['CustomerID'])
+FEATURES = ["total_spend", "total_items", "total_orders"]
+MODES = ("full", "minibatch")
+BATCH_SIZE = 1024
+# Silhouette is quadratic in customers: scored on a sample beyond this
+SILHOUETTE_SAMPLE = 5000
+SWEEP_JOBS = 4
 
-    customer = df.groupby('CustomerID').agg(
-        total_spend=("Quantity", lambda x: (x * df.loc[x.index, "UnitPrice"]).sum()),
-        total_items=("Quantity", "sum"),
-        total_orders=("InvoiceNo", "nunique")
-    ).reset_index()
 
-    return customer
+# =============================================================================
+# FULL BATCH
+# =============================================================================
+@timed("kmeans.fit")
+def fit_kmeans(features, k):
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(features)
 
+    kmeans = KMeans(n_clusters=k, random_state=42)
+    kmeans.fit(scaled_features)
+    return scaler, kmeans
 
-def run_kmeans(df, k=3):
-    customer_df = prepare_customer_features(df)
 
-    features = customer_df[["total_spend", "total_items", "total_orders"]]
+# =============================================================================
+# MINI-BATCH (warm starts across k, absorbs new customers)
+# =============================================================================
+@timed("kmeans.fit_minibatch")
+def fit_minibatch(customer_df, k, below=None):
+    """
+    Mini-batch KMeans for k. Up to k = 2 it starts from k-means++; above,
+    from the centres of below (the k - 1 model) plus the customer farthest
+    from them, so a range of k costs little more than its largest member.
+    Returns (scaler, model, customer ids it was fitted on).
+    """
+    features = customer_df[FEATURES]
+    if k <= 2:
+        scaler = StandardScaler().fit(features)
+        X = scaler.transform(features)
+        init, n_init = "k-means++", 3
+    else:
+        scaler, previous, _ = below
+        X = scaler.transform(features)
+        farthest = previous.transform(X).min(axis=1).argmax()
+        init, n_init = np.vstack([previous.cluster_centers_, X[farthest]]), 1
 
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
+    # No random reassignment: small clusters here are the big spenders,
+    # moving their centres away loses them (and breaks the warm start)
+    model = MiniBatchKMeans(
+        n_clusters=k, init=init, n_init=n_init, batch_size=BATCH_SIZE,
+        reassignment_ratio=0, random_state=42
+    ).fit(X)
+    return scaler, model, customer_df["CustomerID"].to_numpy()
 
-    kmeans = KMeans(n_clusters=k, random_state=42)
-    customer_df["cluster"] = kmeans.fit_predict(scaled_features)
 
-    summary = []
-    for i in range(k):
-        group = customer_df[customer_df["cluster"] == i]
+def absorb_customers(customer_df, bundle):
+    """
+    The model of an earlier revision of the data, moved by partial_fit on
+    the customers it has not seen yet (no refit; the scaler is kept).
+    """
+    scaler, model, seen = bundle
+    # The saved model's arrays may be memory-mapped (read-only): copied
+    # once into plain arrays, which partial_fit updates in place; the
+    # memo keeps deepcopy from copying them again
+    arrays = {id(v): np.array(v) for v in vars(model).values() if isinstance(v, np.ndarray)}
+    model = copy.deepcopy(model, arrays)
+
+    ids = customer_df["CustomerID"].to_numpy()
+    new = ~np.isin(ids, seen)
+    X = scaler.transform(customer_df.loc[new, FEATURES])
+    for start in range(0, len(X), BATCH_SIZE):
+        model.partial_fit(X[start:start + BATCH_SIZE])
+
+    return scaler, model, np.union1d(seen, ids)
+
+
+def minibatch_model(customer_df, k):
+    """
+    The mini-batch model for k. The models of 2..k are looked up in order
+    and the missing ones fitted, each from the one below (no recursion).
+    """
+    bundle = None
+    for j in range(min(k, 2), k + 1):
+        below = bundle
+        bundle = MODELS.get_or_update(
+            "kmeans_minibatch", customer_df.attrs.get("data_version"), {"k": j},
+            lambda: fit_minibatch(customer_df, j, below),
+            lambda previous: absorb_customers(customer_df, previous),
+        )
+    return bundle
+
+
+# =============================================================================
+# SEGMENTATION
+# =============================================================================
+def cluster_labels(customer_df, k, mode="full"):
+    """
+    (labels, scaled features, model) of the customers for k clusters.
+    Models are fitted once per dataset version, k and mode (registry).
+    """
+    features = customer_df[FEATURES]
+    if mode == "minibatch":
+        scaler, model, _ = minibatch_model(customer_df, k)
+    else:
+        scaler, model = MODELS.get_or_fit(
+            "kmeans", customer_df.attrs.get("data_version"), {"k": k}, lambda: fit_kmeans(features, k)
+        )
+
+    X = scaler.transform(features)
+    return model.predict(X), X, model
+
 
-        summary.append({
+def cluster_summary(customer_df, labels, k):
+    # One groupby for every cluster instead of a filter per cluster
+    groups = customer_df[FEATURES].groupby(labels)
+    sizes = groups.size().reindex(range(k), fill_value=0)
+    # An empty cluster (possible after a mini-batch warm start) has no
+    # means; 0 instead of NaN, which JSON can't carry
+    means = groups.mean().round(2).reindex(range(k), fill_value=0.0)
+
+    return [
+        {
             "cluster_id": i,
-            "customers": len(group),
-            "avg_spend": round(group["total_spend"].mean(), 2),
-            "avg_items": round(group["total_items"].mean(), 2),
-            "avg_orders": round(group["total_orders"].mean(), 2),
-        })
+            "customers": n,
+            "avg_spend": spend,
+            "avg_items": items,
+            "avg_orders": orders,
+        }
+        for i, n, spend, items, orders in zip(range(k), sizes.tolist(), *(means[c].tolist() for c in FEATURES))
+    ]
+
+
+def run_kmeans(df, k=3, mode="full"):
+    return kmeans_segments(get_customer_features(df), k, mode)
+
+
+@timed("kmeans.segments")
+def kmeans_segments(customer_df, k=3, mode="full"):
+    """
+    Cluster summaries for a customer feature table (runs in a worker process).
+    """
+    labels, _, _ = cluster_labels(customer_df, k, mode)
+    return cluster_summary(customer_df, labels, k)
+
+
+# =============================================================================
+# K SWEEP
+# =============================================================================
+def score_k(customer_df, k, mode):
+    labels, X, model = cluster_labels(customer_df, k, mode)
+
+    silhouette = None
+    if 1 < len(np.unique(labels)) < len(X):
+        sample = SILHOUETTE_SAMPLE if len(X) > SILHOUETTE_SAMPLE else None
+        silhouette = float(silhouette_score(X, labels, sample_size=sample, random_state=42))
+
+    return float(-model.score(X)), silhouette
+
+
+@timed("kmeans.sweep")
+def kmeans_sweep(customer_df, k_min=2, k_max=10, mode="full", progress=None):
+    """
+    Inertia and silhouette curves for k = k_min .. k_max, fitted in one
+    parallel pass (threads; mini-batch fits follow their warm-start chain).
+    Every fit lands in the registry, so /customer-segmentation for any k of
+    the sweep answers without fitting again. progress(fraction) is called
+    as each k is scored; if it raises, the ks not started yet are skipped.
+    """
+    ks = list(range(max(k_min, 2), k_max + 1))
+    done = itertools.count(1)
+
+    def scored(k):
+        score = score_k(customer_df, k, mode)
+        if progress is not None:
+            progress(next(done) / len(ks))
+        return score
+
+    scores = Parallel(n_jobs=SWEEP_JOBS, prefer="threads")(delayed(scored)(k) for k in ks)
+
+    inertia = [round(i, 4) for i, _ in scores]
+    silhouette = [None if s is None else round(s, 4) for _, s in scores]
+    scored = [(s, k) for k, s in zip(ks, silhouette) if s is not None]
 
-    return summary
+    return {
+        "mode": mode,
+        "k": ks,
+        "inertia": inertia,
+        "silhouette": silhouette,
+        "best_k": max(scored)[1] if scored else None,
+    }
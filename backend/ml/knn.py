@@ -1,63 +1,54 @@
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.neighbors import NearestNeighbors
+from ml.ann import LSHIndex, N_PROBES
+from ml.catalogue import ProductCatalogue
+from utils.data_loader import data_version
+from utils.metrics import timed
+from utils.transactions import get_transaction_store
+from utils.model_registry import MODELS
 
-def build_knn(df):
-    products = df["Description"].astype(str).tolist()
+# Bump when the catalogue / index layout changes so old files are not reused
+INDEX_FORMAT = 2
 
-    vec = CountVectorizer()
-    sparse_matrix = vec.fit_transform(products)
 
-    # Use NearestNeighbors with cosine metric
-    # n_neighbors=20 is usually enough for top-k recommendations
-    model = NearestNeighbors(n_neighbors=20, metric='cosine', algorithm='brute')
-    model.fit(sparse_matrix)
+@timed("knn.fit")
+def fit_knn(df):
+    # Distinct descriptions in order of first appearance, from the store's dictionary
+    catalogue = ProductCatalogue.from_descriptions(get_transaction_store(df).products.astype(str))
+
+    from sklearn.feature_extraction.text import CountVectorizer   # deferred: keeps sklearn out of startup
+    vec = CountVectorizer()
+    sparse_matrix = vec.fit_transform(catalogue.names)
 
-    return products, model, sparse_matrix
+    return {"products": catalogue.names, "index": LSHIndex().fit(sparse_matrix)}
 
 
-def recommend(product_name, products, model, sparse_matrix, top_k=5):
-    if product_name not in products:
+def build_knn(df):
+    """
+    One row per distinct product (normalized description, not per
+    transaction line), indexed for approximate cosine search. The index is
+    kept in the model registry per dataset version, so a restart maps it
+    from cached/models/ instead of refitting.
+    """
+    stored = MODELS.get_or_fit("knn", data_version(df), {"format": INDEX_FORMAT}, lambda: fit_knn(df))
+    model = stored["index"]
+    return ProductCatalogue(stored["products"]), model, model.matrix
+
+
+def recommend(product_name, catalogue, model, top_k=5, n_probes=N_PROBES):
+    # O(1): hash lookup on the exact or normalized name
+    idx = catalogue.lookup(product_name)
+    if idx is None:
         return []
 
-    idx = products.index(product_name)
-    
-    # Get the vector for the query product
-    query_vec = sparse_matrix[idx]
-
-    # Find neighbors
-    # kneighbors returns (distances, indices)
-    # distance in cosine metric is 1 - similarity, so smaller is better.
-    # Fetch more candidates to account for duplicates
-    distances, indices = model.kneighbors(query_vec, n_neighbors=min(top_k * 5, len(products)))
-    
-    # Flatten results
-    distances = distances.flatten()
-    indices = indices.flatten()
+    # Candidates come from the LSH buckets of the product and are re-ranked
+    # by exact cosine similarity (1 = same words). Every row is a distinct
+    # product, so exactly top_k neighbours are fetched.
+    indices, similarities = model.query(idx, top_k, n_probes=n_probes)
 
     recommendations = []
-    seen = set()
-    seen.add(product_name)
-
-    # Skip the first one because it's the product itself (distance ~ 0)
-    # Iterate through more neighbors to find distinct ones
-    for i in range(1, len(indices)):
-        neighbor_idx = indices[i]
-        name = products[neighbor_idx]
-        
-        if name in seen:
-            continue
-        seen.add(name)
-
-        distance = distances[i]
-        similarity = 1 - distance  # Convert distance back to similarity for display
-
+    for neighbor_idx, similarity in zip(indices, similarities):
         recommendations.append({
-            "product": name,
+            "product": catalogue.names[neighbor_idx],
             "similarity": round(float(similarity), 3)
         })
-        
-        if len(recommendations) >= top_k:
-            break
 
     return recommendations
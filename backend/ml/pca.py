@@ -1,60 +1,211 @@
+import copy
+
+import numpy as np
 import pandas as pd
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from sklearn.preprocessing import StandardScaler
 
-def prepare_customer_features(raw_df):
+from utils.feature_store import feature_chunks, get_customer_features
+from utils.metrics import timed
+from utils.model_registry import MODELS
+from utils.serialization import records
+
+FEATURES = ["total_spend", "total_items", "total_orders"]
+# full:        exact SVD of the whole standardized matrix
+# randomized:  randomized SVD, for wide matrices (many customer features)
+# incremental: IncrementalPCA over chunks of the feature table, the scaled
+#              matrix is never materialized (the table itself is the
+#              feature store's); new customers are partial_fit
+MODES = ("full", "randomized", "incremental")
+# Components are refit once this share of the customers is new or changed
+# since they were fitted
+REFIT_SHARE = 0.1
+# Layout of the saved (scaler, pca, fitted rows, version) bundle
+BUNDLE_FORMAT = 2
+
+
+@timed("pca.fit")
+def fit_pca(features, n_components=2, svd_solver="auto"):
+    # Standardize the features
+    scaler = StandardScaler()
+    scaled_features = scaler.fit_transform(features)
+
+    # Apply PCA
+    pca = PCA(n_components=n_components, svd_solver=svd_solver, random_state=42)
+    pca.fit(scaled_features)
+    return scaler, pca
+
+
+@timed("pca.fit_incremental")
+def fit_incremental_pca(customer_df, n_components=2):
+    # Two passes over the chunks: feature means / variances, then components
+    scaler = StandardScaler()
+    for chunk in feature_chunks(customer_df, FEATURES):
+        scaler.partial_fit(chunk)
+
+    pca = IncrementalPCA(n_components=n_components)
+    for chunk in feature_chunks(customer_df, FEATURES, min_rows=n_components):
+        pca.partial_fit(scaler.transform(chunk))
+    return scaler, pca
+
+
+def fit_bundle(customer_df, n_components=2, mode="full"):
     """
-    Aggregates raw transaction data into customer-level features.
-    Same logic as in kmeans.py to ensure consistency.
+    (scaler, pca, fitted, version): fitted holds the CustomerID and
+    features of the rows the components saw (sorted by id), version the
+    data version they were fitted on.
     """
-    # Drop rows with missing CustomerID
-    df = raw_df.dropna(subset=['CustomerID'])
+    if mode == "incremental":
+        scaler, pca = fit_incremental_pca(customer_df, n_components)
+    else:
+        solver = "randomized" if mode == "randomized" else "auto"
+        scaler, pca = fit_pca(customer_df[FEATURES], n_components, solver)
+    return scaler, pca, fitted_rows(customer_df), customer_df.attrs.get("data_version")
 
-    # Aggregate by CustomerID
-    customer = df.groupby('CustomerID').agg(
-        total_spend=("Quantity", lambda x: (x * df.loc[x.index, "UnitPrice"]).sum()),
-        total_items=("Quantity", "sum"),
-        total_orders=("InvoiceNo", "nunique")
-    ).reset_index()
 
-    return customer
+def fitted_rows(customer_df):
+    rows = customer_df[["CustomerID"] + FEATURES].to_numpy(dtype="float64")
+    return rows[np.argsort(rows[:, 0], kind="stable")]
+
+
+def stale_rows(customer_df, fitted):
+    """
+    Masks over customer_df: customers the components have not seen, and
+    customers whose features changed since.
+    """
+    ids = customer_df["CustomerID"].to_numpy(dtype="float64")
+    pos = np.minimum(np.searchsorted(fitted[:, 0], ids), len(fitted) - 1)
+    known = fitted[pos, 0] == ids
+    changed = known & (customer_df[FEATURES].to_numpy(dtype="float64") != fitted[pos, 1:]).any(axis=1)
+    return ~known, changed
+
+
+def update_bundle(customer_df, bundle, n_components=2, mode="full"):
+    """
+    The bundle of an earlier revision of the data, carried to this one.
+    IncrementalPCA is partial_fit on the new customers (the scaler is
+    kept); the other modes keep their components. Either way they are
+    refit once REFIT_SHARE of the customers are new or changed.
+    """
+    scaler, pca, fitted, version = bundle
+    new, changed = stale_rows(customer_df, fitted)
+
+    if mode == "incremental" and new.sum() >= n_components:
+        # As in kmeans.absorb_customers: the saved arrays may be
+        # memory-mapped (read-only), copied once for partial_fit
+        arrays = {id(v): np.array(v) for v in vars(pca).values() if isinstance(v, np.ndarray)}
+        pca = copy.deepcopy(pca, arrays)
+        added = customer_df.loc[new]
+        for chunk in feature_chunks(added, FEATURES, min_rows=n_components):
+            pca.partial_fit(scaler.transform(chunk))
+        fitted = np.concatenate([fitted, fitted_rows(added)])
+        fitted = fitted[np.argsort(fitted[:, 0], kind="stable")]
+        new[:] = False
+
+    if (new | changed).sum() >= REFIT_SHARE * len(customer_df):
+        return fit_bundle(customer_df, n_components, mode)
+    return scaler, pca, fitted, version
+
+
+def pca_model(customer_df, n_components=2, mode="full"):
+    """
+    (scaler, pca, fitted, version) for the customer table, fitted once per
+    dataset version. A new ingested revision updates the bundle of the
+    previous one (update_bundle) instead of fitting from scratch.
+    """
+    name = "pca" if mode == "full" else f"pca_{mode}"
+    return MODELS.get_or_update(
+        name, customer_df.attrs.get("data_version"),
+        {"n_components": n_components, "format": BUNDLE_FORMAT},
+        lambda: fit_bundle(customer_df, n_components, mode),
+        lambda previous: update_bundle(customer_df, previous, n_components, mode),
+    )
+
 
-def run_pca(df, n_components=2):
+def components_info(customer_df, bundle):
+    """
+    How current the components are: the data version they were fitted on
+    and the customers new or changed since (not in the fit).
+    """
+    _, _, fitted, version = bundle
+    new, changed = stale_rows(customer_df, fitted)
+    return {"fitted_on": version, "stale_customers": int((new | changed).sum())}
+
+
+def project(scaler, pca, features, chunked=False):
+    if not chunked:
+        return pca.transform(scaler.transform(features))
+    return np.vstack([
+        pca.transform(scaler.transform(chunk)) for chunk in feature_chunks(features, FEATURES)
+    ])
+
+
+def run_pca(df, n_components=2, mode="full"):
     """
     Runs PCA on customer data to reduce dimensions for visualization.
     Returns a list of dictionaries containing customer ID, original metrics, and PCA coordinates.
     """
-    customer_df = prepare_customer_features(df)
-    
-    # Select features for PCA
-    features = customer_df[["total_spend", "total_items", "total_orders"]]
-    
-    # Standardize the features
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
-    
-    # Apply PCA
-    pca = PCA(n_components=n_components, random_state=42)
-    pca_result = pca.fit_transform(scaled_features)
-    
-    # Add PCA coordinates to the dataframe
-    customer_df['x'] = pca_result[:, 0]
-    customer_df['y'] = pca_result[:, 1]
-    
-    # Convert to list of dictionaries for JSON response
+    return pca_projection(get_customer_features(df), n_components, mode)
+
+
+def pca_projection(customer_df, n_components=2, mode="full"):
+    """
+    PCA of a customer feature table, as the /pca-visualization document.
+    """
+    envelope, columns = pca_table(customer_df, n_components, mode)
+    return {**envelope, "data": records(columns)}
+
+
+@timed("pca.table")
+def pca_table(customer_df, n_components=2, mode="full"):
+    """
+    PCA of a customer feature table (runs in a worker process).
+    Returns the envelope (explained variance ratios, and in "components"
+    the version they were fitted on and the customers they haven't seen
+    as they are now) and the per-customer output as columns ({field:
+    NumPy array}), converted whole-column instead of per row.
+    """
+    bundle = pca_model(customer_df, n_components, mode)
+    scaler, pca = bundle[:2]
+    if mode == "incremental":
+        pca_result = project(scaler, pca, customer_df, chunked=True)
+    else:
+        pca_result = project(scaler, pca, customer_df[FEATURES])
+
     # Rounding float values for cleaner output
-    results = []
-    for _, row in customer_df.iterrows():
-        results.append({
-            "customer_id": int(row["CustomerID"]),
-            "total_spend": round(row["total_spend"], 2),
-            "total_items": int(row["total_items"]),
-            "total_orders": int(row["total_orders"]),
-            "x": round(row["x"], 4),
-            "y": round(row["y"], 4)
-        })
-        
-    return {
+    columns = {
+        "customer_id": customer_df["CustomerID"].to_numpy().astype("int64"),
+        "total_spend": customer_df["total_spend"].to_numpy().round(2),
+        "total_items": customer_df["total_items"].to_numpy().astype("int64"),
+        "total_orders": customer_df["total_orders"].to_numpy().astype("int64"),
+        "x": pca_result[:, 0].round(4),
+        "y": pca_result[:, 1].round(4),
+    }
+
+    envelope = {
         "explained_variance": pca.explained_variance_ratio_.tolist(),
-        "data": results
+        "components": components_info(customer_df, bundle),
+    }
+    return envelope, columns
+
+
+@timed("pca.project")
+def project_customers(customer_df, rows, n_components=2, mode="full"):
+    """
+    x / y of customers given as feature dicts (total_spend, total_items,
+    total_orders), with the components saved for the current data: no
+    refit. "components" tells how current they are (see pca_table).
+    Raises ValueError when a feature is missing.
+    """
+    features = pd.DataFrame(rows)
+    missing = [col for col in FEATURES if col not in features.columns]
+    if missing:
+        raise ValueError(f"Missing features: {', '.join(missing)}")
+
+    bundle = pca_model(customer_df, n_components, mode)
+    pca_result = project(bundle[0], bundle[1], features[FEATURES].astype("float64"))
+    return {
+        "x": pca_result[:, 0].round(4).tolist(),
+        "y": pca_result[:, 1].round(4).tolist(),
+        "components": components_info(customer_df, bundle),
     }
@@ -0,0 +1,207 @@
+import gzip
+import heapq
+import json
+import numpy as np
+
+from utils.data_loader import file_hash
+from utils.metrics import timed
+from utils.model_registry import MODELS
+
+# Bump when the index layout changes so saved copies are not reused
+RULES_FORMAT = 1
+
+
+def itemset_key(item_ids):
+    # FNV-1a over the (sorted) item ids, as a uint64
+    h = 0xCBF29CE484222325
+    for item in item_ids:
+        h = ((h ^ (item + 1)) * 0x100000001B3) & 0xFFFFFFFFFFFFFFFF
+    return h
+
+
+# =============================================================================
+# ITEMSET INDEX
+# =============================================================================
+class RuleIndex:
+    """
+    Frequent itemsets (mined once, at the lowest support we care about)
+    indexed by item and by support, so association rules for any
+    antecedent / consequent / threshold combination are derived on demand
+    instead of re-mining.
+
+    support(A -> C) = support(A ∪ C)
+    confidence      = support(A ∪ C) / support(A)
+    lift            = confidence / support(C)
+    """
+
+    def __init__(self, frequent_itemsets):
+        item_ids = {}
+        records = sorted(frequent_itemsets, key=lambda r: r["support"], reverse=True)
+        itemsets = [
+            sorted(item_ids.setdefault(name, len(item_ids)) for name in record["itemsets"])
+            for record in records
+        ]
+
+        # Plain arrays only (no dicts / lists of tuples), so a saved index is
+        # memory-mapped on load and shared by every process reading it
+        self.items = np.array(list(item_ids), dtype=str)
+        self.item_order = np.argsort(self.items, kind="stable")
+        self.supports = np.array([r["support"] for r in records], dtype=np.float64)
+        self.set_items = np.array([i for itemset in itemsets for i in itemset], dtype=np.int64)
+        self.set_offsets = np.concatenate([[0], np.cumsum([len(itemset) for itemset in itemsets])]).astype(np.int64)
+
+        # item id -> ids of the itemsets holding it, in descending support
+        owners = np.repeat(np.arange(len(itemsets)), np.diff(self.set_offsets))
+        by_item = np.argsort(self.set_items, kind="stable")
+        self.post_sets = owners[by_item]
+        self.post_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.set_items, minlength=len(self.items)))]).astype(np.int64)
+
+        # Itemset -> id through sorted hashes of the item ids
+        keys = np.array([itemset_key(itemset) for itemset in itemsets], dtype=np.uint64)
+        self.key_sets = np.argsort(keys, kind="stable")
+        self.keys = keys[self.key_sets]
+
+        self.n_itemsets = len(itemsets)
+        self.min_support = float(self.supports.min()) if len(self.supports) else 0.0
+
+    def item_id(self, name):
+        pos = np.searchsorted(self.items, name, sorter=self.item_order)
+        if pos < len(self.items) and self.items[self.item_order[pos]] == name:
+            return int(self.item_order[pos])
+        return None
+
+    def itemset(self, set_id):
+        return tuple(self.set_items[self.set_offsets[set_id]:self.set_offsets[set_id + 1]].tolist())
+
+    def postings(self, item):
+        return self.post_sets[self.post_offsets[item]:self.post_offsets[item + 1]]
+
+    def support_of(self, itemset):
+        key = itemset_key(itemset)
+        pos = np.searchsorted(self.keys, np.uint64(key))
+        while pos < len(self.keys) and self.keys[pos] == key:
+            set_id = self.key_sets[pos]
+            if self.itemset(set_id) == itemset:
+                return self.supports[set_id]
+            pos += 1
+        raise KeyError(itemset)
+
+    def containing(self, items, min_support):
+        """
+        Ids of itemsets holding every item in `items` with support >=
+        min_support, walking the shortest posting list only.
+        """
+        shortest = min((self.postings(i) for i in items), key=len)
+        # Postings are in descending support: cut at the threshold
+        shortest = shortest[self.supports[shortest] >= min_support]
+        wanted = set(items)
+        return [s for s in shortest.tolist() if wanted.issubset(self.itemset(s))]
+
+    def splits(self, itemset, antecedent, consequent):
+        """
+        The (A, C) splits of an itemset compatible with the query.
+        """
+        if antecedent is not None and consequent is not None:
+            # The two sides must partition the itemset exactly
+            if set(antecedent).isdisjoint(consequent) and set(antecedent) | set(consequent) == set(itemset):
+                return [(antecedent, consequent)]
+            return []
+        if antecedent is not None:
+            rest = tuple(i for i in itemset if i not in antecedent)
+            return [(antecedent, rest)] if rest else []
+        if consequent is not None:
+            rest = tuple(i for i in itemset if i not in consequent)
+            return [(rest, consequent)] if rest else []
+
+        out = []
+        n = len(itemset)
+        for mask in range(1, (1 << n) - 1):
+            a = tuple(itemset[i] for i in range(n) if mask >> i & 1)
+            c = tuple(itemset[i] for i in range(n) if not mask >> i & 1)
+            out.append((a, c))
+        return out
+
+    def rules(self, antecedent=None, consequent=None, min_support=0.0,
+              min_confidence=0.0, min_lift=0.0, top_k=20, sort_by="lift"):
+        """
+        Top-k rules matching the query. antecedent / consequent are lists of
+        item names the rule side must equal exactly (repeated names count
+        once); unknown items, or an item on both sides, give [].
+        """
+        query = {}
+        for side, names in (("antecedent", antecedent), ("consequent", consequent)):
+            if names:
+                ids = [self.item_id(name) for name in names]
+                if None in ids:
+                    return []
+                query[side] = tuple(sorted(set(ids)))
+
+        if not set(query.get("antecedent", ())).isdisjoint(query.get("consequent", ())):
+            return []
+
+        fixed = query.get("antecedent", ()) + query.get("consequent", ())
+        if fixed:
+            candidates = self.containing(fixed, min_support)
+        else:
+            candidates = np.flatnonzero(self.supports >= min_support).tolist()
+
+        found = []
+        for set_id in candidates:
+            itemset = self.itemset(set_id)
+            if len(itemset) < 2:
+                continue
+            support = self.supports[set_id]
+
+            for a, c in self.splits(itemset, query.get("antecedent"), query.get("consequent")):
+                confidence = support / self.support_of(a)
+                if confidence < min_confidence:
+                    continue
+                lift = confidence / self.support_of(c)
+                if lift < min_lift:
+                    continue
+                found.append((a, c, support, confidence, lift))
+
+        key = {"support": 2, "confidence": 3, "lift": 4}[sort_by]
+        top = heapq.nlargest(top_k, found, key=lambda r: r[key])
+
+        return [
+            {
+                "antecedents": [str(self.items[i]) for i in a],
+                "consequents": [str(self.items[i]) for i in c],
+                "support": float(support),
+                "confidence": float(confidence),
+                "lift": float(lift),
+            }
+            for a, c, support, confidence, lift in top
+        ]
+
+    def itemsets_with(self, name, min_support=0.0, top_k=20):
+        item = self.item_id(name)
+        if item is None:
+            return []
+
+        return [
+            {"support": float(self.supports[s]), "itemsets": [str(self.items[i]) for i in self.itemset(s)]}
+            for s in self.containing((item,), min_support)[:top_k]
+        ]
+
+
+# =============================================================================
+# LOADING
+# =============================================================================
+def read_output(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@timed("apriori.rule_index")
+def load_rule_index(path):
+    """
+    The RuleIndex of a saved apriori output, from its binary copy in the
+    model registry (memory-mapped, keyed by a hash of the file). The JSON
+    is only parsed when no copy exists yet, e.g. after a new mba run.
+    """
+    return MODELS.get_or_fit(
+        "rule_index", file_hash(path)[:16], {"format": RULES_FORMAT},
+        lambda: RuleIndex(read_output(path)["frequent_itemsets"])
+    )
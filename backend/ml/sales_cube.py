@@ -0,0 +1,392 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import WEEKDAYS, add_derived_columns
+from utils.metrics import timed
+
+MEASURES = ("quantity", "revenue", "lines")
+GRANULARITIES = ("total", "hour", "weekday", "day", "week", "month", "country")
+UNKNOWN_COUNTRY = "Unknown"
+
+# Product entries are keyed product | day | hour | country in one int64
+COUNTRY_BITS = 10
+HOUR_BITS = 5
+DAY_BITS = 20
+CELL_BITS = COUNTRY_BITS + HOUR_BITS + DAY_BITS
+
+
+def cube_lines(df):
+    """
+    Day (days since 1970-01-01), hour and the three measures of every line
+    as plain arrays, country and product as the frame's columns.
+    """
+    if "Hour" not in df.columns:
+        df = add_derived_columns(df)
+
+    if "Country" in df.columns:
+        country = df["Country"]
+    else:
+        country = pd.Series(UNKNOWN_COUNTRY, index=df.index, dtype=object)
+
+    return {
+        "day": df["InvoiceDate"].to_numpy().astype("datetime64[D]").astype(np.int64),
+        "hour": df["Hour"].to_numpy().astype(np.int64),
+        "country": country,
+        "product": df["Description"],
+        "values": np.column_stack([
+            df["Quantity"].to_numpy(dtype=np.float64),
+            df["Amount"].to_numpy(dtype=np.float64),
+            np.ones(len(df)),
+        ]),
+    }
+
+
+def weekday_of(days):
+    # 1970-01-01 was a Thursday (Monday = 0)
+    return (days + 3) % 7
+
+
+def day_label(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+def parse_day(value):
+    return int(np.datetime64(pd.Timestamp(value).date(), "D").astype(np.int64))
+
+
+def register(values, ids, names):
+    """
+    Codes of the values (a Series, categorical or not), new names getting
+    the next free code; missing values are -1. Hashes each distinct value
+    once instead of sorting fixed-width copies of every string.
+    """
+    inverse, uniques = pd.factorize(values)
+    codes = np.empty(len(uniques) + 1, dtype=np.int64)
+    codes[-1] = -1
+    for i, name in enumerate(uniques.astype(str).tolist()):
+        code = ids.get(name)
+        if code is None:
+            code = len(names)
+            ids[name] = code
+            names.append(name)
+        codes[i] = code
+    return codes[inverse]
+
+
+# =============================================================================
+# SALES CUBE
+# =============================================================================
+class SalesCube:
+    """
+    Quantity / revenue / lines by day x hour x country, kept as prefix sums
+    over days (dense NumPy arrays, measures on the last axis):
+
+      cum_hour[d, h, c]      totals of the days before d, per hour and country
+      cum_weekday[d, w, c]   the same per weekday
+      cum_day[d, c]          the same over all hours
+
+    so a date range costs two lookups whatever the size of the data.
+    Per product the cube is sparse: sorted (product, day, hour, country)
+    keys with their measures, one binary search per product query.
+    New lines are added in place, without a rescan.
+    """
+
+    @timed("sales_cube.build")
+    def __init__(self, df):
+        self.lock = threading.Lock()
+        self.countries = []
+        self.country_ids = {}
+        self.products = []
+        self.product_ids = {}
+
+        self.first_day = None
+        self.n_days = 0
+        self.cum_hour = np.zeros((1, 24, 0, len(MEASURES)))
+        self.cum_weekday = np.zeros((1, 7, 0, len(MEASURES)))
+        self.cum_day = np.zeros((1, 0, len(MEASURES)))
+
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty((0, len(MEASURES)))
+        self.pending = []   # product entries not merged into keys / values yet
+
+        self.add_lines(cube_lines(df))
+
+    # -------------------------------------------------------------------------
+    # UPDATES
+    # -------------------------------------------------------------------------
+    def grow(self, first_day, last_day, n_countries):
+        """
+        Make room for first_day .. last_day and n_countries. Prefix sums stay
+        valid: days before the cube add zero rows in front, days after it
+        repeat the last row, new countries start at zero.
+        """
+        if self.first_day is None:
+            self.first_day = first_day
+
+        before = max(self.first_day - first_day, 0)
+        after = max(last_day - (self.first_day + self.n_days - 1), 0)
+        missing = n_countries - self.cum_day.shape[1]
+
+        def extend(cum, country_axis):
+            if before:
+                cum = np.concatenate([np.zeros((before,) + cum.shape[1:]), cum])
+            if after:
+                cum = np.concatenate([cum, np.repeat(cum[-1:], after, axis=0)])
+            if missing > 0:
+                shape = list(cum.shape)
+                shape[country_axis] = missing
+                cum = np.concatenate([cum, np.zeros(shape)], axis=country_axis)
+            return cum
+
+        self.cum_hour = extend(self.cum_hour, 2)
+        self.cum_weekday = extend(self.cum_weekday, 2)
+        self.cum_day = extend(self.cum_day, 1)
+        self.first_day -= before
+        self.n_days += before + after
+
+    def add_lines(self, lines):
+        if len(lines["day"]) == 0:
+            return
+
+        days, hours, values = lines["day"], lines["hour"], lines["values"]
+        countries = register(lines["country"], self.country_ids, self.countries)
+        if (countries < 0).any():
+            countries[countries < 0] = register(pd.Series([UNKNOWN_COUNTRY]), self.country_ids, self.countries)[0]
+        if len(self.countries) > 1 << COUNTRY_BITS:
+            raise ValueError("Too many countries for the sales cube")
+        self.grow(int(days.min()), int(days.max()), len(self.countries))
+
+        # Totals of the touched days (first .. last) in one bincount, their
+        # running sum added to the prefix rows inside the range and the range
+        # total to every row after it: cost is the range, not the history
+        n_countries = len(self.countries)
+        first = int(days.min()) - self.first_day
+        n_range = int(days.max()) - self.first_day - first + 1
+        cells = ((days - self.first_day - first) * 24 + hours) * n_countries + countries
+        delta = np.stack([
+            np.bincount(cells, weights=values[:, m], minlength=n_range * 24 * n_countries)
+            for m in range(len(MEASURES))
+        ], axis=-1).reshape(n_range, 24, n_countries, len(MEASURES))
+
+        weekdays = weekday_of(np.arange(n_range) + self.first_day + first)
+        by_weekday = np.zeros((n_range, 7, n_countries, len(MEASURES)))
+        by_weekday[np.arange(n_range), weekdays] = delta.sum(axis=1)
+
+        for cum, part in ((self.cum_hour, delta), (self.cum_weekday, by_weekday), (self.cum_day, delta.sum(axis=1))):
+            running = part.cumsum(axis=0)
+            cum[first + 1:first + n_range + 1] += running
+            cum[first + n_range + 1:] += running[-1]
+
+        products = register(lines["product"], self.product_ids, self.products)
+        known = products >= 0
+        if known.any():
+            keys = (
+                (products[known] << CELL_BITS) | (days[known] << (COUNTRY_BITS + HOUR_BITS))
+                | (hours[known] << COUNTRY_BITS) | countries[known]
+            )
+            self.pending.append((keys, values[known]))
+
+    @timed("sales_cube.add")
+    def add(self, df):
+        with self.lock:
+            self.add_lines(cube_lines(df))
+
+    def merge_pending(self):
+        # Sorted unique keys with summed measures; done lazily before a product query
+        if not self.pending:
+            return
+        keys = np.concatenate([self.keys, *(k for k, _ in self.pending)])
+        values = np.concatenate([self.values, *(v for _, v in self.pending)])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.values = np.stack([
+            np.bincount(inverse, weights=values[:, m], minlength=len(self.keys))
+            for m in range(len(MEASURES))
+        ], axis=-1)
+        self.pending = []
+
+    # -------------------------------------------------------------------------
+    # QUERIES
+    # -------------------------------------------------------------------------
+    def day_range(self, start, end):
+        # Cube rows [d0, d1) for the inclusive dates start .. end
+        d0 = 0 if start is None else parse_day(start) - self.first_day
+        d1 = self.n_days if end is None else parse_day(end) - self.first_day + 1
+        d0 = min(max(d0, 0), self.n_days)
+        return d0, min(max(d1, d0), self.n_days)
+
+    def country_codes(self, country):
+        if country is None:
+            # By name, whatever order the countries arrived in
+            return sorted(range(len(self.countries)), key=self.countries.__getitem__)
+        code = self.country_ids.get(country)
+        if code is None:
+            raise ValueError(f"Unknown country: {country}")
+        return [code]
+
+    def day_edges(self, d0, d1, granularity):
+        # Bucket boundaries (cube rows) of day / week (Monday) / month buckets
+        days = np.arange(d0, d1)
+        absolute = days + self.first_day
+        if granularity == "week":
+            starts = days[weekday_of(absolute) == 0]
+        elif granularity == "month":
+            months = absolute.astype("datetime64[D]").astype("datetime64[M]")
+            starts = days[months != (absolute - 1).astype("datetime64[D]").astype("datetime64[M]")]
+        else:
+            starts = days
+        return np.unique(np.concatenate([[d0], starts, [d1]]).astype(np.int64))
+
+    def query(self, start=None, end=None, country=None, product=None, granularity="hour", measure="revenue"):
+        """
+        The measure per granularity bucket for the lines dated start .. end
+        (inclusive), optionally of one country and / or one product.
+        Raises ValueError for an unknown granularity, measure, country or product.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if measure not in MEASURES:
+            raise ValueError(f"measure must be one of {', '.join(MEASURES)}")
+        m = MEASURES.index(measure)
+
+        with self.lock:
+            d0, d1 = self.day_range(start, end)
+            countries = self.country_codes(country)
+            if product is None:
+                buckets, values = self.dense_query(d0, d1, countries, granularity, m)
+            else:
+                buckets, values = self.product_query(product, d0, d1, countries, granularity, m)
+            span = (day_label(self.first_day + d0), day_label(self.first_day + d1 - 1)) if d1 > d0 else (None, None)
+
+        values = np.asarray(values, dtype=np.float64)
+        values = values.round(2).tolist() if measure == "revenue" else values.round().astype(np.int64).tolist()
+
+        return {
+            "start": span[0],
+            "end": span[1],
+            "granularity": granularity,
+            "measure": measure,
+            "buckets": buckets,
+            "values": values,
+        }
+
+    def dense_query(self, d0, d1, countries, granularity, m):
+        if granularity == "weekday":
+            window = self.cum_weekday[d1][:, countries, m] - self.cum_weekday[d0][:, countries, m]
+            return list(WEEKDAYS), window.sum(axis=1)
+
+        if granularity in ("total", "hour", "country"):
+            window = self.cum_hour[d1][:, countries, m] - self.cum_hour[d0][:, countries, m]
+            if granularity == "total":
+                return ["total"], [window.sum()]
+            if granularity == "hour":
+                return list(range(24)), window.sum(axis=1)
+            return [self.countries[c] for c in countries], window.sum(axis=0)
+
+        edges = self.day_edges(d0, d1, granularity)
+        totals = self.cum_day[edges][:, countries, m].sum(axis=1)
+        return [day_label(self.first_day + d) for d in edges[:-1].tolist()], np.diff(totals)
+
+    def product_query(self, product, d0, d1, countries, granularity, m):
+        code = self.product_ids.get(product)
+        if code is None:
+            raise ValueError(f"Unknown product: {product}")
+        self.merge_pending()
+
+        # Only the entries of this product: cost is its own cell count
+        lo, hi = np.searchsorted(self.keys, [code << CELL_BITS, (code + 1) << CELL_BITS])
+        keys, values = self.keys[lo:hi], self.values[lo:hi, m]
+        country = keys & ((1 << COUNTRY_BITS) - 1)
+        hour = (keys >> COUNTRY_BITS) & ((1 << HOUR_BITS) - 1)
+        day = ((keys >> (COUNTRY_BITS + HOUR_BITS)) & ((1 << DAY_BITS) - 1)) - self.first_day
+
+        keep = (day >= d0) & (day < d1) & np.isin(country, countries)
+        country, hour, day, values = country[keep], hour[keep], day[keep], values[keep]
+
+        if granularity == "total":
+            return ["total"], [values.sum()]
+        if granularity == "hour":
+            return list(range(24)), np.bincount(hour, weights=values, minlength=24)
+        if granularity == "weekday":
+            return list(WEEKDAYS), np.bincount(weekday_of(day + self.first_day), weights=values, minlength=7)
+        if granularity == "country":
+            sums = np.bincount(country, weights=values, minlength=len(self.countries))
+            return [self.countries[c] for c in countries], sums[countries]
+
+        edges = self.day_edges(d0, d1, granularity)
+        bucket = np.searchsorted(edges, day, side="right") - 1
+        return (
+            [day_label(self.first_day + d) for d in edges[:-1].tolist()],
+            np.bincount(bucket, weights=values, minlength=len(edges) - 1),
+        )
+
+    # -------------------------------------------------------------------------
+    # SERIES (forecasting)
+    # -------------------------------------------------------------------------
+    def daily_matrix(self, by="product", measure="quantity"):
+        """
+        (series names, first day label, matrix of series x days) of the
+        measure per product or country, every day of the cube included.
+        """
+        m = MEASURES.index(measure)
+        with self.lock:
+            if by == "country":
+                order = self.country_codes(None)
+                matrix = np.diff(self.cum_day[:, order, m], axis=0).T
+                return [self.countries[c] for c in order], day_label(self.first_day), matrix
+
+            self.merge_pending()
+            product = self.keys >> CELL_BITS
+            day = ((self.keys >> (COUNTRY_BITS + HOUR_BITS)) & ((1 << DAY_BITS) - 1)) - self.first_day
+            matrix = np.bincount(
+                product * self.n_days + day, weights=self.values[:, m],
+                minlength=len(self.products) * self.n_days
+            ).reshape(len(self.products), self.n_days)
+            return list(self.products), day_label(self.first_day), matrix
+
+    def hour_profile(self, by="product", measure="quantity"):
+        """
+        Share of each hour of day in the measure, per product or country
+        (rows in the order of daily_matrix, zeros for series without sales).
+        """
+        m = MEASURES.index(measure)
+        with self.lock:
+            if by == "country":
+                hours = (self.cum_hour[-1] - self.cum_hour[0])[:, self.country_codes(None), m].T
+            else:
+                self.merge_pending()
+                hour = (self.keys >> COUNTRY_BITS) & ((1 << HOUR_BITS) - 1)
+                hours = np.bincount(
+                    (self.keys >> CELL_BITS) * 24 + hour, weights=self.values[:, m],
+                    minlength=len(self.products) * 24
+                ).reshape(len(self.products), 24)
+
+        totals = hours.sum(axis=1, keepdims=True)
+        return np.divide(hours, totals, out=np.zeros_like(hours), where=totals != 0)
+
+    def counters(self):
+        """
+        Whole-range hour / weekday counters in the shape of
+        ml.timeseries.sales_counters (for the peak-sales summary).
+        """
+        with self.lock:
+            hour = (self.cum_hour[-1] - self.cum_hour[0]).sum(axis=1)
+            weekday = (self.cum_weekday[-1] - self.cum_weekday[0]).sum(axis=1)
+        return {
+            "hour_qty": hour[:, 0].round().astype("int64"),
+            "hour_lines": hour[:, 2].round().astype("int64"),
+            "weekday_qty": weekday[:, 0].round().astype("int64"),
+            "weekday_lines": weekday[:, 2].round().astype("int64"),
+        }
+
+    def status(self):
+        with self.lock:
+            return {
+                "start": day_label(self.first_day) if self.n_days else None,
+                "end": day_label(self.first_day + self.n_days - 1) if self.n_days else None,
+                "days": self.n_days,
+                "countries": len(self.countries),
+                "products": len(self.products),
+                "product_cells": len(self.keys) + sum(len(k) for k, _ in self.pending),
+                "dense_bytes": self.cum_hour.nbytes + self.cum_weekday.nbytes + self.cum_day.nbytes,
+            }
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import numpy as np
+
+from ml.knn import INDEX_FORMAT
+from utils.data_loader import CACHE_DIR
+from utils.workers import MAX_WORKERS, SCHEDULER
+
+TOP_K = 10
+# Largest page of /similar-products/all
+MAX_PAGE = 1000
+# Upper bound for one dense block of similarities (rows × catalogue × float32)
+MAX_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+# =============================================================================
+# BLOCKED ALL-PAIRS TOP-K
+# =============================================================================
+def top_k_block(matrix, bounds, k=TOP_K):
+    """
+    Top-k neighbours (self excluded) of rows [start, end) of the
+    L2-normalized matrix, via one sparse product.
+    """
+    start, end = bounds
+    sims = (matrix[start:end] @ matrix.T).toarray().astype(np.float32)
+    sims[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+    k = min(k, sims.shape[1] - 1)
+    if k <= 0:
+        return np.zeros((end - start, 0), dtype=np.int32), np.zeros((end - start, 0), dtype=np.float32)
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1, kind="stable")
+
+    return (
+        np.take_along_axis(top, order, axis=1).astype(np.int32),
+        np.take_along_axis(top_sims, order, axis=1),
+    )
+
+
+def top_k_blocks(args):
+    matrix, blocks, k = args
+    return [top_k_block(matrix, bounds, k) for bounds in blocks]
+
+
+def build_similarity_table(matrix, k=TOP_K, n_jobs=None):
+    """
+    (indices int32, similarities float32), both shaped (n_products, k).
+    Rows are processed in blocks sized to stay under MAX_BLOCK_BYTES,
+    split into n_jobs runs on the scheduler's worker pool (each run
+    receives the matrix once).
+    """
+    n = matrix.shape[0]
+    block_rows = max(1, MAX_BLOCK_BYTES // (4 * max(n, 1)))
+    blocks = [(start, min(start + block_rows, n)) for start in range(0, n, block_rows)]
+
+    n_jobs = min(n_jobs or MAX_WORKERS, len(blocks))
+    if n_jobs <= 1:
+        parts = top_k_blocks((matrix, blocks, k))
+    else:
+        runs = SCHEDULER.map(top_k_blocks, [(matrix, blocks[i::n_jobs], k) for i in range(n_jobs)])
+        # Run i holds blocks i, i + n_jobs, ...: back to row order
+        parts = [None] * len(blocks)
+        for i, run in enumerate(runs):
+            parts[i::n_jobs] = run
+
+    return (
+        np.concatenate([p[0] for p in parts]),
+        np.concatenate([p[1] for p in parts]),
+    )
+
+
+# =============================================================================
+# STORAGE (.npy, memory-mapped on load)
+# =============================================================================
+def table_dir(matrix, k=TOP_K):
+    """
+    Directory of the table built from matrix: named by a hash of the
+    matrix itself, since data versions ("+N" ingest revisions, frames
+    without one) don't identify the rows across processes.
+    """
+    digest = hashlib.sha1(f"{matrix.shape}:{k}".encode())
+    for part in (matrix.indptr, matrix.indices, matrix.data):
+        digest.update(np.ascontiguousarray(part).tobytes())
+    return os.path.join(CACHE_DIR, f"similarity_v{INDEX_FORMAT}_{digest.hexdigest()[:20]}")
+
+
+def load_or_build_table(matrix, k=TOP_K):
+    path = table_dir(matrix, k)
+    indices_path = os.path.join(path, "indices.npy")
+    sims_path = os.path.join(path, "similarities.npy")
+
+    if not os.path.exists(sims_path):
+        indices, sims = build_similarity_table(matrix, k)
+        os.makedirs(path, exist_ok=True)
+        # similarities.npy is written last and marks the table complete
+        np.save(indices_path, indices)
+        np.save(sims_path + ".tmp.npy", sims)
+        os.replace(sims_path + ".tmp.npy", sims_path)
+
+    return np.load(indices_path, mmap_mode="r"), np.load(sims_path, mmap_mode="r")
+
+
+def page(products, indices, sims, cursor=0, limit=50, top_k=5):
+    """
+    One page of the table: products[cursor:cursor + limit] (catalogue
+    names) with their top_k neighbours. Cost depends on the page size only.
+    Raises ValueError for a negative cursor or a limit below 1.
+    """
+    if cursor < 0 or limit < 1:
+        raise ValueError("cursor must be >= 0 and limit >= 1")
+    end = min(cursor + limit, len(products))
+    top_k = min(top_k, indices.shape[1])
+
+    result = {}
+    for row in range(cursor, end):
+        result[products[row]] = [
+            {"product": products[j], "similarity": round(float(s), 3)}
+            for j, s in zip(indices[row, :top_k], sims[row, :top_k]) if s > 0
+        ]
+
+    return {
+        "products": result,
+        "next_cursor": end if end < len(products) else None,
+        "total": len(products),
+    }
@@ -1,21 +1,51 @@
-import pandas as pd
+import numpy as np
+
+from utils.data_loader import WEEKDAYS, add_derived_columns
+from utils.metrics import timed
 
-def peak_sales_insights(df):
 
-    df["InvoiceDate"] = pd.to_datetime(df["InvoiceDate"])
+def sales_counters(df):
+    """
+    Quantity sold and number of lines per hour of day (24) and per weekday
+    (7, Monday first). Plain arrays, so new lines can be added in place.
+    """
+    if "Hour" not in df.columns:
+        df = add_derived_columns(df)
 
-    df["Hour"] = df["InvoiceDate"].dt.hour
-    df["Weekday"] = df["InvoiceDate"].dt.day_name()
+    hour = df["Hour"].to_numpy()
+    weekday = df["Weekday"].cat.codes.to_numpy()
+    quantity = df["Quantity"].to_numpy()
 
-    hour_sales = df.groupby("Hour")["Quantity"].sum()
-    day_sales = df.groupby("Weekday")["Quantity"].sum()
+    return {
+        "hour_qty": np.bincount(hour, weights=quantity, minlength=24).astype("int64"),
+        "hour_lines": np.bincount(hour, minlength=24),
+        "weekday_qty": np.bincount(weekday, weights=quantity, minlength=7).astype("int64"),
+        "weekday_lines": np.bincount(weekday, minlength=7),
+    }
 
-    best_hour = int(hour_sales.idxmax())
-    best_day = day_sales.idxmax()
+
+def summarize_peaks(counters):
+    # Only hours / days that actually have sales lines are reported
+    hour_sales = {
+        h: int(counters["hour_qty"][h])
+        for h in range(24) if counters["hour_lines"][h]
+    }
+    day_sales = {
+        WEEKDAYS[d]: int(counters["weekday_qty"][d])
+        for d in sorted(range(7), key=lambda d: WEEKDAYS[d]) if counters["weekday_lines"][d]
+    }
+
+    best_hour = max(hour_sales, key=hour_sales.get)
+    best_day = max(day_sales, key=day_sales.get)
 
     return {
         "best_hour": best_hour,
         "best_day": best_day,
-        "hourly_sales": hour_sales.to_dict(),
-        "weekday_sales": day_sales.to_dict()
+        "hourly_sales": hour_sales,
+        "weekday_sales": day_sales
     }
+
+
+@timed("timeseries.peak_sales")
+def peak_sales_insights(df):
+    return summarize_peaks(sales_counters(df))
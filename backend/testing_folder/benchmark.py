@@ -0,0 +1,322 @@
+"""
+Benchmarks of the data / ML paths on synthetic UCI-shaped data
+(testing_folder/synthetic_data.py), with JSON results to compare across
+commits. Run from backend/:
+
+    PYTHONPATH=. python testing_folder/benchmark.py --sizes 10k 100k
+    PYTHONPATH=. python testing_folder/benchmark.py --sizes 1m --stages loader kmeans pca
+    PYTHONPATH=. python testing_folder/benchmark.py --compare old.json new.json
+
+Every stage is timed (wall clock) and memory-profiled: a thread samples
+the resident set size while it runs, peak_mb is its peak growth over
+the size at the start of the stage (NumPy, pandas and Arrow buffers
+alike), rss_mb the peak itself. Sampling keeps the timings untouched,
+unlike tracemalloc.
+Synthetic frames carry no data version, so nothing is read from the
+model registry or the response cache: every stage really fits.
+10M rows need several GB of memory.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import generate_transactions
+
+from utils import data_loader
+from utils.data_loader import load_frame
+from utils.feature_store import compute_customer_features
+from ml.apriori import run_apriori
+from ml.knn import fit_knn, recommend
+from ml.catalogue import ProductCatalogue
+from ml.kmeans import kmeans_segments
+from ml.pca import pca_table
+from ml.decision_tree import spend_predictions
+from ml.timeseries import peak_sales_insights
+from ml.sales_cube import SalesCube
+from ml.forecast import forecast_matrix
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+RESULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+# Slower by more than this ratio (and by at least MIN_SECONDS) is a regression
+THRESHOLD = 1.25
+MIN_SECONDS = 0.05
+# Seconds between two resident size samples
+SAMPLE_INTERVAL = 0.005
+# FP-Growth support for the benchmark (the app default mines far deeper)
+MIN_SUPPORT = 0.01
+MIN_CONFIDENCE = 0.1
+
+
+# ---------------------------------------------------------
+# STAGES
+# ---------------------------------------------------------
+# Each stage is fn(state) -> a few numbers about its output; state holds
+# the generated CSV source and whatever earlier stages produced.
+
+def stage_loader(state):
+    # Cold: CSV parse + Arrow cache build; warm: memory-mapped reload
+    start = time.perf_counter()
+    load_frame(state["source"])
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    df = load_frame(state["source"])
+    warm = time.perf_counter() - start
+
+    # No version: models are fitted, not read from cached/models/
+    df.attrs.pop("data_version", None)
+    state["df"] = df
+    return {"rows": len(df), "cold_seconds": round(cold, 4), "warm_seconds": round(warm, 4)}
+
+
+def stage_features(state):
+    state["customer"] = compute_customer_features(state["df"])
+    return {"customers": len(state["customer"])}
+
+
+def stage_fpgrowth(state):
+    result = run_apriori(state["df"], MIN_SUPPORT, MIN_CONFIDENCE)
+    return {"rules": len(result["rules"])}
+
+
+def stage_knn(state):
+    model = fit_knn(state["df"])
+    catalogue = ProductCatalogue(model["products"])
+    hits = sum(len(recommend(name, catalogue, model["index"])) for name in model["products"][:100])
+    return {"products": len(model["products"]), "recommendations": hits}
+
+
+def stage_kmeans(state):
+    full = kmeans_segments(state["customer"], 3)
+    minibatch = kmeans_segments(state["customer"], 3, "minibatch")
+    return {"clusters": len(full), "minibatch_clusters": len(minibatch)}
+
+
+def stage_pca(state):
+    envelope, _ = pca_table(state["customer"])
+    return {"explained_variance": [round(v, 4) for v in envelope["explained_variance"]]}
+
+
+def stage_decision_tree(state):
+    return {"predictions": len(spend_predictions(state["customer"])["predicted_spend"])}
+
+
+def stage_timeseries(state):
+    peaks = peak_sales_insights(state["df"])
+    cube = SalesCube(state["df"])
+    cube.query(granularity="month")
+    _, _, daily = cube.daily_matrix("product")
+    forecast = forecast_matrix(daily, "ets", n_jobs=1)
+    return {"best_hour": peaks["best_hour"], "series": len(forecast)}
+
+
+STAGES = {
+    "loader": stage_loader,
+    "features": stage_features,
+    "fpgrowth": stage_fpgrowth,
+    "knn": stage_knn,
+    "kmeans": stage_kmeans,
+    "pca": stage_pca,
+    "decision_tree": stage_decision_tree,
+    "timeseries": stage_timeseries,
+}
+# Stages needing another one first
+REQUIRES = {"features": "loader", "fpgrowth": "loader", "knn": "loader", "timeseries": "loader",
+            "kmeans": "features", "pca": "features", "decision_tree": "features"}
+
+
+def with_requirements(stages):
+    needed = []
+    for stage in stages:
+        chain = []
+        while stage is not None:
+            chain.append(stage)
+            stage = REQUIRES.get(stage)
+        needed.extend(s for s in reversed(chain) if s not in needed)
+    return [s for s in STAGES if s in needed]
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No procfs: the peak so far is the best there is
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemorySampler:
+    """
+    Peak resident size of the process while the with-block runs.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stop = threading.Event()
+        self.start = self.peak = 0
+
+    def sample(self):
+        while not self.stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def measure(fn, state):
+    with MemorySampler() as memory:
+        start = time.perf_counter()
+        info = fn(state)
+        seconds = time.perf_counter() - start
+
+    return {
+        "seconds": round(seconds, 4),
+        "peak_mb": round((memory.peak - memory.start) / 2 ** 20, 2),
+        "rss_mb": round(memory.peak / 2 ** 20, 1),
+        "info": info,
+    }
+
+
+# ---------------------------------------------------------
+# RUN
+# ---------------------------------------------------------
+def run(sizes, stages, seed=42):
+    results = {}
+    cache_dir = data_loader.CACHE_DIR
+    tmp_dir = tempfile.mkdtemp(prefix="benchmark_")
+    # Arrow caches of the synthetic sources go to the temporary directory too
+    data_loader.CACHE_DIR = tmp_dir
+    try:
+        for label in sizes:
+            print(f"[INFO] {label}: generating {SIZES[label]} rows")
+            start = time.perf_counter()
+            source = os.path.join(tmp_dir, f"synthetic_{SIZES[label]}.csv")
+            generate_transactions(SIZES[label], seed).to_csv(source, index=False)
+            state = {"source": source}
+            results[label] = {"generate": {"seconds": round(time.perf_counter() - start, 4)}}
+
+            for stage in with_requirements(stages):
+                results[label][stage] = measure(STAGES[stage], state)
+                print(f"[INFO] {label} {stage}: {results[label][stage]['seconds']}s, "
+                      f"peak {results[label][stage]['peak_mb']} MB")
+    finally:
+        data_loader.CACHE_DIR = cache_dir
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "cpus": os.cpu_count(),
+        "machine": platform.machine(),
+    }
+
+
+# ---------------------------------------------------------
+# COMPARE
+# ---------------------------------------------------------
+def compare(old, new, threshold=THRESHOLD):
+    """
+    (size, stage, old seconds, new seconds, ratio) for every stage both
+    result files have, and the list of regressions among them.
+    """
+    rows = []
+    regressions = []
+    for size, stages in new["results"].items():
+        for stage, result in stages.items():
+            if stage == "generate":
+                continue
+            before = old["results"].get(size, {}).get(stage)
+            if before is None:
+                continue
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+            row = (size, stage, before["seconds"], result["seconds"], round(ratio, 2))
+            rows.append(row)
+            if ratio > threshold and result["seconds"] - before["seconds"] > MIN_SECONDS:
+                regressions.append(row)
+    return rows, regressions
+
+
+def print_comparison(old, new, threshold=THRESHOLD):
+    rows, regressions = compare(old, new, threshold)
+    print(f"{'size':<6} {'stage':<14} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10}  ratio")
+    for size, stage, before, after, ratio in rows:
+        flag = "  <-- slower" if (size, stage, before, after, ratio) in regressions else ""
+        print(f"{size:<6} {stage:<14} {before:>10.4f} {after:>10.4f}  {ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k"], choices=list(SIZES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="result file (default: benchmarks/<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare the new run with")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="only compare two result files")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        sys.exit(1 if print_comparison(old, new, args.threshold) else 0)
+
+    commit = git_commit()
+    output = {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "environment": environment(),
+        "results": run(args.sizes, args.stages, args.seed),
+    }
+
+    path = args.out or os.path.join(RESULT_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(output, f, indent=2)
+    print("[INFO] Saved results to", path)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            sys.exit(1 if print_comparison(json.load(f), output, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
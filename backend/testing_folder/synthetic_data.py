@@ -0,0 +1,125 @@
+"""
+Deterministic synthetic transactions in the UCI Online Retail schema
+(InvoiceNo, StockCode, Description, Quantity, InvoiceDate, UnitPrice,
+CustomerID, Country), for benchmarks at any size.
+
+Invoices are built around product families (baskets mostly stay in one
+family, so FP-Growth finds rules), product popularity is Zipf-like, most
+customers are from the United Kingdom, sales happen on business hours
+and never on Saturdays, ~2% of invoices are cancellations and ~25% have
+no CustomerID, roughly like the real data.
+
+    python testing_folder/synthetic_data.py 100000 data/synthetic_100k.csv
+"""
+import sys
+import numpy as np
+import pandas as pd
+
+START = "2010-12-01"
+END = "2011-12-09"
+LINES_PER_INVOICE = 20
+FAMILY_SIZE = 20
+MAX_PRODUCTS = 4000
+COUNTRIES = [
+    "United Kingdom", "Germany", "France", "EIRE", "Spain", "Netherlands",
+    "Belgium", "Switzerland", "Portugal", "Australia", "Norway", "Italy",
+]
+COLOURS = ["RED", "PINK", "BLUE", "WHITE", "IVORY", "GREEN", "BLACK", "SILVER", "VINTAGE", "RETROSPOT"]
+MATERIALS = ["METAL", "GLASS", "PAPER", "CERAMIC", "WOODEN", "FELT", "ENAMEL", "LACE"]
+ITEMS = [
+    "HEART T-LIGHT HOLDER", "LUNCH BAG", "CAKE CASES", "JUMBO BAG", "CHRISTMAS BAUBLE",
+    "PHOTO FRAME", "TEA CUP AND SAUCER", "BUNTING", "DOORMAT", "ALARM CLOCK",
+    "WATER BOTTLE", "NOTEBOOK", "STORAGE TIN", "CANDLE", "HANGING SIGN",
+]
+
+
+def scaled_sizes(n_rows):
+    # Products grow slowly with the data (the real catalogue is ~4k items)
+    n_products = int(min(MAX_PRODUCTS, max(200, n_rows ** 0.5 * 6)))
+    n_customers = max(100, n_rows // 125)
+    return n_products, n_customers
+
+
+def product_names(n_products):
+    # Products of a family share their item words, so KNN finds neighbours
+    names = []
+    seen = {}
+    for i in range(n_products):
+        name = (
+            f"{COLOURS[i % len(COLOURS)]} {MATERIALS[(i // len(COLOURS)) % len(MATERIALS)]} "
+            f"{ITEMS[(i // FAMILY_SIZE) % len(ITEMS)]}"
+        )
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name} {seen[name]}")
+    return names
+
+
+def zipf_weights(n, exponent=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def generate_transactions(n_rows, seed=42):
+    """
+    n_rows invoice lines; the same n_rows and seed always give the same frame.
+    String columns are categoricals, like the loader's Arrow cache.
+    """
+    rng = np.random.default_rng(seed)
+    n_products, n_customers = scaled_sizes(n_rows)
+
+    # Invoices and their lines
+    sizes = rng.geometric(1 / LINES_PER_INVOICE, size=n_rows // LINES_PER_INVOICE * 2 + 10)
+    n_invoices = int(np.searchsorted(np.cumsum(sizes), n_rows)) + 1
+    sizes = sizes[:n_invoices]
+    sizes[-1] -= sizes.sum() - n_rows
+    invoice = np.repeat(np.arange(n_invoices), sizes)
+
+    # Invoice level: customer, country, timestamp, cancellation
+    customer = rng.choice(n_customers, size=n_invoices, p=zipf_weights(n_customers, 0.8))
+    customer_country = np.where(
+        rng.random(n_customers) < 0.9, 0, rng.integers(1, len(COUNTRIES), size=n_customers)
+    )
+    days = pd.date_range(START, END, freq="D")
+    days = days[days.weekday != 5].to_numpy()
+    hour = np.clip(np.round(rng.normal(12.5, 2.2, size=n_invoices)), 7, 20).astype("int64")
+    timestamp = (
+        days[rng.integers(0, len(days), size=n_invoices)]
+        + hour.astype("timedelta64[h]")
+        + rng.integers(0, 60, size=n_invoices).astype("timedelta64[m]")
+    )
+    cancelled = rng.random(n_invoices) < 0.02
+    anonymous = rng.random(n_invoices) < 0.25
+
+    # Line level: mostly from the invoice's product family, else anywhere
+    n_families = -(-n_products // FAMILY_SIZE)
+    family = rng.choice(n_families, size=n_invoices, p=zipf_weights(n_families, 0.7))[invoice]
+    in_family = family * FAMILY_SIZE + rng.choice(FAMILY_SIZE, size=n_rows, p=zipf_weights(FAMILY_SIZE, 1.0))
+    anywhere = rng.choice(n_products, size=n_rows, p=zipf_weights(n_products))
+    product = np.where((rng.random(n_rows) < 0.7) & (in_family < n_products), in_family, anywhere)
+
+    pack = np.array([1, 2, 6, 12, 24])[rng.choice(5, size=n_rows, p=[0.35, 0.2, 0.2, 0.2, 0.05])]
+    quantity = rng.geometric(0.5, size=n_rows) * pack
+    quantity = np.where(cancelled[invoice], -quantity, quantity)
+    price = np.round(np.exp(rng.normal(0.8, 0.8, size=n_products)), 2).clip(0.1, 300)
+
+    invoice_names = np.char.add(np.where(cancelled, "C", ""), (536365 + np.arange(n_invoices)).astype(str))
+    customer_ids = np.where(anonymous, np.nan, 12346.0 + customer)[invoice]
+
+    return pd.DataFrame({
+        "InvoiceNo": pd.Categorical.from_codes(invoice, categories=pd.Index(invoice_names)),
+        "StockCode": pd.Categorical.from_codes(product, categories=pd.Index((10000 + np.arange(n_products)).astype(str))),
+        "Description": pd.Categorical.from_codes(product, categories=pd.Index(product_names(n_products))),
+        "Quantity": quantity.astype("int64"),
+        "InvoiceDate": timestamp[invoice].astype("datetime64[us]"),
+        "UnitPrice": price[product],
+        "CustomerID": customer_ids,
+        "Country": pd.Categorical.from_codes(customer_country[customer][invoice], categories=COUNTRIES),
+    })
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = sys.argv[2] if len(sys.argv) > 2 else f"synthetic_{rows}.csv"
+    df = generate_transactions(rows)
+    df.to_csv(path, index=False)
+    print(f"[INFO] Saved {len(df)} rows to {path}")
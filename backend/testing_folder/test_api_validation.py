@@ -0,0 +1,59 @@
+"""Cursor / offset validation of the paged endpoints (no startup needed)"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app
+from ml.similarity_table import MAX_PAGE, page
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Not entered as a context manager: startup (data + models) doesn't run
+    return TestClient(app.app)
+
+
+@pytest.mark.parametrize("query", [
+    "cursor=-1",
+    "limit=0",
+    f"limit={MAX_PAGE + 1}",
+    "top_k=0",
+    "cursor=abc",
+])
+def test_similar_all_rejects_bad_paging(client, query):
+    assert client.get(f"/similar-products/all?{query}").status_code == 422
+
+
+@pytest.mark.parametrize("query", ["offset=-1", "limit=-1"])
+def test_job_results_rejects_bad_paging(client, query):
+    assert client.get(f"/jobs/unknown/results?{query}").status_code == 422
+
+
+def test_job_results_unknown_job(client):
+    assert client.get("/jobs/unknown/results?offset=0").status_code == 404
+
+
+def test_page_bounds():
+    products = ["p0", "p1", "p2"]
+    indices = np.array([[1, 2], [0, 2], [0, 1]])
+    sims = np.array([[0.9, 0.5], [0.9, 0.4], [0.5, 0.4]])
+
+    with pytest.raises(ValueError):
+        page(products, indices, sims, cursor=-1)
+    with pytest.raises(ValueError):
+        page(products, indices, sims, limit=0)
+
+    result = page(products, indices, sims, cursor=2, limit=10, top_k=5)
+    assert list(result["products"]) == ["p2"]
+    assert len(result["products"]["p2"]) == 2
+    assert result["next_cursor"] is None
+
+    result = page(products, indices, sims, cursor=0, limit=2, top_k=1)
+    assert list(result["products"]) == ["p0", "p1"]
+    assert result["next_cursor"] == 2
+    assert page(products, indices, sims, cursor=5)["products"] == {}
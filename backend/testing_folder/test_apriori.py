@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 """Test script to debug the Apriori endpoint"""
 
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic_data import generate_transactions
 from utils.data_loader import load_5lakh_data
 from ml.apriori import run_apriori
 
@@ -10,12 +15,19 @@ print("=" * 60)
 
 try:
     print("\n1. Loading data...")
-    df = load_5lakh_data(nrows=10000)  # Start with just 10k rows
+    min_support = 0.001
+    try:
+        df = load_5lakh_data(nrows=10000)  # Start with just 10k rows
+    except FileNotFoundError:
+        # No data/online_retail.* here: same shape, synthetic. Its baskets
+        # are far denser, so mine at a higher support.
+        df = generate_transactions(10000)
+        min_support = 0.01
     print(f"   ✓ Loaded {len(df)} rows")
     print(f"   Columns: {df.columns.tolist()}")
     
     print("\n2. Running Apriori...")
-    result = run_apriori(df, min_support=0.001, min_confidence=0.01)
+    result = run_apriori(df, min_support=min_support, min_confidence=0.01)
     rules = result.get("rules", [])
     print(f"   ✓ {result.get('message', 'Done')}")
     
@@ -0,0 +1,139 @@
+"""DatasetRegistry (utils/data_loader.py): loading, memory budget, eviction"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from utils import data_loader
+from utils.data_loader import DatasetRegistry, UnknownDataset, data_version
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_loader, "CACHE_DIR", str(tmp_path / "cached"))
+    monkeypatch.setattr(data_loader, "appended_chunks", {})
+    paths = {}
+    for seed, name in enumerate(["a", "b", "c"]):
+        path = tmp_path / f"{name}.csv"
+        generate_transactions(2000, seed=seed).to_csv(path, index=False)
+        paths[name] = str(path)
+    return paths
+
+
+def registry_for(sources, max_bytes):
+    registry = DatasetRegistry(max_bytes)
+    for name, path in sources.items():
+        registry.register(name, path)
+    return registry
+
+
+def test_lru_eviction_under_budget(sources):
+    sizes = registry_for(sources, 1 << 40)
+    for name in sources:
+        sizes.get(name)
+    # Room for any two of the three frames, not all three
+    loaded = [size for _, size in sizes.frames.values()]
+    budget = min(sum(loaded) - 1, 2 * max(loaded))
+
+    registry = registry_for(sources, budget)
+    evicted = []
+    registry.on_evict(evicted.append)
+    a = registry.get("a")
+    b = registry.get("b")
+    registry.get("a")
+    registry.get("c")
+
+    assert list(registry.frames) == ["a", "c"]
+    assert evicted == [data_version(b)]
+    assert registry.status()["evictions"] == 1
+    # An evicted dataset loads again on demand, evicting the next oldest
+    registry.get("b")
+    assert list(registry.frames) == ["c", "b"]
+    assert evicted[1:] == [data_version(a)]
+    assert registry.loads == 4
+
+
+def test_current_dataset_always_kept(sources):
+    registry = registry_for(sources, 1)
+    registry.get("a")
+    registry.get("b")
+    assert list(registry.frames) == ["b"]
+
+
+def test_get_returns_views(sources):
+    registry = registry_for(sources, 1 << 40)
+    view = registry.get("a")
+    view["Extra"] = 1
+    assert "Extra" not in registry.get("a").columns
+    assert registry.loads == 1
+
+
+def test_rows_of(sources):
+    registry = registry_for(sources, 1 << 40)
+    first = registry.rows_of("a", 100)
+    second = registry.rows_of("a", 200)
+    assert (len(first), len(second)) == (100, 200)
+    assert data_version(first) != data_version(second)
+    assert len(registry.rows_of("a", 100)) == 100
+
+
+def test_eviction_keeps_ingested_rows(sources):
+    registry = registry_for(sources, 1)
+    a = registry.get("a")
+    base = data_version(a)
+    extra = pd.DataFrame({"Quantity": [1]})
+    assert data_loader.append_rows(a, extra) == f"{base}+a.1"
+    assert data_loader.append_rows(a, extra) == f"{base}+a.2"
+
+    registry.get("b")
+    assert "a" not in registry.frames
+    reloaded = registry.get("a")
+    assert data_version(reloaded) == f"{base}+a.2"
+    assert len(data_loader.with_appended_rows(reloaded)) == len(a) + 2
+    assert data_loader.append_rows(reloaded, extra) == f"{base}+a.3"
+
+
+def test_same_source_ingests_separately(sources):
+    registry = registry_for(sources, 1 << 40)
+    registry.register("copy", sources["a"])
+    a, copy = registry.get("a"), registry.get("copy")
+    assert data_version(a) == data_version(copy)
+
+    data_loader.append_rows(a, pd.DataFrame({"Quantity": [1]}))
+    assert data_version(copy) == copy.attrs["data_version"]
+    assert data_loader.with_appended_rows(copy) is copy
+    data_loader.append_rows(copy, pd.DataFrame({"Quantity": [1]}))
+    assert data_version(a) != data_version(copy)
+
+
+def test_derived_cleared_on_eviction(sources):
+    registry = registry_for(sources, 1)
+    builds = []
+
+    def build(df):
+        builds.append(1)
+        return len(df)
+
+    a = registry.get("a")
+    registry.derived("a", "size", a, build)
+    registry.derived("a", "size", a, build)
+    assert len(builds) == 1
+
+    registry.get("b")
+    assert registry.datasets["a"].derived == {}
+    registry.derived("a", "size", registry.get("a"), build)
+    assert len(builds) == 2
+
+
+def test_unknown_and_missing(sources, tmp_path):
+    registry = registry_for(sources, 1 << 40)
+    with pytest.raises(UnknownDataset):
+        registry.get("nope")
+    registry.register("missing", str(tmp_path / "missing.csv"))
+    with pytest.raises(FileNotFoundError):
+        registry.get("missing")
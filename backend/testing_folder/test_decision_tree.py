@@ -0,0 +1,44 @@
+"""Spend prediction (ml/decision_tree.py): retraining every fitted backend after an ingest"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from ml import decision_tree
+from utils.feature_store import compute_customer_features
+from utils.model_registry import ModelRegistry, model_key
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path))
+    monkeypatch.setattr(decision_tree, "MODELS", registry)
+    return registry
+
+
+def customers(version):
+    frame = compute_customer_features(generate_transactions(5000))
+    frame.attrs["data_version"] = version
+    return frame
+
+
+def test_retrain_covers_fitted_backends(registry, monkeypatch):
+    decision_tree.spend_model(customers("v"), "hist_gradient_boosting")
+    assert decision_tree.fitted_backends("v+default.1") == ["tree", "hist_gradient_boosting"]
+
+    revision = customers("v+default.1")
+    monkeypatch.setattr(decision_tree, "data_version", lambda df: "v+default.1")
+    monkeypatch.setattr(decision_tree, "get_customer_features", lambda df: revision)
+    decision_tree.retrain_in_background(None)
+    for thread in threading.enumerate():
+        if thread.name == "spend-retrain":
+            thread.join()
+
+    for backend in ("tree", "hist_gradient_boosting"):
+        assert model_key("spend_model", "v+default.1", {"backend": backend}) in registry.models
+    assert model_key("spend_model", "v+default.1", {"backend": "gradient_boosting"}) not in registry.models
@@ -0,0 +1,45 @@
+"""Catalogue forecasts (ml/forecast.py): in-thread vs worker-pool blocks, empty cube"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from ml import forecast
+from ml.forecast import BLOCK_ROWS, forecast_catalogue, forecast_matrix
+from ml.sales_cube import SalesCube
+from utils.workers import SCHEDULER
+
+
+@pytest.fixture
+def pool():
+    yield SCHEDULER
+    SCHEDULER.shutdown()
+
+
+def test_pool_blocks_match_in_thread(pool):
+    rng = np.random.default_rng(0)
+    Y = rng.poisson(3, size=(2 * BLOCK_ROWS + 7, 35)).astype(float)
+    for model in ("seasonal_naive", "ets"):
+        assert np.allclose(forecast_matrix(Y, model, 10, n_jobs=2), forecast_matrix(Y, model, 10))
+
+
+def test_empty_cube(monkeypatch):
+    monkeypatch.setattr(forecast, "_forecasts", type(forecast._forecasts)())
+    cube = SalesCube(generate_transactions(100).iloc[:0])
+    result = forecast_catalogue(cube, "empty", horizon=7)
+    assert result["names"] == [] and result["dates"] == []
+    assert result["forecast"].shape == (0, 7)
+
+
+def test_catalogue_forecast(monkeypatch):
+    monkeypatch.setattr(forecast, "_forecasts", type(forecast._forecasts)())
+    cube = SalesCube(generate_transactions(5000))
+    result = forecast_catalogue(cube, "v", by="country", horizon=7)
+    assert len(result["dates"]) == 7
+    assert result["forecast"].shape == (len(result["names"]), 7)
+    assert forecast_catalogue(cube, "v", by="country", horizon=7) is result
@@ -0,0 +1,85 @@
+"""Sparse FP-Growth (ml/fpgrowth.py) against mlxtend, and SON against one process"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import association_rules as mlxtend_rules
+from mlxtend.frequent_patterns import fpgrowth as mlxtend_fpgrowth
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from ml.fpgrowth import association_rules, build_sparse_basket, frequent_itemsets, mine_son
+from utils.workers import SCHEDULER
+
+MIN_SUPPORT = 0.02
+MAX_LEN = 3
+
+
+@pytest.fixture(scope="module")
+def basket():
+    # ~2k invoices: enough for SON to split into several partitions
+    matrix, _ = build_sparse_basket(generate_transactions(40000))
+    yield matrix
+    # SON ran on the scheduler's worker pool
+    SCHEDULER.shutdown()
+
+
+@pytest.fixture(scope="module")
+def expected(basket):
+    dense = pd.DataFrame(basket.toarray(), columns=range(basket.shape[1]))
+    return mlxtend_fpgrowth(dense, min_support=MIN_SUPPORT, max_len=MAX_LEN)
+
+
+def test_itemsets_match_mlxtend(basket, expected):
+    counts = frequent_itemsets(basket, MIN_SUPPORT, max_len=MAX_LEN)
+    ours = {itemset: count / basket.shape[0] for itemset, count in counts.items()}
+    theirs = {tuple(sorted(s)): support for s, support in zip(expected["itemsets"], expected["support"])}
+
+    assert any(len(itemset) > 1 for itemset in ours)
+    assert ours.keys() == theirs.keys()
+    for itemset, support in theirs.items():
+        assert ours[itemset] == pytest.approx(support)
+
+
+def test_rules_match_mlxtend(basket, expected):
+    counts = frequent_itemsets(basket, MIN_SUPPORT, max_len=MAX_LEN)
+    ours = {
+        (a, c): (confidence, lift)
+        for a, c, _, confidence, lift in association_rules(counts, basket.shape[0], 0.3)
+    }
+    rules = mlxtend_rules(expected, len(basket.toarray()), metric="confidence", min_threshold=0.3)
+    theirs = {
+        (tuple(sorted(a)), tuple(sorted(c))): (confidence, lift)
+        for a, c, confidence, lift in zip(rules["antecedents"], rules["consequents"], rules["confidence"], rules["lift"])
+    }
+
+    assert ours.keys() == theirs.keys()
+    for rule, (confidence, lift) in theirs.items():
+        assert ours[rule] == pytest.approx((confidence, lift))
+
+
+def test_son_matches_single_process(basket):
+    single = frequent_itemsets(basket, MIN_SUPPORT, max_len=MAX_LEN)
+    son = mine_son(basket, MIN_SUPPORT, max_len=MAX_LEN, n_jobs=2, n_partitions=4)
+    assert son == single
+
+
+def test_progress_and_stop(basket):
+    seen = []
+    frequent_itemsets(basket, MIN_SUPPORT, max_len=MAX_LEN, progress=seen.append)
+    assert seen and seen == sorted(seen) and 0 <= seen[0] and seen[-1] < 1
+
+    class Stop(Exception):
+        pass
+
+    def stop(fraction):
+        if fraction > 0.2:
+            raise Stop()
+
+    with pytest.raises(Stop):
+        frequent_itemsets(basket, MIN_SUPPORT, max_len=MAX_LEN, progress=stop)
+    with pytest.raises(Stop):
+        mine_son(basket, MIN_SUPPORT, max_len=MAX_LEN, n_jobs=2, n_partitions=4, progress=stop)
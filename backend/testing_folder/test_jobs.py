@@ -0,0 +1,51 @@
+"""Job status files (utils/jobs.py): saving and loading at startup"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import jobs
+from utils.jobs import Job, JobManager
+
+
+@pytest.fixture
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_save_leaves_no_temp_files(job_dir):
+    job = Job("apriori", {"min_support": 0.01})
+    job.save()
+    job.status = "running"
+    job.save()
+    assert os.listdir(job_dir) == [f"{job.id}.json"]
+    assert json.loads((job_dir / f"{job.id}.json").read_text())["status"] == "running"
+
+
+def test_saved_jobs_read_on_load_only(job_dir):
+    done, running = Job("apriori", {}), Job("mba", {})
+    done.status = "done"
+    running.status = "running"
+    done.save()
+    running.save()
+    (job_dir / "broken.json").write_text("{")
+
+    manager = JobManager()
+    try:
+        assert manager.list() == []
+        manager.load_saved()
+        loaded = {job.id: job for job in manager.list()}
+        assert set(loaded) == {done.id, running.id}
+        assert loaded[done.id].status == "done"
+        assert loaded[running.id].status == "failed"
+    finally:
+        manager.shutdown()
+
+
+def test_cpu_bound_kinds_use_processes():
+    assert jobs.PROCESS_KINDS <= set(jobs.JOB_KINDS)
+    assert {"apriori", "mba", "kmeans-sweep", "customer-segmentation"} <= jobs.PROCESS_KINDS
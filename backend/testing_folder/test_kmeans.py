@@ -0,0 +1,56 @@
+"""Mini-batch KMeans (ml/kmeans.py): warm starts, absorbed customers, summaries"""
+
+import os
+import sys
+
+import joblib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from ml import kmeans
+from utils.feature_store import compute_customer_features
+from utils.model_registry import ModelRegistry
+from utils.response_cache import dumps
+
+
+@pytest.fixture(scope="module")
+def customers():
+    return compute_customer_features(generate_transactions(20000))
+
+
+def test_empty_cluster_summary_is_json(customers):
+    labels = np.zeros(len(customers), dtype=int)
+    summary = kmeans.cluster_summary(customers, labels, 3)
+    assert [row["customers"] for row in summary] == [len(customers), 0, 0]
+    assert summary[2]["avg_spend"] == 0
+    dumps(summary)
+
+
+def test_minibatch_chain_fits_each_k_once(customers, tmp_path, monkeypatch):
+    monkeypatch.setattr(kmeans, "MODELS", ModelRegistry(str(tmp_path)))
+    frame = customers.copy(deep=False)
+    frame.attrs["data_version"] = "v"
+
+    fitted = []
+    fit = kmeans.fit_minibatch
+    monkeypatch.setattr(kmeans, "fit_minibatch", lambda df, k, below=None: fitted.append(k) or fit(df, k, below))
+
+    _, model, _ = kmeans.minibatch_model(frame, 5)
+    assert model.n_clusters == 5 and fitted == [2, 3, 4, 5]
+    kmeans.minibatch_model(frame, 6)
+    assert fitted == [2, 3, 4, 5, 6]
+
+
+def test_absorb_from_memory_mapped_model(customers, tmp_path):
+    bundle = kmeans.fit_minibatch(customers, 2)
+    joblib.dump(bundle, tmp_path / "m.joblib")
+    mapped = joblib.load(tmp_path / "m.joblib", mmap_mode="r")
+
+    more = customers.assign(CustomerID=customers["CustomerID"] + 10 ** 6)
+    _, model, seen = kmeans.absorb_customers(more, mapped)
+    assert model.cluster_centers_.flags.writeable
+    assert len(seen) == 2 * len(customers)
+    assert np.array_equal(mapped[1].cluster_centers_, bundle[1].cluster_centers_)
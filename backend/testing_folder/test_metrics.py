@@ -0,0 +1,52 @@
+"""Prometheus export and the sampling profiler (utils/metrics.py)"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import metrics
+
+
+def test_monotonic_counts_are_counters():
+    metrics.REQUESTS.add("GET", "/x", 200, 0.01)
+    with metrics.stage("test.stage"):
+        pass
+    text = metrics.prometheus_text({"g": ("A gauge.", 1)}, {"c_total": ("A counter.", 2)})
+
+    types = dict(line.split()[2:4] for line in text.splitlines() if line.startswith("# TYPE"))
+    assert types["http_requests_total"] == "counter"
+    assert types["stage_runs_total"] == "counter"
+    assert types["c_total"] == "counter" and types["g"] == "gauge"
+    assert all(kind != "gauge" for name, kind in types.items() if name.endswith("_total"))
+    assert 'stage_runs_total{stage="test.stage"}' in text
+
+
+def busy_other_thread(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def busy_request_thread(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+def test_profiler_samples_only_the_request_threads():
+    profiler = metrics.Profiler(enabled=True, interval=0.001)
+    stop = threading.Event()
+    other = threading.Thread(target=busy_other_thread, args=(stop,))
+    other.start()
+    try:
+        sample = profiler.start("GET /x")
+        busy_request_thread(0.2)
+        profile_id = profiler.stop(sample, "/x")
+    finally:
+        stop.set()
+        other.join()
+
+    collapsed = profiler.collapsed(profile_id)
+    assert "busy_request_thread" in collapsed
+    assert "busy_other_thread" not in collapsed
@@ -0,0 +1,49 @@
+"""ModelRegistry (utils/model_registry.py): persisted base models, in-memory revisions"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.model_registry import ModelRegistry
+
+
+def test_base_model_saved_and_shared(tmp_path):
+    fits = []
+    first = ModelRegistry(str(tmp_path))
+    assert first.get_or_fit("m", "base", {"k": 3}, lambda: fits.append(1) or {"fit": 1}) == {"fit": 1}
+
+    # Another process finds the file instead of fitting
+    second = ModelRegistry(str(tmp_path))
+    assert second.get_or_fit("m", "base", {"k": 3}, lambda: fits.append(1) or {"fit": 2}) == {"fit": 1}
+    assert len(fits) == 1 and second.stats()["loads"] == 1
+
+
+def test_revisions_stay_in_memory(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.get_or_fit("m", "base", {}, lambda: 0)
+    update = lambda previous: previous + 1
+    assert registry.get_or_update("m", "base+1", {}, lambda: -1, update) == 1
+    assert registry.get_or_update("m", "base+2", {}, lambda: -1, update) == 2
+    assert sorted(os.listdir(tmp_path)) == ["m_base.joblib"]
+
+    # "+2" of another process is other rows: updated from the saved base
+    other = ModelRegistry(str(tmp_path))
+    assert other.get_or_update("m", "base+2", {}, lambda: -1, update) == 1
+
+
+def test_unversioned_frames_always_fit(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    fits = []
+    for _ in range(2):
+        registry.get_or_fit("m", None, {}, lambda: fits.append(1))
+    assert len(fits) == 2 and not os.listdir(tmp_path)
+
+
+def test_update_from_the_same_dataset(tmp_path):
+    registry = ModelRegistry(str(tmp_path))
+    registry.get_or_fit("m", "base", {}, lambda: 0)
+    update = lambda previous: previous + 1
+    assert registry.get_or_update("m", "base+a.1", {}, lambda: -1, update) == 1
+    assert registry.get_or_update("m", "base+a.2", {}, lambda: -1, update) == 2
+    # Dataset b (same source) starts from the base, not from a's revisions
+    assert registry.get_or_update("m", "base+b.2", {}, lambda: -1, update) == 1
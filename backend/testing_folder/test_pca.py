@@ -0,0 +1,73 @@
+"""PCA (ml/pca.py): components carried across ingested revisions, refit past REFIT_SHARE"""
+
+import os
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from ml import pca
+from utils.feature_store import compute_customer_features
+from utils.model_registry import ModelRegistry
+
+
+@pytest.fixture(scope="module")
+def customers():
+    frame = compute_customer_features(generate_transactions(20000))
+    frame.attrs["data_version"] = "v"
+    return frame
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(pca, "MODELS", ModelRegistry(str(tmp_path)))
+
+
+def revision(customers, version, new=0, changed=0):
+    """customers with `new` added customers and `changed` ones with more spend"""
+    frame = customers.copy()
+    frame.loc[frame.index[:changed], "total_spend"] += 100.0
+    extra = customers.iloc[:new].assign(CustomerID=customers["CustomerID"].iloc[:new] + 10 ** 6)
+    frame = pd.concat([frame, extra], ignore_index=True)
+    frame.attrs["data_version"] = version
+    return frame
+
+
+def test_incremental_partial_fits_new_customers(customers, registry):
+    scaler, model, _, _ = pca.pca_model(customers, mode="incremental")
+    seen = model.n_samples_seen_
+
+    more = revision(customers, "v+default.1", new=30)
+    envelope, columns = pca.pca_table(more, mode="incremental")
+    _, updated, fitted, version = pca.pca_model(more, mode="incremental")
+    assert updated.n_samples_seen_ == seen + 30
+    assert version == "v" and len(fitted) == len(more)
+    assert envelope["components"] == {"fitted_on": "v", "stale_customers": 0}
+    assert len(columns["x"]) == len(more)
+
+
+def test_partial_fit_from_memory_mapped_bundle(customers, tmp_path):
+    bundle = pca.fit_bundle(customers, mode="incremental")
+    joblib.dump(bundle, tmp_path / "m.joblib")
+    mapped = joblib.load(tmp_path / "m.joblib", mmap_mode="r")
+
+    updated = pca.update_bundle(revision(customers, "v+default.1", new=30), mapped, mode="incremental")
+    assert updated[1].n_samples_seen_ == mapped[1].n_samples_seen_ + 30
+    assert np.array_equal(mapped[1].components_, bundle[1].components_)
+
+
+def test_full_mode_reports_staleness_then_refits(customers, registry):
+    pca.pca_model(customers)
+
+    few = max(1, int(pca.REFIT_SHARE * len(customers)) // 2)
+    envelope, _ = pca.pca_table(revision(customers, "v+default.1", new=few))
+    assert envelope["components"] == {"fitted_on": "v", "stale_customers": few}
+
+    many = int(pca.REFIT_SHARE * len(customers)) + 1
+    envelope, _ = pca.pca_table(revision(customers, "v+default.2", changed=many))
+    assert envelope["components"] == {"fitted_on": "v+default.2", "stale_customers": 0}
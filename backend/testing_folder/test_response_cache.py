@@ -0,0 +1,92 @@
+"""ResponseCache (utils/response_cache.py): byte budget and data revisions"""
+
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import data_loader, response_cache
+from utils.response_cache import ENTRY_OVERHEAD, ResponseCache, cached_response
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = ResponseCache()
+    monkeypatch.setattr(response_cache, "RESPONSE_CACHE", fresh)
+    monkeypatch.setattr(data_loader, "appended_chunks", {})
+    return fresh
+
+
+def versioned_frame(version="abc"):
+    df = pd.DataFrame({"Quantity": [1, 2, 3]})
+    df.attrs["data_version"] = version
+    return df
+
+
+def test_lru_eviction_by_bytes():
+    cache = ResponseCache(max_bytes=2 * (10 + ENTRY_OVERHEAD))
+    cache.put(("a", (), "v"), b"x" * 10)
+    cache.put(("b", (), "v"), b"x" * 10)
+    assert cache.get(("a", (), "v")) is not None
+    cache.put(("c", (), "v"), b"x" * 10)
+
+    assert cache.get(("b", (), "v")) is None
+    assert cache.get(("a", (), "v")) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_oversized_body_not_cached():
+    cache = ResponseCache(max_bytes=100)
+    cache.put(("a", (), "v"), b"x" * 100)
+    assert cache.get(("a", (), "v")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_new_revision_drops_older_ones():
+    cache = ResponseCache()
+    cache.put(("a", (), "v"), b"0")
+    cache.put(("a", (), "v+d.1"), b"1")
+    cache.put(("a", (), "v+e.1"), b"1")
+    cache.put(("a", (), "v+d.2"), b"2")
+
+    assert cache.get(("a", (), "v+d.1")) is None
+    assert cache.get(("a", (), "v+d.2")) == b"2"
+    # Another dataset of the same source, and the source itself, stay
+    assert cache.get(("a", (), "v+e.1")) == b"1"
+    assert cache.get(("a", (), "v")) == b"0"
+
+
+def test_cached_response_recomputes_after_append(cache):
+    df = versioned_frame()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"calls": len(calls)}
+
+    first = cached_response("totals", {"k": 1}, df, compute)
+    second = cached_response("totals", {"k": 1}, df, compute)
+    assert first.body == second.body
+    assert len(calls) == 1
+
+    cached_response("totals", {"k": 2}, df, compute)
+    assert len(calls) == 2
+
+    data_loader.append_rows(df, pd.DataFrame({"Quantity": [4]}))
+    third = cached_response("totals", {"k": 1}, df, compute)
+    assert len(calls) == 3
+    assert json.loads(third.body) == {"calls": 3}
+    assert cache.get(("totals", (("k", 1),), "abc+1")) is not None
+
+
+def test_unversioned_frames_not_cached(cache):
+    calls = []
+    df = pd.DataFrame({"Quantity": [1]})
+    for _ in range(2):
+        cached_response("totals", {}, df, lambda: calls.append(1) or {})
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 0
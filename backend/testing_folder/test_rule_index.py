@@ -0,0 +1,78 @@
+"""Rule lookups of ml/rule_index.py on a small hand-made itemset table"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml.rule_index import RuleIndex
+
+
+ITEMSETS = [
+    {"support": 0.5, "itemsets": ["A"]},
+    {"support": 0.4, "itemsets": ["B"]},
+    {"support": 0.2, "itemsets": ["C"]},
+    {"support": 0.3, "itemsets": ["A", "B"]},
+    {"support": 0.1, "itemsets": ["A", "C"]},
+    {"support": 0.15, "itemsets": ["B", "C"]},
+    {"support": 0.1, "itemsets": ["A", "B", "C"]},
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return RuleIndex(ITEMSETS)
+
+
+def test_rule_metrics(index):
+    (rule,) = index.rules(antecedent=["A"], consequent=["B"])
+    assert rule["support"] == pytest.approx(0.3)
+    assert rule["confidence"] == pytest.approx(0.3 / 0.5)
+    assert rule["lift"] == pytest.approx(0.3 / 0.5 / 0.4)
+
+
+def test_antecedent_only(index):
+    rules = index.rules(antecedent=["A"], top_k=10)
+    assert sorted(tuple(r["consequents"]) for r in rules) == [("B",), ("B", "C"), ("C",)]
+    assert all(r["antecedents"] == ["A"] for r in rules)
+
+
+def test_all_rules(index):
+    # 2 rules per pair, 6 per triple
+    assert len(index.rules(top_k=100)) == 3 * 2 + 6
+
+
+def test_same_item_on_both_sides(index):
+    assert index.rules(antecedent=["A"], consequent=["A"]) == []
+    assert index.rules(antecedent=["A", "B"], consequent=["B"]) == []
+
+
+def test_sides_must_cover_itemset(index):
+    # {A, C} -> {B} is a rule of {A, B, C} only; {A} -> {C} never matches {A, B, C}
+    (rule,) = index.rules(antecedent=["A", "C"], consequent=["B"])
+    assert rule["support"] == pytest.approx(0.1)
+    (rule,) = index.rules(antecedent=["A"], consequent=["C"])
+    assert rule["support"] == pytest.approx(0.1)
+    assert rule["confidence"] == pytest.approx(0.1 / 0.5)
+
+
+def test_repeated_names_count_once(index):
+    assert index.rules(antecedent=["A", "A"], consequent=["B"]) == index.rules(antecedent=["A"], consequent=["B"])
+    assert len(index.rules(antecedent=["A", "A"], top_k=10)) == 3
+
+
+def test_unknown_item(index):
+    assert index.rules(antecedent=["Z"]) == []
+    assert index.itemsets_with("Z") == []
+
+
+def test_min_thresholds(index):
+    rules = index.rules(min_support=0.2, min_confidence=0.7, top_k=10)
+    assert [(r["antecedents"], r["consequents"]) for r in rules] == [(["B"], ["A"])]
+
+
+def test_itemsets_with(index):
+    found = index.itemsets_with("C", min_support=0.1)
+    assert [r["itemsets"] for r in found][0] == ["C"]
+    assert len(found) == 4
@@ -0,0 +1,64 @@
+"""All-pairs top-k table (ml/similarity_table.py) and its on-disk cache"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml import similarity_table
+from ml.similarity_table import build_similarity_table, load_or_build_table, table_dir
+from utils.workers import SCHEDULER
+
+
+def product_matrix(seed):
+    rng = np.random.default_rng(seed)
+    return normalize(sparse.random(40, 30, density=0.2, format="csr", random_state=rng, dtype=np.float64))
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_table, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_top_k_matches_brute_force():
+    matrix = product_matrix(0)
+    indices, sims = build_similarity_table(matrix, k=5, n_jobs=1)
+    dense = (matrix @ matrix.T).toarray()
+    np.fill_diagonal(dense, -np.inf)
+    expected = np.sort(dense, axis=1)[:, ::-1][:, :5]
+    assert np.allclose(sims, expected, atol=1e-6)
+    assert np.allclose(np.take_along_axis(dense, indices.astype(np.int64), axis=1), sims, atol=1e-6)
+
+
+def test_table_dir_follows_content(cache_dir):
+    a, b = product_matrix(0), product_matrix(1)
+    assert table_dir(a) == table_dir(a.copy())
+    assert table_dir(a) != table_dir(b)
+    assert table_dir(a, k=5) != table_dir(a, k=10)
+    assert all(c.isalnum() or c in "_." for c in os.path.basename(table_dir(a)))
+
+
+def test_load_or_build_reuses_only_same_matrix(cache_dir):
+    a, b = product_matrix(0), product_matrix(1)
+    indices_a, _ = load_or_build_table(a, k=5)
+    indices_b, _ = load_or_build_table(b, k=5)
+    assert not np.array_equal(indices_a, indices_b)
+    assert np.array_equal(load_or_build_table(a, k=5)[0], indices_a)
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_worker_pool_matches_in_thread(monkeypatch):
+    # Several blocks of a few rows each
+    monkeypatch.setattr(similarity_table, "MAX_BLOCK_BYTES", 4 * 40 * 7)
+    matrix = product_matrix(2)
+    try:
+        pooled = build_similarity_table(matrix, k=5, n_jobs=3)
+    finally:
+        SCHEDULER.shutdown()
+    single = build_similarity_table(matrix, k=5, n_jobs=1)
+    assert np.array_equal(pooled[0], single[0]) and np.allclose(pooled[1], single[1])
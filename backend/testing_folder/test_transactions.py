@@ -0,0 +1,50 @@
+"""Transaction stores (utils/transactions.py) kept per dataset"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic_data import generate_transactions
+from utils import data_loader, transactions
+from utils.transactions import get_transaction_store
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(transactions, "_stores", {})
+    monkeypatch.setattr(transactions, "_order", {})
+    monkeypatch.setattr(data_loader, "appended_chunks", {})
+
+
+def frame(version, seed):
+    df = generate_transactions(500, seed=seed)
+    df.attrs["data_version"] = version
+    return df
+
+
+def test_datasets_do_not_evict_each_other():
+    a, b, c = frame("a", 0), frame("b", 1), frame("c", 2)
+    stores = [get_transaction_store(df) for df in (a, b, c)]
+    assert [get_transaction_store(df) for df in (a, b, c)] == stores
+
+
+def test_current_and_previous_revision_per_dataset():
+    a, b = frame("a", 0), frame("b", 1)
+    get_transaction_store(a)
+    other = get_transaction_store(b)
+    rows = a.head(1)
+    for _ in range(2):
+        data_loader.append_rows(a, rows)
+        get_transaction_store(a)
+
+    assert transactions._order["a"] == ["a+1", "a+2"]
+    assert get_transaction_store(a) is transactions._stores["a+2"]
+    assert "a" not in transactions._stores
+    assert get_transaction_store(b) is other
+
+    transactions.drop_dataset("a")
+    assert list(transactions._stores) == ["b"]
@@ -0,0 +1,89 @@
+"""Scheduler (utils/workers.py): worker failures and shared feature tables"""
+
+import asyncio
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import workers
+from utils.workers import Scheduler, WorkerCrashed, release_shared, share_frame, shared_customer_features
+
+
+def row_count(frame):
+    return len(frame)
+
+
+def fail(frame):
+    raise ValueError("bad parameter")
+
+
+def die(frame):
+    os._exit(1)
+
+
+@pytest.fixture
+def shared():
+    shm, layout = share_frame(pd.DataFrame({"x": [1.0, 2.0, 3.0]}))
+    layout["version"] = "v"
+    yield layout
+    shm.close()
+    shm.unlink()
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(max_workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_worker_errors_reach_the_caller(scheduler, shared):
+    assert asyncio.run(scheduler.run("ok", shared, row_count)) == 3
+    with pytest.raises(ValueError, match="bad parameter"):
+        asyncio.run(scheduler.run("fail", shared, fail))
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_dead_worker_resets_the_pool(scheduler, shared):
+    with pytest.raises(WorkerCrashed):
+        asyncio.run(scheduler.run("die", shared, die))
+    assert scheduler.pool is None
+    assert asyncio.run(scheduler.run("ok", shared, row_count)) == 3
+
+
+def test_release_called_once_job_is_over(scheduler, shared):
+    released = []
+
+    async def run():
+        return await scheduler.run("ok", shared, row_count, release=lambda: released.append(1))
+
+    assert asyncio.run(run()) == 3
+    assert released == [1]
+
+
+def test_blocks_unlinked_after_last_job(monkeypatch):
+    monkeypatch.setattr(workers, "SHARED_VERSIONS", 1)
+    monkeypatch.setattr(workers, "_shared", type(workers._shared)())
+    monkeypatch.setattr(workers, "_draining", {})
+    features = pd.DataFrame({"total_spend": [1.0, 2.0]})
+    monkeypatch.setattr(workers, "get_customer_features", lambda df: features)
+
+    frames = []
+    for version in ("a", "b"):
+        df = pd.DataFrame({"x": [0]})
+        df.attrs["data_version"] = version
+        frames.append(df)
+
+    layout = shared_customer_features(frames[0])
+    shared_customer_features(frames[1])
+    # "a" was pushed out but a job still has to attach to it
+    assert "a" in workers._draining
+    assert len(workers.attached_frame(layout)) == 2
+
+    release_shared("a")
+    assert "a" not in workers._draining
+    release_shared("b")
+    workers.shutdown_workers()
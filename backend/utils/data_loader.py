@@ -1,53 +1,552 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from utils.metrics import stage, timed
 
 DEFAULT_URL = "https://archive.ics.uci.edu/static/public/352/data.csv"
 
+# Paths are absolute (relative to backend/), whatever the working directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
 
+LOCAL_DATA_PATH = os.path.join(DATA_DIR, "uci_retail_1600_rows.xlsx")
 
-LOCAL_DATA_PATH = "data/uci_retail_1600_rows.xlsx"
+# Converted sources are stored here as Arrow IPC files (+ a small .json sidecar)
+CACHE_DIR = os.path.join(BASE_DIR, "cached")
 
+# String columns are dictionary-encoded in the Arrow cache (they load back as
+# pandas categoricals), everything else gets a fixed dtype.
+DICTIONARY_COLUMNS = ["InvoiceNo", "StockCode", "Description", "Country"]
+COLUMN_TYPES = {
+    "Quantity": pa.int64(),
+    "InvoiceDate": pa.timestamp("us"),
+    "UnitPrice": pa.float64(),
+    "CustomerID": pa.float64(),
+}
 
-cached_df = None
+# Computed once at load time so endpoints never add columns themselves
+DERIVED_COLUMNS = ["Hour", "Weekday", "Amount"]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+WEEKDAY_DTYPE = pd.CategoricalDtype(WEEKDAYS)
 
-def load_default_data():
-    global cached_df
 
-    if cached_df is None:
-        cached_df = pd.read_excel(
-            LOCAL_DATA_PATH,
-            engine="openpyxl"
-        )
+# ---------------------------------------------------------
+# ARROW CACHE
+# ---------------------------------------------------------
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-    return cached_df
 
+def cache_path_for(source_path):
+    source_path = os.path.abspath(source_path)
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    if os.path.dirname(source_path) != DATA_DIR:
+        # Same file name elsewhere: the directory tells the caches apart
+        name += "_" + hashlib.sha1(os.path.dirname(source_path).encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, name + ".arrow")
 
-import os
 
-cached_df_5lakh = None
+def read_source(source_path):
+    """
+    Parse the original Excel / CSV file. Only used when the Arrow cache
+    is missing or stale.
+    """
+    if source_path.endswith(".csv"):
+        return pd.read_csv(source_path)
+    return pd.read_excel(source_path, engine="openpyxl")
 
-def load_5lakh_data(nrows=10000):
+
+def to_arrow_table(df):
+    """
+    Convert the raw frame to a typed Arrow table with dictionary-encoded
+    string columns.
+    """
+    arrays = []
+    names = []
+    for col in df.columns:
+        values = df[col]
+        if col in DICTIONARY_COLUMNS:
+            # InvoiceNo / StockCode mix ints and strings ("C536379", "85123A")
+            values = values.astype("string")
+            arr = pa.array(values, type=pa.string()).dictionary_encode()
+        elif col == "InvoiceDate":
+            arr = pa.array(pd.to_datetime(values), type=COLUMN_TYPES[col])
+        elif col in COLUMN_TYPES:
+            arr = pa.array(values, type=COLUMN_TYPES[col], from_pandas=True)
+        else:
+            arr = pa.array(values, from_pandas=True)
+        arrays.append(arr)
+        names.append(col)
+
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def read_cache_meta(cache_path):
+    meta_path = cache_path + ".json"
+    if not (os.path.exists(cache_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def write_cache_meta(cache_path, meta):
+    tmp_path = cache_path + ".json.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, cache_path + ".json")
+
+
+def is_cache_fresh(cache_path, source_path):
+    """
+    A cache is fresh when the source's mtime and size are unchanged. If only
+    the mtime moved (copied / touched file), fall back to comparing hashes
+    and refresh the recorded mtime so the next check is cheap again.
+    """
+    meta = read_cache_meta(cache_path)
+    if meta is None or meta["source_path"] != os.path.abspath(source_path):
+        return False
+
+    stat = os.stat(source_path)
+    if meta["source_mtime_ns"] == stat.st_mtime_ns and meta["source_size"] == stat.st_size:
+        return True
+
+    if meta["source_size"] != stat.st_size or meta["source_sha256"] != file_hash(source_path):
+        return False
+
+    meta["source_mtime_ns"] = stat.st_mtime_ns
+    write_cache_meta(cache_path, meta)
+    return True
+
+
+@timed("loader.build_cache")
+def build_cache(source_path, cache_path):
+    print(f"[INFO] Converting {source_path} -> {cache_path}")
+
+    stat = os.stat(source_path)
+    table = to_arrow_table(read_source(source_path))
+
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+    write_cache_meta(cache_path, {
+        "source_path": os.path.abspath(source_path),
+        "source_mtime_ns": stat.st_mtime_ns,
+        "source_size": stat.st_size,
+        "source_sha256": file_hash(source_path),
+        "rows": table.num_rows,
+    })
+
+
+def load_table(source_path):
+    """
+    Return the source as a memory-mapped Arrow table, (re)building the
+    Arrow IPC cache first if it's missing or stale.
+    """
+    cache_path = cache_path_for(source_path)
+    if not is_cache_fresh(cache_path, source_path):
+        build_cache(source_path, cache_path)
+
+    source = pa.memory_map(cache_path, "r")
+    return ipc.open_file(source).read_all()
+
+
+# ---------------------------------------------------------
+# DERIVED COLUMNS + READ-ONLY FRAMES
+# ---------------------------------------------------------
+@timed("loader.derived_columns")
+def add_derived_columns(df):
+    """
+    Returns df with InvoiceDate parsed and the Hour, Weekday (categorical,
+    codes 0 = Monday) and line Amount columns added. df is not modified.
+    """
+    invoice_date = pd.to_datetime(df["InvoiceDate"])
+    return df.assign(
+        InvoiceDate=invoice_date,
+        Hour=invoice_date.dt.hour.astype("int8"),
+        Weekday=pd.Categorical.from_codes(invoice_date.dt.weekday.to_numpy(), dtype=WEEKDAY_DTYPE),
+        Amount=df["Quantity"].to_numpy() * df["UnitPrice"].to_numpy(),
+    )
+
+
+def read_only_frame(df):
+    """
+    Same columns, backed by non-writeable NumPy arrays (no copies), so any
+    in-place write raises instead of corrupting the shared cache.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            codes = values.cat.codes.to_numpy()
+            codes.flags.writeable = False
+            columns[col] = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            arr = values.to_numpy()
+            arr.flags.writeable = False
+            columns[col] = arr
+
+    frame = pd.DataFrame(columns, copy=False)
+    frame.attrs.update(df.attrs)
+    return frame
+
+
+def load_frame(source_path, nrows=None, start=0):
+    """
+    Rows start .. start + nrows (all by default) of a source, through its
+    Arrow cache: only those rows are converted to pandas.
+    """
+    with stage("loader.read_arrow"):
+        table = load_table(source_path)
+        if start or nrows is not None:
+            table = table.slice(start, nrows)
+        df = table.to_pandas(split_blocks=True)
+
+    df = add_derived_columns(df)
+    with stage("loader.read_only"):
+        df = read_only_frame(df)
+    # Identifies this exact content; downstream caches key on it
+    version = read_cache_meta(cache_path_for(source_path))["source_sha256"][:16]
+    if start:
+        version += f":{start}-" + ("" if nrows is None else str(start + nrows))
+    elif nrows is not None:
+        version += f":{nrows}"
+    df.attrs["data_version"] = version
+    return df
+
+
+def sample_invoices(df, fraction, seed=42):
+    """
+    The lines of a random share of the invoices (whole baskets, so basket
+    analysis on a sample stays meaningful), in their original order.
+    """
+    codes, invoices = pd.factorize(df["InvoiceNo"])
+    keep = np.random.default_rng(seed).random(len(invoices)) < fraction
+    frame = read_only_frame(df[keep[codes]].reset_index(drop=True))
+    frame.attrs["data_version"] = f"{df.attrs['data_version']}~{fraction:g}@{seed}"
+    return frame
+
+
+# Invoice lines appended at runtime by utils/ingest.py, per dataset name
+# (per version for frames not from the registry). They outlive evictions of
+# the dataset's frame; the loaded frames themselves are never modified.
+appended_chunks = {}
+
+
+def ingest_key(df):
+    # Ingested lines belong to a dataset, not to its content: two datasets
+    # with byte-identical sources don't share them
+    return df.attrs.get("dataset") or df.attrs.get("data_version")
+
+
+def data_version(df):
+    """
+    Version string stamped on frames returned by the loaders, or None for
+    frames that didn't come from the loader (uploads, test data...).
+    Every chunk of appended invoice lines bumps the revision suffix:
+    "base+name.N" for dataset name, "base+N" for other frames.
+    """
+    version = df.attrs.get("data_version")
+    if version is None:
+        return None
+
+    revision = len(appended_chunks.get(ingest_key(df), []))
+    if revision == 0:
+        return version
+    name = df.attrs.get("dataset")
+    return f"{version}+{name}.{revision}" if name else f"{version}+{revision}"
+
+
+def append_rows(df, rows):
+    appended_chunks.setdefault(ingest_key(df), []).append(rows)
+    return data_version(df)
+
+
+def is_revision_of(version, base):
+    # version is base itself or one of its ingested revisions (base+...)
+    return version == base or version.startswith(base + "+")
+
+
+def version_lineage(version):
+    # The base, or the base and dataset of a revision: revisions of one
+    # lineage replace each other
+    base, plus, revision = version.partition("+")
+    return base + plus + revision.rpartition(".")[0]
+
+
+def earlier_versions(version):
+    """
+    The revisions before version in its lineage, newest first, then the
+    base ("b+d.3" -> "b+d.2", "b+d.1", "b").
     """
-    Load the large retail dataset.
-    Prioritizes CSV if available, otherwise falls back to Excel.
+    base, plus, revision = version.partition("+")
+    if not plus:
+        return []
+    prefix, dot, n = revision.rpartition(".")
+    return [f"{base}+{prefix}{dot}{r}" for r in range(int(n) - 1, 0, -1)] + [base]
+
+
+def with_appended_rows(df):
+    """
+    The loaded frame plus every chunk appended since. Only for full
+    recomputes; the live aggregates never need this.
+    """
+    chunks = appended_chunks.get(ingest_key(df), [])
+    if not chunks:
+        return df
+    return pd.concat([df, *chunks], ignore_index=True)
+
+
+# ---------------------------------------------------------
+# DATASET REGISTRY
+# ---------------------------------------------------------
+DEFAULT_DATASET = "default"
+# The full UCI Online Retail set (~500k lines), CSV preferred over Excel
+FULL_DATASET = "online_retail"
+# Loaded frames are evicted (least recently used first) beyond this budget
+MAX_DATASET_BYTES = int(os.environ.get("DATASET_BUDGET_MB", "2048")) * 2 ** 20
+# Optional JSON list of extra datasets: [{"name", "path", "rows", "sample", "seed"}]
+DATASETS_CONFIG = os.environ.get("DATASETS_CONFIG")
+
+
+class UnknownDataset(Exception):
+    pass
+
+
+class Dataset:
+    """
+    A named view of a source file: all of it, a row range (rows = [start,
+    stop)) and / or a sample of its invoices (sample = fraction, seed).
+    paths are tried in order; the first that exists is the source.
     """
-    global cached_df_5lakh
 
-    if cached_df_5lakh is None:
-        csv_path = "data/online_retail.csv"
-        excel_path = "data/online_retail.xlsx"
-        
-        if os.path.exists(csv_path):
-            print(f"Loading retail data from CSV (nrows={nrows})...")
-            cached_df_5lakh = pd.read_csv(csv_path, nrows=nrows)
+    def __init__(self, name, paths, rows=None, sample=None, seed=42):
+        if isinstance(paths, str):
+            paths = [paths]
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError("sample must be a fraction in (0, 1]")
+        self.name = name
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.rows = tuple(rows) if rows is not None else None
+        self.sample = sample
+        self.seed = seed
+        self.lock = threading.Lock()
+        # Indexes built from the loaded frame: key -> (data version, value)
+        self.derived = {}
+        self.derived_lock = threading.Lock()
+
+    def source(self):
+        for path in self.paths:
+            if os.path.exists(path):
+                return path
+        raise FileNotFoundError(f"No source for dataset {self.name}: {', '.join(self.paths)}")
+
+    def load(self):
+        source_path = self.source()
+        print(f"[INFO] Loading dataset {self.name} from {source_path}")
+        if self.rows is None:
+            df = load_frame(source_path)
         else:
-            print(f"Loading retail data from Excel (nrows={nrows})...")
-            cached_df_5lakh = pd.read_excel(
-                excel_path,
-                engine="openpyxl",
-                nrows=nrows
+            start, stop = self.rows
+            df = load_frame(source_path, None if stop is None else stop - start, start)
+        if self.sample is not None and self.sample < 1:
+            df = sample_invoices(df, self.sample, self.seed)
+        # Ingested lines are kept per dataset (see append_rows)
+        df.attrs["dataset"] = self.name
+        print(f"[INFO] Loaded dataset {self.name}: {len(df)} rows")
+        return df
+
+    def describe(self):
+        return {"name": self.name, "paths": self.paths, "rows": self.rows, "sample": self.sample, "seed": self.seed}
+
+
+class DatasetRegistry:
+    """
+    Named datasets, each loaded once on first use and kept as a read-only
+    frame. When the loaded frames together exceed max_bytes, whole datasets
+    are evicted, least recently used first (the one just used always
+    stays), and the on_evict hooks drop what other modules derived from
+    them. An evicted dataset also loses its derived indexes; the lines
+    ingested into it are kept (they're small) and come back on top of the
+    reloaded frame, at the same revision.
+    """
+
+    def __init__(self, max_bytes=MAX_DATASET_BYTES):
+        self.max_bytes = max_bytes
+        self.datasets = {}
+        self.frames = OrderedDict()   # name -> (frame, bytes), LRU order
+        self.hooks = []
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def register(self, name, paths, rows=None, sample=None, seed=42):
+        dataset = Dataset(name, paths, rows, sample, seed)
+        with self.lock:
+            self.datasets[name] = dataset
+            self.frames.pop(name, None)
+        return dataset
+
+    def register_config(self, path):
+        # Relative paths in the file are relative to the file itself
+        with open(path) as f:
+            entries = json.load(f)
+        root = os.path.dirname(os.path.abspath(path))
+        for entry in entries:
+            paths = entry["path"] if isinstance(entry["path"], list) else [entry["path"]]
+            self.register(
+                entry["name"], [os.path.join(root, p) for p in paths],
+                entry.get("rows"), entry.get("sample"), entry.get("seed", 42)
             )
-        
-        print(f"Loaded {len(cached_df_5lakh)} rows")
 
-    return cached_df_5lakh
+    def on_evict(self, hook):
+        # hook(data_version) runs for every evicted dataset
+        self.hooks.append(hook)
+
+    def derived(self, name, key, df, build):
+        """
+        build(df) for a dataset's loaded frame df, computed once per data
+        version and kept on the dataset until it's evicted (e.g. the KNN
+        index of a non-default dataset).
+        """
+        dataset = self.dataset(name)
+        version = data_version(df)
+        with dataset.derived_lock:
+            entry = dataset.derived.get(key)
+            if entry is None or entry[0] != version:
+                entry = (version, build(df))
+                dataset.derived[key] = entry
+        return entry[1]
+
+    def dataset(self, name):
+        dataset = self.datasets.get(name)
+        if dataset is None:
+            raise UnknownDataset(f"Unknown dataset {name!r} (expected one of {', '.join(self.datasets)})")
+        return dataset
+
+    def get(self, name=DEFAULT_DATASET):
+        """
+        A zero-copy view of the dataset's frame: callers may add or replace
+        columns on their view (copy-on-write) without affecting anyone else.
+        Raises UnknownDataset, or FileNotFoundError when no source exists.
+        """
+        dataset = self.dataset(name)
+        with dataset.lock:
+            with self.lock:
+                entry = self.frames.get(name)
+                if entry is not None:
+                    self.frames.move_to_end(name)
+                    return entry[0].copy(deep=False)
+
+            frame = dataset.load()
+            names, evicted = self.keep(name, frame)
+
+        for old_name in names:
+            old = self.datasets[old_name]
+            with old.derived_lock:
+                old.derived.clear()
+        for version in evicted:
+            for hook in self.hooks:
+                hook(version)
+        return frame.copy(deep=False)
+
+    def keep(self, name, frame):
+        # Returns (evicted dataset names, data versions no longer loaded)
+        size = int(frame.memory_usage(deep=True).sum())
+        names, evicted = [], []
+        with self.lock:
+            self.frames[name] = (frame, size)
+            self.loads += 1
+            while len(self.frames) > 1 and sum(s for _, s in self.frames.values()) > self.max_bytes:
+                old_name, (old, _) = self.frames.popitem(last=False)
+                print(f"[INFO] Evicting dataset {old_name} (memory budget)")
+                self.evictions += 1
+                names.append(old_name)
+                version = old.attrs["data_version"]
+                # Another loaded dataset may be the same content
+                if all(f.attrs["data_version"] != version for f, _ in self.frames.values()):
+                    evicted.append(version)
+        return names, evicted
+
+    def rows_of(self, name, nrows):
+        """
+        The dataset name limited to its first nrows rows, registered as a
+        dataset of its own ("name:nrows") the first time it's asked for.
+        """
+        child = f"{name}:{nrows}"
+        with self.lock:
+            known = child in self.datasets
+        if not known:
+            parent = self.dataset(name)
+            start = parent.rows[0] if parent.rows else 0
+            stop = start + nrows
+            if parent.rows and parent.rows[1] is not None:
+                stop = min(stop, parent.rows[1])
+            self.register(child, parent.paths, (start, stop), parent.sample, parent.seed)
+        return self.get(child)
 
+    def status(self):
+        with self.lock:
+            loaded = {name: size for name, (_, size) in self.frames.items()}
+            return {
+                "max_mb": round(self.max_bytes / 2 ** 20, 1),
+                "loaded_mb": round(sum(loaded.values()) / 2 ** 20, 1),
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "datasets": [
+                    {
+                        **dataset.describe(),
+                        "loaded": name in loaded,
+                        "mb": round(loaded[name] / 2 ** 20, 2) if name in loaded else None,
+                        "data_version": self.frames[name][0].attrs["data_version"] if name in loaded else None,
+                    }
+                    for name, dataset in self.datasets.items()
+                ],
+            }
+
+
+DATASETS = DatasetRegistry()
+DATASETS.register(DEFAULT_DATASET, LOCAL_DATA_PATH)
+DATASETS.register(FULL_DATASET, [
+    os.path.join(DATA_DIR, "online_retail.csv"),
+    os.path.join(DATA_DIR, "online_retail.xlsx"),
+])
+if DATASETS_CONFIG:
+    DATASETS.register_config(DATASETS_CONFIG)
+
+
+def load_dataset(name=DEFAULT_DATASET):
+    return DATASETS.get(name)
+
+
+def load_default_data():
+    """
+    A zero-copy view of the default dataset (the 16k line UCI sample).
+    """
+    return DATASETS.get(DEFAULT_DATASET)
+
+
+def load_5lakh_data(nrows=10000):
+    """
+    The full retail dataset, or its first nrows rows (each nrows is a
+    dataset of its own, so later calls with another nrows get their rows).
+    Both go through the Arrow cache, so only the first load ever parses
+    the source file. nrows=None loads every row.
+    """
+    if nrows is None:
+        return DATASETS.get(FULL_DATASET)
+    return DATASETS.rows_of(FULL_DATASET, nrows)
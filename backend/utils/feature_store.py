@@ -0,0 +1,246 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import DATASETS, add_derived_columns, data_version, is_revision_of, with_appended_rows
+from utils.metrics import stage
+from utils.transactions import TransactionStore, get_transaction_store
+
+# Window used for the "next month" spend target of the decision tree
+RECENT_WINDOW_DAYS = 30
+
+# Customers per chunk for models that stream the table (IncrementalPCA)
+CHUNK_ROWS = 2048
+
+SUM_COLUMNS = ["total_spend", "total_items", "total_orders", "n_lines"]
+COUNT_COLUMNS = ["total_items", "total_orders", "n_lines"]
+
+
+# ---------------------------------------------------------
+# CUSTOMER FEATURES
+# ---------------------------------------------------------
+def customer_lines(raw_df):
+    """
+    The per-line columns of appended lines (fold_customer_lines) that
+    belong to a known customer.
+    """
+    if "Amount" not in raw_df.columns:
+        raw_df = add_derived_columns(raw_df)
+    df = raw_df[raw_df["CustomerID"].notna()]
+
+    return pd.DataFrame({
+        "CustomerID": df["CustomerID"].to_numpy(),
+        "InvoiceNo": df["InvoiceNo"].astype(str).to_numpy(),
+        "Quantity": df["Quantity"].to_numpy(),
+        "Amount": df["Amount"].to_numpy(),
+        "InvoiceDate": df["InvoiceDate"].to_numpy(),
+    })
+
+
+def finish_features(customer, recent_lines, max_date):
+    customer["avg_order_value"] = customer["total_spend"] / customer["n_lines"]
+    customer["recency"] = (max_date - customer["last_purchase"]).dt.days
+
+    recent_spend = recent_lines.groupby("CustomerID")["Amount"].sum()
+    customer["next_month_spend"] = customer["CustomerID"].map(recent_spend).fillna(0)
+    return customer
+
+
+def build_features(raw_df, store=None):
+    """
+    The customer table from the integer-coded transactions: every customer
+    is one contiguous run of lines (utils/transactions.py), so the
+    aggregates are segment reductions over the runs instead of a groupby
+    on CustomerID / InvoiceNo strings. store must come from raw_df.
+    """
+    if "Amount" not in raw_df.columns:
+        raw_df = add_derived_columns(raw_df)
+    if store is None:
+        store = TransactionStore(raw_df)
+
+    with stage("features.lines"):
+        offsets = store.customer_line_offsets()
+        # Lines past the last customer run have no customer
+        known = slice(0, int(offsets[-1]))
+        amount = store.amount(raw_df)[known]
+        quantity = store.quantity[known].astype("int64")
+        timestamp = store.timestamp[known].view("datetime64[us]")
+
+    with stage("features.groupby"):
+        n_lines = np.diff(offsets)
+        present = n_lines > 0
+        starts = offsets[:-1][present]
+        customer = pd.DataFrame({
+            "CustomerID": store.customers[present],
+            "total_spend": np.add.reduceat(amount, starts),
+            "total_items": np.add.reduceat(quantity, starts),
+            "total_orders": np.diff(store.customer_invoices)[present].astype("int64"),
+            "n_lines": n_lines[present],
+            "first_purchase": np.minimum.reduceat(timestamp, starts),
+            "last_purchase": np.maximum.reduceat(timestamp, starts),
+        })
+
+    with stage("features.finish"):
+        max_date = pd.Timestamp(timestamp.max())
+        recent = np.flatnonzero(timestamp >= (max_date - pd.Timedelta(days=RECENT_WINDOW_DAYS)).to_datetime64())
+        recent_lines = pd.DataFrame({
+            "CustomerID": store.customers[store.customer[recent]],
+            "InvoiceNo": store.invoices[store.invoice[recent]].astype(object),
+            "Quantity": quantity[recent],
+            "Amount": amount[recent],
+            "InvoiceDate": timestamp[recent],
+        })
+        customer = finish_features(customer, recent_lines, max_date)
+
+    return {
+        "customer": customer,
+        "recent_lines": recent_lines,
+        "max_date": max_date,
+    }
+
+
+def compute_customer_features(raw_df):
+    """
+    Aggregates raw transaction data into one row per customer, in a single
+    vectorized groupby:
+
+      total_spend, total_items, total_orders, n_lines, avg_order_value,
+      first_purchase, last_purchase, recency, next_month_spend
+
+    (recency / total_orders / total_spend are the R, F and M of RFM.)
+    """
+    return build_features(raw_df)["customer"]
+
+
+def feature_chunks(customer, columns, chunk_rows=CHUNK_ROWS, min_rows=1):
+    """
+    The given columns of a customer table, chunk_rows customers at a time,
+    so a model can be fitted without the full (scaled) matrix in memory.
+    Rows are sliced before the columns are selected: only one chunk is
+    copied at a time. A tail shorter than min_rows is folded into the
+    last chunk.
+    """
+    start = 0
+    while start < len(customer):
+        stop = start + chunk_rows
+        if len(customer) - stop < min_rows:
+            stop = len(customer)
+        yield customer.iloc[start:stop][columns]
+        start = stop
+
+
+_features = {}
+_lock = threading.Lock()
+
+
+def get_customer_features(raw_df):
+    """
+    Customer features for raw_df, computed once per dataset version.
+
+    Returns a shallow copy so callers can add their own columns (cluster,
+    x / y...) without touching the cached frame. Frames without a data
+    version (not from the loader) are computed every time.
+    """
+    version = data_version(raw_df)
+    if version is None:
+        return compute_customer_features(raw_df)
+
+    with _lock:
+        entry = _features.get(version)
+        if entry is None:
+            entry = build_features(with_appended_rows(raw_df), get_transaction_store(raw_df))
+            _features[version] = entry
+
+    customer = entry["customer"].copy(deep=False)
+    # Lets models fitted on the table be keyed by the dataset version
+    customer.attrs["data_version"] = version
+    return customer
+
+
+def get_customer_row(raw_df, customer_id):
+    """
+    Feature row of one customer as a dict (None if unknown). Uses a hash
+    index built once per version instead of filtering the table.
+    """
+    get_customer_features(raw_df)
+
+    with _lock:
+        entry = _features[data_version(raw_df)]
+        if "index" not in entry:
+            entry["index"] = pd.Index(entry["customer"]["CustomerID"])
+        index = entry["index"]
+        customer = entry["customer"]
+
+    if customer_id not in index:
+        return None
+    return customer.iloc[index.get_loc(customer_id)].to_dict()
+
+
+def fold_customer_lines(raw_df, old_version, new_version, new_rows, new_orders):
+    """
+    Fold freshly appended invoice lines into the cached features of
+    old_version and store the result as new_version. Only touches the
+    per-customer table and the recent-spend window, never the history.
+
+    new_orders maps CustomerID -> number of invoices seen for the first time.
+    """
+    lines = customer_lines(new_rows)
+
+    with _lock:
+        entry = _features.pop(old_version, None)
+        if entry is None:
+            # Nothing cached yet (or invalidated): one full build covers it
+            _features[new_version] = build_features(with_appended_rows(raw_df), get_transaction_store(raw_df))
+            return
+
+        delta = lines.groupby("CustomerID").agg(
+            total_spend=("Amount", "sum"),
+            total_items=("Quantity", "sum"),
+            n_lines=("Amount", "size"),
+            first_purchase=("InvoiceDate", "min"),
+            last_purchase=("InvoiceDate", "max"),
+        )
+        delta["total_orders"] = new_orders.reindex(delta.index, fill_value=0)
+
+        customer = entry["customer"].set_index("CustomerID")
+        index = customer.index.union(delta.index)
+        customer = customer.reindex(index)
+        delta = delta.reindex(index)
+
+        for col in SUM_COLUMNS:
+            customer[col] = customer[col].fillna(0) + delta[col].fillna(0)
+        customer[COUNT_COLUMNS] = customer[COUNT_COLUMNS].astype("int64")
+        customer["first_purchase"] = pd.concat([customer["first_purchase"], delta["first_purchase"]], axis=1).min(axis=1)
+        customer["last_purchase"] = pd.concat([customer["last_purchase"], delta["last_purchase"]], axis=1).max(axis=1)
+
+        max_date = max(entry["max_date"], lines["InvoiceDate"].max()) if len(lines) else entry["max_date"]
+        recent_lines = pd.concat([entry["recent_lines"], lines], ignore_index=True)
+        recent_lines = recent_lines[recent_lines["InvoiceDate"] >= max_date - pd.Timedelta(days=RECENT_WINDOW_DAYS)]
+
+        customer = finish_features(customer.reset_index(), recent_lines, max_date)
+        _features[new_version] = {
+            "customer": customer,
+            "recent_lines": recent_lines,
+            "max_date": max_date,
+        }
+
+
+def drop_dataset(base_version):
+    # Registry eviction hook: the features of every revision of a dataset
+    with _lock:
+        for version in [v for v in _features if is_revision_of(v, base_version)]:
+            del _features[version]
+
+
+DATASETS.on_evict(drop_dataset)
+
+
+def invalidate_customer_features(version=None):
+    """
+    Drop the cached features of one dataset version, or of all of them.
+    """
+    with _lock:
+        if version is None:
+            _features.clear()
+        else:
+            _features.pop(version, None)
@@ -0,0 +1,252 @@
+import heapq
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import DATASETS, add_derived_columns, append_rows, data_version, with_appended_rows
+from utils.feature_store import fold_customer_lines
+from utils.transactions import get_transaction_store
+from ml.sales_cube import SalesCube
+from ml.timeseries import summarize_peaks
+
+REQUIRED_COLUMNS = ["InvoiceNo", "Description", "Quantity", "InvoiceDate", "UnitPrice", "CustomerID"]
+
+
+# ---------------------------------------------------------
+# ROW NORMALISATION
+# ---------------------------------------------------------
+def normalize_rows(rows):
+    """
+    Coerce incoming invoice lines (CSV chunk / JSON records) to the dtypes
+    of the loaded data. Raises ValueError when required columns are missing.
+    """
+    missing = [col for col in REQUIRED_COLUMNS if col not in rows.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    rows = rows.copy()
+    rows["InvoiceNo"] = rows["InvoiceNo"].astype(str)
+    rows["Description"] = rows["Description"].astype("string")
+    rows["Quantity"] = pd.to_numeric(rows["Quantity"]).astype("int64")
+    rows["InvoiceDate"] = pd.to_datetime(rows["InvoiceDate"])
+    rows["UnitPrice"] = pd.to_numeric(rows["UnitPrice"]).astype("float64")
+    rows["CustomerID"] = pd.to_numeric(rows["CustomerID"], errors="coerce").astype("float64")
+    return add_derived_columns(rows.reset_index(drop=True))
+
+
+def basket_lines(df):
+    """
+    Lines that count towards item co-occurrence (same filter as apriori.py:
+    a description and a positive quantity).
+    """
+    lines = df[df["Description"].notna() & (df["Quantity"] > 0)]
+    return lines["InvoiceNo"].astype(str), lines["Description"].astype(str)
+
+
+# ---------------------------------------------------------
+# LIVE AGGREGATES
+# ---------------------------------------------------------
+# Invoices still taking new lines, most recent first; older ones are closed
+OPEN_INVOICES = 10000
+# Pair-count increments folded into the sparse pair matrix past this many
+MAX_PAIR_DELTA = 100000
+
+
+class LiveAggregates:
+    """
+    Aggregates over one loaded dataset that new invoice lines are folded
+    into as they arrive: the sales cube (quantity / revenue by day, hour,
+    weekday, country and product), item-pair co-occurrence counts and
+    (through the feature store) the customer table.
+    Reads never rescan the transaction history.
+
+    Pair counts are a sparse int32 item x item matrix (seeded from the
+    transaction store's basket) plus the increments of recent ingests,
+    folded into the matrix once they reach MAX_PAIR_DELTA entries. The
+    items of an invoice are only held while it is open (one of the last
+    OPEN_INVOICES invoices lines arrived for); a late line for a seeded
+    invoice reads its items back from the store, one for an ingested
+    invoice closed since only pairs with the lines of its own chunk.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.lock = threading.Lock()
+        self.rows_appended = 0
+
+        # Lines ingested before an eviction are part of the seed
+        self.cube = SalesCube(with_appended_rows(df))
+        self.store = get_transaction_store(df)
+        self.new_invoices = set()       # invoices first seen by an ingest
+
+        self.item_ids = {}              # description -> item id
+        self.items = []                 # item id -> description
+        self.open_items = OrderedDict() # open invoice -> set of item ids
+        self.pair_delta = {}            # item id -> Counter(other item id -> shared invoices)
+        self.n_delta = 0
+        self.seed_pairs(self.store)
+
+    def item_id(self, description):
+        item = self.item_ids.get(description)
+        if item is None:
+            item = len(self.items)
+            self.item_ids[description] = item
+            self.items.append(description)
+        return item
+
+    def seed_pairs(self, store):
+        # One sparse product for the whole history instead of a loop per invoice
+        basket, _, item_names = store.basket()
+        basket = basket.astype("int32")
+
+        for name in item_names:
+            self.item_id(str(name))
+        # store product code -> item id, to read closed invoices back
+        self.store_items = np.array([self.item_ids.get(str(name), -1) for name in store.products], dtype="int32")
+
+        pairs = (basket.T @ basket).tocsr()
+        pairs.setdiag(0)
+        pairs.eliminate_zeros()
+        self.pairs = pairs
+
+    def invoice_items(self, invoice):
+        """
+        The item ids of an invoice, kept open (most recent last) until
+        OPEN_INVOICES newer invoices have taken lines.
+        """
+        current = self.open_items.get(invoice)
+        if current is not None:
+            self.open_items.move_to_end(invoice)
+            return current
+
+        current = set()
+        code = self.store.invoice_code(invoice)
+        if code is not None:
+            lines = self.store.invoice_lines(code)
+            keep = (self.store.product[lines] >= 0) & (self.store.quantity[lines] > 0)
+            current = set(self.store_items[self.store.product[lines][keep]].tolist())
+
+        self.open_items[invoice] = current
+        while len(self.open_items) > OPEN_INVOICES:
+            self.open_items.popitem(last=False)
+        return current
+
+    def fold_pairs(self):
+        # Move the pending increments into the sparse matrix (grown for new items)
+        from scipy.sparse import coo_matrix   # deferred: keeps scipy out of startup
+        rows, cols, counts = [], [], []
+        for item, others in self.pair_delta.items():
+            rows.extend([item] * len(others))
+            cols.extend(others.keys())
+            counts.extend(others.values())
+
+        n = len(self.items)
+        self.pairs.resize((n, n))
+        delta = coo_matrix((np.array(counts, dtype="int32"), (rows, cols)), shape=(n, n))
+        self.pairs = (self.pairs + delta.tocsr()).tocsr()
+        self.pair_delta = {}
+        self.n_delta = 0
+
+    def append(self, rows):
+        """
+        Fold a chunk of new invoice lines into every aggregate.
+        Cost is proportional to the chunk, not to the history.
+        """
+        rows = normalize_rows(rows)
+
+        with self.lock:
+            self.cube.add(rows)
+
+            # Invoices seen for the first time are new orders for their customer
+            invoice_no = rows["InvoiceNo"]
+            seen = (self.store.invoice_codes(invoice_no) >= 0) | invoice_no.isin(self.new_invoices)
+            first_seen = rows[~seen].drop_duplicates("InvoiceNo")
+            new_orders = first_seen.dropna(subset=["CustomerID"]).groupby("CustomerID").size()
+            self.new_invoices.update(first_seen["InvoiceNo"])
+
+            invoices, descriptions = basket_lines(rows)
+            for invoice, description in zip(invoices, descriptions):
+                current = self.invoice_items(invoice)
+                item = self.item_id(description)
+                if item in current:
+                    continue
+
+                counts = self.pair_delta.setdefault(item, Counter())
+                for other in current:
+                    counts[other] += 1
+                    self.pair_delta.setdefault(other, Counter())[item] += 1
+                self.n_delta += 2 * len(current)
+                current.add(item)
+
+            if self.n_delta >= MAX_PAIR_DELTA:
+                self.fold_pairs()
+
+            old_version = data_version(self.df)
+            new_version = append_rows(self.df, rows)
+            fold_customer_lines(self.df, old_version, new_version, rows, new_orders)
+            self.rows_appended += len(rows)
+
+        return {"rows_added": len(rows), "data_version": new_version}
+
+    def peak_insights(self):
+        with self.lock:
+            return summarize_peaks(self.cube.counters())
+
+    def top_pairs(self, description, top_k=10):
+        with self.lock:
+            item = self.item_ids.get(description)
+            if item is None:
+                return []
+
+            counts = {}
+            if item < self.pairs.shape[0]:
+                start, end = self.pairs.indptr[item], self.pairs.indptr[item + 1]
+                counts = dict(zip(self.pairs.indices[start:end].tolist(), self.pairs.data[start:end].tolist()))
+            for other, count in self.pair_delta.get(item, {}).items():
+                counts[other] = counts.get(other, 0) + count
+
+        top = heapq.nsmallest(top_k, counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [{"product": self.items[other], "invoices": int(count)} for other, count in top]
+
+    def status(self):
+        with self.lock:
+            return {
+                "data_version": data_version(self.df),
+                "rows_appended": self.rows_appended,
+                "invoices": len(self.store.invoices) + len(self.new_invoices),
+                "products": len(self.items),
+            }
+
+
+_live = {}
+_live_lock = threading.Lock()
+
+
+def get_live_aggregates(df):
+    """
+    The LiveAggregates of a loaded frame, seeded from it on first use.
+    """
+    # Per dataset too: datasets of one source ingest separately
+    key = (df.attrs.get("dataset"), df.attrs.get("data_version", id(df)))
+    with _live_lock:
+        live = _live.get(key)
+        if live is None:
+            live = LiveAggregates(df)
+            _live[key] = live
+    return live
+
+
+def drop_dataset(base_version):
+    # Registry eviction hook: rebuilt from the reloaded frame and its
+    # ingested lines on next use
+    with _live_lock:
+        for key in [k for k in _live if k[1] == base_version]:
+            del _live[key]
+
+
+DATASETS.on_evict(drop_dataset)
+
+
+def ingest_rows(df, rows):
+    return get_live_aggregates(df).append(rows)
@@ -0,0 +1,474 @@
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from multiprocessing import get_context
+
+from utils import data_loader
+from utils.data_loader import CACHE_DIR, DATASETS, DEFAULT_DATASET, FULL_DATASET, UnknownDataset
+from utils.data_loader import data_version, load_dataset
+from utils.feature_store import get_customer_features
+from utils.ingest import get_live_aggregates
+from utils.response_cache import dumps
+from utils.workers import MAX_WORKERS, SCHEDULER
+from ml.apriori import run_apriori, run_mba, save_output
+from ml.knn import build_knn
+from ml.similarity_table import TOP_K, load_or_build_table, page
+# ml.kmeans / ml.decision_tree / ml.pca (scikit-learn) are imported by the
+# jobs using them, not at server startup
+from ml.forecast import HORIZON, forecast_catalogue, forecast_rows
+
+JOB_DIR = os.path.join(CACHE_DIR, "jobs")
+# Jobs running at the same time; the rest wait in the queue
+JOB_THREADS = 2
+TERMINAL = ("done", "failed", "cancelled")
+# Seconds between progress / cancel checks of a job in a worker process
+POLL_SECONDS = 0.2
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---------------------------------------------------------
+# JOB KINDS
+# ---------------------------------------------------------
+# Each kind is job_fn(job, **params) returning (or yielding) result rows.
+# It reports progress with job.report(), which also raises JobCancelled
+# once the job has been cancelled. Long loops get job.progress_between()
+# as their progress callback, so they can be cancelled while they run.
+
+def apriori_job(job, min_support=0.001, min_confidence=0.01, max_len=4, dataset=FULL_DATASET):
+    job.report(0.0, "loading data")
+    df = load_dataset(dataset)
+
+    job.report(0.2, "mining itemsets")
+    result = run_apriori(df, min_support, min_confidence, max_len, progress=job.progress_between(0.2, 0.9))
+    job.summary["message"] = result["message"]
+
+    job.report(0.9, "writing rules")
+    # Same order as /frequently-bought-together: bigger combinations first
+    return sorted(result["rules"], key=lambda r: (r["combination_size"], r["lift"]), reverse=True)
+
+
+def mba_job(job, save=False, n_jobs=1):
+    """
+    The full market basket run of ml/apriori.py; save=true also replaces
+    cached/apriori_output.json.gz (picked up on the next restart).
+    """
+    job.report(0.0, "mining itemsets")
+    result = run_mba(n_jobs, progress=job.progress_between(0.0, 0.9))
+    job.summary.update(result["meta"], frequent_itemsets=len(result["frequent_itemsets"]))
+
+    if save:
+        job.report(0.9, "saving output")
+        save_output(result)
+    return result["rules"]
+
+
+def similar_products_job(job, top_k=TOP_K, chunk=500, dataset=DEFAULT_DATASET):
+    df = load_dataset(dataset)
+    job.report(0.0, "building index")
+    catalogue, _, matrix = build_knn(df)
+
+    job.report(0.3, "computing similarity table")
+    indices, sims = load_or_build_table(matrix)
+
+    total = len(catalogue.names)
+    for cursor in range(0, total, chunk):
+        job.report(0.5 + 0.5 * cursor / total, "writing products")
+        products = page(catalogue.names, indices, sims, cursor, chunk, top_k)["products"]
+        for product, similar in products.items():
+            yield {"product": product, "similar": similar}
+
+
+def segmentation_job(job, k=3, mode="full", dataset=DEFAULT_DATASET):
+    from ml.kmeans import run_kmeans
+    job.report(0.0, "fitting kmeans")
+    return run_kmeans(load_dataset(dataset), k, mode)
+
+
+def sweep_job(job, k_min=2, k_max=10, mode="full", dataset=DEFAULT_DATASET):
+    from ml.kmeans import kmeans_sweep
+    job.report(0.0, "fitting kmeans per k")
+    sweep = kmeans_sweep(
+        get_customer_features(load_dataset(dataset)), k_min, k_max, mode, progress=job.progress_between(0.0, 1.0)
+    )
+    job.summary.update(mode=mode, best_k=sweep["best_k"])
+    return [
+        {"k": k, "inertia": inertia, "silhouette": silhouette}
+        for k, inertia, silhouette in zip(sweep["k"], sweep["inertia"], sweep["silhouette"])
+    ]
+
+
+def spend_prediction_job(job, model="tree", dataset=DEFAULT_DATASET):
+    from ml.decision_tree import run_decision_tree
+    job.report(0.0, "fitting spend model")
+    return run_decision_tree(load_dataset(dataset), model)
+
+
+def spend_model_job(job, model="tree", dataset=DEFAULT_DATASET):
+    """
+    Trains the spend model of the current data version (run after ingests,
+    or on a schedule); the result row holds its holdout metrics.
+    """
+    from ml.decision_tree import spend_model_metrics
+    df = load_dataset(dataset)
+    job.report(0.0, "training spend model")
+    metrics = spend_model_metrics(get_customer_features(df), model)
+    job.summary.update(version=data_version(df), **metrics)
+    return [metrics]
+
+
+def pca_job(job, n_components=2, mode="full", dataset=DEFAULT_DATASET):
+    from ml.pca import run_pca
+    job.report(0.0, "fitting pca")
+    result = run_pca(load_dataset(dataset), n_components, mode)
+    job.summary["explained_variance"] = result["explained_variance"]
+    return result["data"]
+
+
+def forecast_job(job, by="product", measure="quantity", model="ets", horizon=HORIZON, hourly=False,
+                 dataset=DEFAULT_DATASET):
+    """
+    The whole catalogue forecast (e.g. nightly); the rows also warm the
+    forecast used by /forecast for the same data version.
+    """
+    df = load_dataset(dataset)
+    job.report(0.0, "forecasting")
+    # Off the request path: the blocks may use the whole worker pool
+    cube = get_live_aggregates(df).cube
+    result = forecast_catalogue(cube, data_version(df), by, measure, model, horizon, n_jobs=MAX_WORKERS)
+    job.summary.update(dates=result["dates"], history_days=result["history_days"])
+
+    job.report(0.9, "writing forecasts")
+    return forecast_rows(result, hourly=hourly)
+
+
+JOB_KINDS = {
+    "apriori": apriori_job,
+    "mba": mba_job,
+    "similar-products": similar_products_job,
+    "customer-segmentation": segmentation_job,
+    "kmeans-sweep": sweep_job,
+    "customer-spend-prediction": spend_prediction_job,
+    "spend-model": spend_model_job,
+    "pca-visualization": pca_job,
+    "forecast": forecast_job,
+}
+# CPU-bound kinds run on the scheduler's worker pool (pure-Python mining
+# and fits would hold the GIL and stall the API threads). forecast stays
+# on a job thread: it reads this process's live sales cube and sends its
+# blocks to the worker pool itself.
+PROCESS_KINDS = set(JOB_KINDS) - {"forecast"}
+
+
+def write_rows(job, rows, path):
+    with open(path, "wb") as f:
+        for row in rows:
+            f.write(dumps(row) + b"\n")
+            job.rows += 1
+
+
+# ---------------------------------------------------------
+# JOBS IN WORKER PROCESSES
+# ---------------------------------------------------------
+class RemoteJob:
+    """
+    The job as a worker process sees it: report() goes through a dict
+    shared with the server (a multiprocessing manager), which also
+    carries the cancel flag.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.rows = 0
+        self.summary = {}
+
+    def report(self, progress, stage=None):
+        if self.state["cancelled"]:
+            raise JobCancelled()
+        update = {"progress": round(min(max(progress, 0.0), 1.0), 4)}
+        if stage is not None:
+            update["stage"] = stage
+        self.state.update(update)
+
+    def progress_between(self, start, end):
+        return lambda fraction: self.report(start + (end - start) * fraction)
+
+
+def run_in_worker(kind, params, dataset, chunks, result_path, state):
+    """
+    Worker-process side of a PROCESS_KINDS job: rows go straight to
+    result_path; returns (rows, summary). chunks are the server's ingested
+    lines, so the job sees the same data version as the server.
+    """
+    if dataset is not None and dataset["name"] not in DATASETS.datasets:
+        # e.g. the nrows datasets registered by rows_of at runtime
+        DATASETS.register(**dataset)
+    data_loader.appended_chunks.clear()
+    data_loader.appended_chunks.update(chunks)
+
+    job = RemoteJob(state)
+    write_rows(job, JOB_KINDS[kind](job, **params), result_path)
+    return job.rows, job.summary
+
+
+# ---------------------------------------------------------
+# JOB
+# ---------------------------------------------------------
+class Job:
+    """
+    One submitted analysis. Its status is saved as <id>.json and its
+    result rows as <id>.ndjson (one JSON document per line) in JOB_DIR.
+    """
+
+    def __init__(self, kind, params, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.progress = 0.0
+        self.stage = "queued"
+        self.error = None
+        self.rows = 0
+        self.summary = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def meta_path(self):
+        return os.path.join(JOB_DIR, f"{self.id}.json")
+
+    @property
+    def result_path(self):
+        return os.path.join(JOB_DIR, f"{self.id}.ndjson")
+
+    def report(self, progress, stage=None):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = round(min(max(progress, 0.0), 1.0), 4)
+        if stage is not None:
+            self.stage = stage
+
+    def progress_between(self, start, end):
+        """
+        A progress(fraction) callback for a long loop that maps its 0..1
+        onto start..end of this job (raises JobCancelled like report()).
+        """
+        return lambda fraction: self.report(start + (end - start) * fraction)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "error": self.error,
+            "rows": self.rows,
+            "summary": self.summary,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["kind"], data["params"], data["id"])
+        for key in ("status", "progress", "stage", "error", "rows", "summary", "created", "started", "finished"):
+            setattr(job, key, data[key])
+        return job
+
+    def save(self):
+        # Saved from the job's thread and from cancel requests: one temp
+        # file per writer, so they never write into each other's
+        os.makedirs(JOB_DIR, exist_ok=True)
+        tmp_path = f"{self.meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, self.meta_path)
+
+
+# ---------------------------------------------------------
+# JOB MANAGER
+# ---------------------------------------------------------
+class JobManager:
+    """
+    Runs jobs from a small thread pool and keeps their status in memory and
+    on disk; PROCESS_KINDS jobs are handed from their thread to the
+    scheduler's worker pool. Saved jobs are read by load_saved() (server
+    startup): those left unfinished by a restart are marked failed,
+    finished results stay available across restarts.
+    """
+
+    def __init__(self, max_workers=JOB_THREADS):
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self.manager = None   # started with the first job run in a worker
+
+    def load_saved(self):
+        if not os.path.isdir(JOB_DIR):
+            return
+
+        for name in os.listdir(JOB_DIR):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(JOB_DIR, name), encoding="utf-8") as f:
+                    job = Job.from_dict(json.load(f))
+            except (OSError, json.JSONDecodeError, KeyError, TypeError) as e:
+                # A corrupt / half-written status file only loses that job
+                print(f"[ERROR] Skipping job file {name}: {type(e).__name__}: {e}")
+                continue
+            if job.status not in TERMINAL:
+                job.status = "failed"
+                job.error = "Interrupted by a server restart"
+                job.save()
+            self.jobs[job.id] = job
+
+    def submit(self, kind, params=None):
+        """
+        Queue a job. Raises ValueError for an unknown kind, parameters
+        the kind does not take or an unknown dataset.
+        """
+        params = params or {}
+        job_fn = JOB_KINDS.get(kind)
+        if job_fn is None:
+            raise ValueError(f"Unknown job kind {kind!r} (expected one of {', '.join(JOB_KINDS)})")
+        try:
+            inspect.signature(job_fn).bind(None, **params)
+            if "dataset" in params:
+                DATASETS.dataset(params["dataset"])
+        except (TypeError, UnknownDataset) as e:
+            raise ValueError(str(e))
+
+        job = Job(kind, params)
+        job.save()
+        with self.lock:
+            self.jobs[job.id] = job
+            job.future = self.pool.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        job.status = "running"
+        job.started = time.time()
+        job.save()
+
+        tmp_path = job.result_path + ".tmp"
+        try:
+            if job.kind in PROCESS_KINDS:
+                self.run_remote(job, tmp_path)
+            else:
+                write_rows(job, JOB_KINDS[job.kind](job, **job.params), tmp_path)
+            job.report(1.0, "done")
+            os.replace(tmp_path, job.result_path)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+            job.stage = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] Job {job.id} ({job.kind}) failed:", job.error)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            job.finished = time.time()
+            job.save()
+
+    def run_remote(self, job, tmp_path):
+        """
+        Run job in a worker process and wait for it, mirroring its progress
+        into job and passing a cancel on, every POLL_SECONDS.
+        """
+        with self.lock:
+            if self.manager is None:
+                # spawn: like the worker pool, never fork the threaded server
+                self.manager = get_context("spawn").Manager()
+            state = self.manager.dict(progress=job.progress, stage=job.stage, cancelled=False)
+
+        dataset = job.params.get("dataset")
+        described = DATASETS.dataset(dataset).describe() if dataset is not None else None
+        chunks = {key: list(chunks) for key, chunks in data_loader.appended_chunks.items()}
+
+        pool = SCHEDULER.worker_pool()
+        try:
+            future = pool.submit(run_in_worker, job.kind, job.params, described, chunks, tmp_path, state)
+            while not wait([future], timeout=POLL_SECONDS).done:
+                if job.cancel_event.is_set():
+                    state["cancelled"] = True
+                    if future.cancel():
+                        raise JobCancelled()
+                job.progress, job.stage = state["progress"], state["stage"]
+            job.rows, summary = future.result()
+        except BrokenProcessPool:
+            SCHEDULER.pool_broken(pool)
+            raise
+        job.summary.update(summary)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return sorted(jobs, key=lambda job: job.created, reverse=True)
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued / running job (it stops at its next progress
+        report), or forget a finished one and delete its files.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+
+        if job.status in TERMINAL:
+            with self.lock:
+                self.jobs.pop(job_id, None)
+            for path in (job.meta_path, job.result_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            return job
+
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            # Never started
+            job.status = "cancelled"
+            job.stage = "cancelled"
+            job.finished = time.time()
+            job.save()
+        return job
+
+    def iter_results(self, job, offset=0, limit=None):
+        """
+        Result rows of a finished job as NDJSON lines, read lazily from disk.
+        """
+        stop = None if limit is None else offset + limit
+        with open(job.result_path, "rb") as f:
+            yield from islice(f, offset, stop)
+
+    def shutdown(self):
+        for job in self.list():
+            job.cancel_event.set()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            if self.manager is not None:
+                self.manager.shutdown()
+                self.manager = None
+
+
+JOBS = JobManager()
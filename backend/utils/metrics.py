@@ -0,0 +1,405 @@
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import numpy as np
+
+# Request latency histogram buckets (seconds), as exported to Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Latest request durations per endpoint the quantiles are computed from
+WINDOW = 1024
+# Sampling profiler: off unless PROFILING=1 (or switched on at runtime);
+# then a request sent with "X-Profile: 1" is sampled every PROFILE_INTERVAL s
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+PROFILE_INTERVAL = 0.005
+MAX_PROFILES = 20
+
+
+def rss_bytes():
+    # Resident set size of this process (0 where there is no procfs)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+def quantiles(values):
+    if not values:
+        return {f"p{int(q * 100)}": None for q in QUANTILES}
+    points = np.quantile(np.fromiter(values, dtype=float), QUANTILES)
+    return {f"p{int(q * 100)}": round(float(p), 4) for q, p in zip(QUANTILES, points)}
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# ---------------------------------------------------------
+# STAGE TIMERS
+# ---------------------------------------------------------
+class StageMetrics:
+    """
+    Wall time and resident memory growth of named stages (loader steps,
+    feature groupbys, model fits...). Worker processes record into their
+    own copy; their records are sent back with the job result and added
+    here (utils/workers.py).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def add(self, name, seconds, memory):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {
+                    "count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                    "memory_bytes": 0, "max_memory_bytes": 0, "recent": deque(maxlen=WINDOW),
+                }
+            stage["count"] += 1
+            stage["seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+            stage["memory_bytes"] += memory
+            stage["max_memory_bytes"] = max(stage["max_memory_bytes"], memory)
+            stage["recent"].append(seconds)
+
+        # Records collected for a worker job on this thread (see recording)
+        records = getattr(self.local, "records", None)
+        if records is not None:
+            records.append((name, seconds, memory))
+
+    def add_records(self, records):
+        for name, seconds, memory in records:
+            self.add(name, seconds, memory)
+
+    @contextmanager
+    def recording(self):
+        # Every stage finished in the with-block, as (name, seconds, memory bytes)
+        previous = getattr(self.local, "records", None)
+        self.local.records = []
+        try:
+            yield self.local.records
+        finally:
+            self.local.records = previous
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: {
+                    "count": s["count"],
+                    "seconds": round(s["seconds"], 4),
+                    "avg_seconds": round(s["seconds"] / s["count"], 4),
+                    "max_seconds": round(s["max_seconds"], 4),
+                    **quantiles(s["recent"]),
+                    "avg_memory_mb": round(s["memory_bytes"] / s["count"] / 2 ** 20, 2),
+                    "max_memory_mb": round(s["max_memory_bytes"] / 2 ** 20, 2),
+                    "max_memory_bytes": s["max_memory_bytes"],
+                }
+                for name, s in sorted(self.stages.items())
+            }
+
+
+STAGES = StageMetrics()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the with-block as stage `name`; memory is the growth of the
+    resident set size over the block (allocations freed before it ends
+    don't show).
+    """
+    sample = _profiled.get()
+    if sample is not None:
+        # A thread working for the profiled request (e.g. the threadpool
+        # thread of a sync endpoint): sampled from now on
+        sample["threads"].add(threading.get_ident())
+    memory = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES.add(name, time.perf_counter() - start, max(0, rss_bytes() - memory))
+
+
+def timed(name):
+    # Decorator form of stage()
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------------
+# REQUEST METRICS
+# ---------------------------------------------------------
+class RequestMetrics:
+    """
+    Latency histogram (cumulative BUCKETS) and recent-window quantiles per
+    (method, route), plus response counts per status code. Routes are the
+    path templates ("/jobs/{job_id}"), so ids don't make new series.
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def add(self, method, route, status, seconds):
+        with self.lock:
+            entry = self.endpoints.get((method, route))
+            if entry is None:
+                entry = self.endpoints[(method, route)] = {
+                    "count": 0, "seconds": 0.0, "buckets": [0] * len(BUCKETS),
+                    "statuses": {}, "recent": deque(maxlen=WINDOW),
+                }
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry["buckets"][i] += 1
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+            entry["recent"].append(seconds)
+
+    def stats(self):
+        with self.lock:
+            return {
+                f"{method} {route}": {
+                    "count": e["count"],
+                    "avg_seconds": round(e["seconds"] / e["count"], 4),
+                    **quantiles(e["recent"]),
+                    "statuses": dict(sorted(e["statuses"].items())),
+                }
+                for (method, route), e in sorted(self.endpoints.items())
+            }
+
+    def prometheus(self):
+        lines = [
+            "# HELP http_request_duration_seconds Request latency per endpoint.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            for (method, route), e in endpoints:
+                labels = f'method="{label(method)}",route="{label(route)}"'
+                for bound, count in zip(BUCKETS, e["buckets"]):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {e["count"]}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {e['seconds']:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {e['count']}")
+
+            lines.append("# HELP http_requests_total Responses per endpoint and status code.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route), e in endpoints:
+                for status, count in sorted(e["statuses"].items()):
+                    lines.append(
+                        f'http_requests_total{{method="{label(method)}",route="{label(route)}",'
+                        f'status="{status}"}} {count}'
+                    )
+
+            lines.append("# HELP http_request_duration_quantile_seconds Latency quantiles over the latest requests.")
+            lines.append("# TYPE http_request_duration_quantile_seconds gauge")
+            for (method, route), e in endpoints:
+                for name, value in quantiles(e["recent"]).items():
+                    lines.append(
+                        f'http_request_duration_quantile_seconds{{method="{label(method)}",route="{label(route)}",'
+                        f'quantile="0.{name[1:]}"}} {value}'
+                    )
+        return lines
+
+
+REQUESTS = RequestMetrics()
+
+
+# ---------------------------------------------------------
+# SAMPLING PROFILER
+# ---------------------------------------------------------
+# The sample of the request being profiled, in its context (the threads
+# it runs code on see it too)
+_profiled = contextvars.ContextVar("profiled", default=None)
+# Innermost frames of threads that are only waiting (event loop, idle pool
+# threads); samples ending there are left out of a profile
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+
+def collapsed_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Profiler:
+    """
+    Opt-in sampling profiler for single requests: while a profiled request
+    runs, a thread records each interval the stacks of the request's
+    threads only: the one that started it (the event loop) and those that
+    ran one of its stages (sync endpoints run in a threadpool thread).
+    Profiles are kept in the collapsed format flamegraph.pl, speedscope
+    and inferno read ("frame;frame;frame count" per line). One request is
+    profiled at a time; fits in worker processes show as awaiting here.
+    """
+
+    def __init__(self, enabled=PROFILING, interval=PROFILE_INTERVAL, max_profiles=MAX_PROFILES):
+        self.enabled = enabled
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.profiles = OrderedDict()
+        self.busy = threading.Lock()
+
+    def start(self, name):
+        # The running sample, or None when another request is profiled
+        if not self.busy.acquire(blocking=False):
+            return None
+        sample = {
+            "id": uuid.uuid4().hex[:12], "name": name, "started": time.time(), "stacks": {}, "samples": 0,
+            "stop": threading.Event(), "threads": {threading.get_ident()},
+        }
+        sample["thread"] = threading.Thread(target=self.sample, args=(sample,), name="profiler", daemon=True)
+        sample["thread"].start()
+        return sample
+
+    def sample(self, sample):
+        names = {}
+        while not sample["stop"].wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            sample["samples"] += 1
+            frames = sys._current_frames()
+            for ident in list(sample["threads"]):
+                frame = frames.get(ident)
+                if frame is None or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                stack = f"{names.get(ident, ident)};{collapsed_stack(frame)}"
+                sample["stacks"][stack] = sample["stacks"].get(stack, 0) + 1
+
+    def stop(self, sample, route):
+        sample["stop"].set()
+        sample["thread"].join()
+        self.busy.release()
+
+        profile_id = sample["id"]
+        self.profiles[profile_id] = {
+            "id": profile_id,
+            "request": sample["name"],
+            "route": route,
+            "started": round(sample["started"], 3),
+            "seconds": round(time.time() - sample["started"], 4),
+            "samples": sample["samples"],
+            "interval": self.interval,
+            "stacks": sample["stacks"],
+        }
+        while len(self.profiles) > self.max_profiles:
+            self.profiles.popitem(last=False)
+        return profile_id
+
+    def collapsed(self, profile_id):
+        # The profile in collapsed format, or None if unknown
+        profile = self.profiles.get(profile_id)
+        if profile is None:
+            return None
+        stacks = sorted(profile["stacks"].items(), key=lambda item: -item[1])
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def list(self):
+        return [
+            {key: value for key, value in profile.items() if key != "stacks"}
+            for profile in reversed(self.profiles.values())
+        ]
+
+
+PROFILER = Profiler()
+
+
+# ---------------------------------------------------------
+# ASGI MIDDLEWARE
+# ---------------------------------------------------------
+class MetricsMiddleware:
+    """
+    Times every HTTP request until its last body chunk is sent and adds it
+    to REQUESTS. With the profiler enabled, a request carrying the header
+    "X-Profile: 1" is sampled; the response says where its profile is
+    (X-Profile-Id, GET /profiles/{id}).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+        sample = token = None
+        if PROFILER.enabled and (b"x-profile", b"1") in scope.get("headers", []):
+            sample = PROFILER.start(f"{scope['method']} {scope['path']}")
+            if sample is not None:
+                token = _profiled.set(sample)
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if sample is not None:
+                    message["headers"] = [*message.get("headers", []), (b"x-profile-id", sample["id"].encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            REQUESTS.add(scope["method"], route, status[0], time.perf_counter() - start)
+            if sample is not None:
+                _profiled.reset(token)
+                PROFILER.stop(sample, route)
+                print(f"[INFO] Profiled {sample['name']}: GET /profiles/{sample['id']}")
+
+
+def prometheus_text(gauges=None, counters=None):
+    """
+    Everything above in the Prometheus text exposition format, plus the
+    given {metric name: (help, value)} gauges and counters (monotonic,
+    named "..._total").
+    """
+    lines = REQUESTS.prometheus()
+
+    stats = STAGES.stats()
+    lines.append("# HELP stage_duration_seconds Time spent in a named stage.")
+    lines.append("# TYPE stage_duration_seconds summary")
+    for name, s in stats.items():
+        for q in ("p50", "p95", "p99"):
+            lines.append(f'stage_duration_seconds{{stage="{label(name)}",quantile="0.{q[1:]}"}} {s[q]}')
+        lines.append(f'stage_duration_seconds_sum{{stage="{label(name)}"}} {s["seconds"]}')
+        lines.append(f'stage_duration_seconds_count{{stage="{label(name)}"}} {s["count"]}')
+    lines.append("# HELP stage_memory_growth_bytes_max Largest resident memory growth over a stage.")
+    lines.append("# TYPE stage_memory_growth_bytes_max gauge")
+    for name, s in stats.items():
+        lines.append(f'stage_memory_growth_bytes_max{{stage="{label(name)}"}} {s["max_memory_bytes"]}')
+
+    lines.append("# HELP stage_runs_total Times a named stage ran.")
+    lines.append("# TYPE stage_runs_total counter")
+    for name, s in stats.items():
+        lines.append(f'stage_runs_total{{stage="{label(name)}"}} {s["count"]}')
+
+    gauges = {"process_resident_memory_bytes": ("Resident memory of the API process.", rss_bytes()), **(gauges or {})}
+    for kind, metrics in (("gauge", gauges), ("counter", counters or {})):
+        for name, (help_text, value) in metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
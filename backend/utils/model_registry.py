@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict
+
+from utils.data_loader import CACHE_DIR, earlier_versions
+
+MODEL_DIR = os.path.join(CACHE_DIR, "models")
+# Fitted models kept in memory per process (the files stay on disk)
+MAX_MODELS = 32
+
+
+def is_revision(version):
+    # "base+...": a dataset with ingested rows
+    return "+" in version
+
+
+def model_key(name, version, params):
+    """
+    File name of a fitted model: name, dataset version and hyperparameters,
+    e.g. kmeans_d962c77c8acf70ab_k=3.joblib
+    """
+    suffix = ",".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return f"{name}_{version}" + (f"_{suffix}" if suffix else "") + ".joblib"
+
+
+# ---------------------------------------------------------
+# MODEL REGISTRY
+# ---------------------------------------------------------
+class ModelRegistry:
+    """
+    Fitted models (scalers, estimators, indexes) saved with joblib, one file
+    per (name, dataset version, hyperparameters). Files are written without
+    compression so their NumPy arrays are memory-mapped on load: a fresh
+    process (or worker) gets a model from disk without refitting or copying
+    it. Models are loaded on first use and then kept in memory (LRU).
+
+    Models of ingested revisions ("base+...") are kept in memory only: the
+    appended rows live in the process that received them, so a revision
+    names different data in every process and can't name a shared file.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, max_models=MAX_MODELS):
+        self.model_dir = model_dir
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.key_locks = {}   # key -> lock, only while it's loaded / fitted
+        self.hits = 0
+        self.loads = 0
+        self.fits = 0
+
+    def path(self, key):
+        return os.path.join(self.model_dir, key)
+
+    def get_or_fit(self, name, version, params, fit):
+        """
+        The model for (name, version, params): from memory, else from its
+        file, else fit() and saved. Frames without a version are never
+        saved (fit() runs every time), ingested revisions never written.
+        """
+        if version is None:
+            return fit()
+
+        key = model_key(name, version, params)
+        with self.lock:
+            model = self.models.get(key)
+            if model is not None:
+                self.models.move_to_end(key)
+                self.hits += 1
+                return model
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        # One load / fit per key, other keys are not held up
+        with key_lock:
+            try:
+                with self.lock:
+                    model = self.models.get(key)
+                if model is None:
+                    model = self.load_or_fit(key, fit, persist=not is_revision(version))
+                    self.remember(key, model)
+            finally:
+                # Threads already waiting hold the lock object; later ones
+                # find the model in memory (or make a fresh lock if evicted)
+                with self.lock:
+                    if self.key_locks.get(key) is key_lock:
+                        del self.key_locks[key]
+        return model
+
+    def get_or_update(self, name, version, params, fit, update):
+        """
+        Like get_or_fit, but when a model of an earlier revision of the same
+        dataset exists (see earlier_versions), the new one is
+        update(previous) instead of a fit from scratch.
+        """
+        if version is None:
+            return fit()
+
+        def fit_or_update():
+            previous = self.previous(name, version, params)
+            return fit() if previous is None else update(previous)
+        return self.get_or_fit(name, version, params, fit_or_update)
+
+    def previous(self, name, version, params):
+        import joblib   # deferred: keeps joblib out of startup
+        for earlier in earlier_versions(version):
+            key = model_key(name, earlier, params)
+            with self.lock:
+                model = self.models.get(key)
+            if model is not None:
+                return model
+            if not is_revision(earlier) and os.path.exists(self.path(key)):
+                return joblib.load(self.path(key), mmap_mode="r")
+        return None
+
+    def load_or_fit(self, key, fit, persist=True):
+        import joblib
+        path = self.path(key)
+        if persist and os.path.exists(path):
+            with self.lock:
+                self.loads += 1
+            return joblib.load(path, mmap_mode="r")
+
+        with self.lock:
+            self.fits += 1
+        model = fit()
+        if not persist:
+            return model
+        os.makedirs(self.model_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(model, tmp_path)
+        os.replace(tmp_path, path)
+        # Reload so this process shares the mapped file like every other one
+        return joblib.load(path, mmap_mode="r")
+
+    def remember(self, key, model):
+        with self.lock:
+            self.models[key] = model
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "in_memory": len(self.models),
+                "hits": self.hits,
+                "loads": self.loads,
+                "fits": self.fits,
+            }
+
+
+MODELS = ModelRegistry()
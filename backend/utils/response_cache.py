@@ -0,0 +1,151 @@
+import json
+import threading
+from collections import OrderedDict
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from utils.data_loader import data_version, version_lineage
+from utils.metrics import stage
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+# Rough per-entry bookkeeping cost (key tuple, OrderedDict node)
+ENTRY_OVERHEAD = 256
+
+
+def dumps(content):
+    # Same encoding FastAPI's JSONResponse uses
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+# ---------------------------------------------------------
+# LRU CACHE OF SERIALIZED RESPONSES
+# ---------------------------------------------------------
+class ResponseCache:
+    """
+    Serialized JSON bodies keyed by (endpoint, params, data version), with
+    LRU eviction once the summed body sizes exceed max_bytes.
+
+    When a new revision of a dataset shows up, entries of its older
+    revisions are dropped since nothing can ask for them again (those of
+    the base stay: another dataset may have the same source).
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current = {}    # version lineage -> latest version seen
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        size = len(body) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            self.note_version(key[2])
+            if key in self.entries:
+                self.bytes -= len(self.entries.pop(key)) + ENTRY_OVERHEAD
+            self.entries[key] = body
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, old = self.entries.popitem(last=False)
+                self.bytes -= len(old) + ENTRY_OVERHEAD
+                self.evictions += 1
+
+    def note_version(self, version):
+        if version is None:
+            return
+        lineage = version_lineage(version)
+        if self.current.get(lineage) == version:
+            return
+
+        self.current[lineage] = version
+        stale = [
+            k for k in self.entries
+            if k[2] is not None and k[2] != version and version_lineage(k[2]) == lineage
+        ]
+        for k in stale:
+            self.bytes -= len(self.entries.pop(k)) + ENTRY_OVERHEAD
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def cached_response(endpoint, params, df, compute):
+    """
+    JSON response for endpoint(params) on df, computed (and serialized) only
+    on a cache miss. Frames without a data version are never cached.
+    """
+    version = data_version(df)
+    if version is None:
+        result = compute()
+        with stage(f"{endpoint}.serialize"):
+            return Response(dumps(result), media_type="application/json")
+
+    key = (endpoint, tuple(sorted(params.items())), version)
+    body = RESPONSE_CACHE.get(key)
+    if body is None:
+        result = compute()
+        with stage(f"{endpoint}.serialize"):
+            body = dumps(result)
+        RESPONSE_CACHE.put(key, body)
+
+    return Response(body, media_type="application/json")
+
+
+async def cached_response_async(endpoint, params, df, compute):
+    """
+    cached_response for an async compute() (e.g. a job on the worker pool).
+    """
+    version = data_version(df)
+    if version is None:
+        result = await compute()
+        with stage(f"{endpoint}.serialize"):
+            return Response(dumps(result), media_type="application/json")
+
+    key = (endpoint, tuple(sorted(params.items())), version)
+    body = RESPONSE_CACHE.get(key)
+    if body is None:
+        result = await compute()
+        with stage(f"{endpoint}.serialize"):
+            body = dumps(result)
+        RESPONSE_CACHE.put(key, body)
+
+    return Response(body, media_type="application/json")
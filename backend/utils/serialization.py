@@ -0,0 +1,169 @@
+import json
+import numpy as np
+import pyarrow as pa
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+# Output formats of the per-customer endpoints:
+#   json      one JSON document, records (the default)
+#   chunked   the same document, streamed CHUNK_ROWS records at a time
+#   ndjson    one record per line, streamed
+#   columnar  one array per field instead of one object per record
+#   arrow     Arrow IPC stream, one record batch (binary)
+#   float32   every field as packed little-endian float32, field after field
+FORMATS = ("json", "chunked", "ndjson", "columnar", "arrow", "float32")
+CHUNK_ROWS = 1000
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "float32": "application/octet-stream",
+}
+
+# JSON output is built from Python values (ndarray.tolist()), so the
+# standard encoder is enough; same separators as FastAPI's JSONResponse
+encode_str = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode
+
+
+def encode(content):
+    return encode_str(content).encode("utf-8")
+
+
+def negotiate(accept, default="json"):
+    """
+    Format for an Accept header: the first of its media types (by q
+    value, then order) that has a format in MEDIA_TYPES.
+    """
+    if not accept:
+        return default
+
+    formats = {media: fmt for fmt, media in MEDIA_TYPES.items()}
+    ranked = []
+    for i, part in enumerate(accept.split(",")):
+        media, *options = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for option in options:
+            if option.startswith("q="):
+                try:
+                    q = float(option[2:])
+                except ValueError:
+                    pass
+        if media in formats and q > 0:
+            ranked.append((-q, i, formats[media]))
+
+    return min(ranked)[2] if ranked else default
+
+
+# ---------------------------------------------------------
+# COLUMN TABLES  ({field: 1-D NumPy array}, all of equal length)
+# ---------------------------------------------------------
+def n_rows(columns):
+    return len(next(iter(columns.values()), []))
+
+
+def records(columns):
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*(values.tolist() for values in columns.values()))]
+
+
+def select(columns, fields=None, offset=0, limit=None):
+    """
+    Subset of a table: the given fields (all by default) of rows
+    offset .. offset + limit. Raises ValueError on an unknown field.
+    """
+    if fields:
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(columns)})")
+    stop = None if limit is None else offset + limit
+    # Slices are views, nothing is copied
+    return {f: columns[f][offset:stop] for f in (fields or columns)}
+
+
+def record_chunks(columns, chunk_rows=CHUNK_ROWS):
+    for start in range(0, n_rows(columns), chunk_rows):
+        yield records({f: values[start:start + chunk_rows] for f, values in columns.items()})
+
+
+def ndjson_lines(columns, chunk_rows=CHUNK_ROWS):
+    for chunk in record_chunks(columns, chunk_rows):
+        yield "".join(encode_str(record) + "\n" for record in chunk).encode("utf-8")
+
+
+def json_chunks(columns, prefix=b"", suffix=b"", chunk_rows=CHUNK_ROWS):
+    """
+    A JSON array of the records, wrapped in prefix / suffix, produced
+    chunk by chunk so the whole body never sits in memory.
+    """
+    yield prefix + b"["
+    sep = b""
+    for chunk in record_chunks(columns, chunk_rows):
+        yield sep + encode(chunk)[1:-1]
+        sep = b","
+    yield b"]" + suffix
+
+
+def arrow_stream(columns, envelope=None):
+    """
+    Arrow IPC stream of the table. The columns are wrapped, not converted;
+    envelope goes into the schema metadata as JSON.
+    """
+    table = pa.table({f: pa.array(values) for f, values in columns.items()})
+    if envelope is not None:
+        table = table.replace_schema_metadata({"envelope": encode_str(envelope)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def packed_float32(columns):
+    # Column-major: all values of the first field, then the second, ...
+    if not columns:
+        return b""
+    return np.concatenate([np.asarray(v, dtype="<f4") for v in columns.values()]).tobytes()
+
+
+# ---------------------------------------------------------
+# RESPONSES
+# ---------------------------------------------------------
+def table_response(columns, fmt="json", envelope=None, total=None):
+    """
+    Response for a table in one of FORMATS. envelope holds the other keys
+    of the document when the records sit under "data" (e.g. PCA's
+    explained_variance); ndjson and float32 send it in the X-Envelope
+    header instead, arrow in its schema metadata.
+    """
+    headers = {
+        "X-Total-Count": str(n_rows(columns) if total is None else total),
+        "Vary": "Accept",
+    }
+    if envelope is not None and fmt in ("ndjson", "float32"):
+        headers["X-Envelope"] = encode_str(envelope)
+
+    if fmt == "ndjson":
+        return StreamingResponse(ndjson_lines(columns), media_type=MEDIA_TYPES["ndjson"], headers=headers)
+
+    if fmt == "arrow":
+        return Response(arrow_stream(columns, envelope), media_type=MEDIA_TYPES["arrow"], headers=headers)
+
+    if fmt == "float32":
+        headers["X-Fields"] = ",".join(columns)
+        headers["X-Rows"] = str(n_rows(columns))
+        return Response(packed_float32(columns), media_type=MEDIA_TYPES["float32"], headers=headers)
+
+    if fmt == "chunked":
+        if envelope is None:
+            prefix, suffix = b"", b""
+        else:
+            prefix, suffix = encode(envelope)[:-1] + (b"," if envelope else b"") + b'"data":', b"}"
+        return StreamingResponse(json_chunks(columns, prefix, suffix), media_type="application/json", headers=headers)
+
+    if fmt == "columnar":
+        data = {f: values.tolist() for f, values in columns.items()}
+    else:
+        data = records(columns)
+    content = data if envelope is None else {**envelope, "data": data}
+    return Response(encode(content), media_type="application/json", headers=headers)
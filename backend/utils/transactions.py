@@ -0,0 +1,226 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import DATASETS, data_version, with_appended_rows
+from utils.metrics import timed
+
+# Stores kept per dataset (current + previous revision of each; the
+# registry's eviction hook drops those of evicted datasets)
+MAX_STORES = 2
+
+
+def codes_of(values, sort=False):
+    """
+    int32 codes and the dictionary of a column (missing values get -1).
+    Categorical columns are factorized on their codes: no string hashing.
+    """
+    codes, uniques = pd.factorize(values, sort=sort)
+    return codes.astype("int32"), np.asarray(uniques)
+
+
+def offsets_of(codes, n):
+    # offsets[i]:offsets[i + 1] is the run of code i in sorted codes
+    offsets = np.zeros(n + 1, dtype="int64")
+    np.cumsum(np.bincount(codes, minlength=n), out=offsets[1:])
+    return offsets
+
+
+# ---------------------------------------------------------
+# TRANSACTION STORE
+# ---------------------------------------------------------
+class TransactionStore:
+    """
+    The invoice lines of a dataset as flat NumPy columns:
+
+      invoice, product, customer, country   int32 codes into invoices,
+                                            products (descriptions),
+                                            customers (CustomerID, ascending)
+                                            and countries; -1 = missing
+      quantity, price                       float32
+      timestamp                             int64, microseconds since epoch
+      position                              the line's row in the source frame
+
+    Lines are sorted by customer, then invoice (invoice codes follow that
+    order), so the lines of invoice i are invoice_offsets[i]:[i + 1] and
+    the invoices of customer c are customer_invoices[c]:[c + 1]; lines of
+    invoices without a customer come last. An invoice belongs to the
+    customer of its first line.
+    """
+
+    @timed("transactions.build")
+    def __init__(self, df):
+        n = len(df)
+        invoice, invoices = codes_of(df["InvoiceNo"])
+        customer, self.customers = codes_of(df["CustomerID"], sort=True)
+        product, self.products = codes_of(df["Description"])
+        country, self.countries = codes_of(df["Country"])
+
+        # Number the invoices by (customer, first appearance)
+        first_line = np.full(len(invoices), n, dtype="int64")
+        np.minimum.at(first_line, invoice, np.arange(n))
+        owner = customer[first_line]
+        owner_key = np.where(owner < 0, len(self.customers), owner)
+        renumber = np.empty(len(invoices), dtype="int32")
+        renumber[np.argsort(owner_key, kind="stable")] = np.arange(len(invoices), dtype="int32")
+        invoice = renumber[invoice]
+        self.invoices = invoices[np.argsort(renumber)].astype(str)
+        self.invoice_customer = np.sort(owner_key).astype("int32")
+        self.invoice_customer[self.invoice_customer == len(self.customers)] = -1
+
+        order = np.argsort(invoice, kind="stable")
+        self.invoice = invoice[order]
+        self.product = product[order]
+        self.customer = customer[order]
+        self.country = country[order]
+        self.quantity = df["Quantity"].to_numpy()[order].astype("float32")
+        self.price = df["UnitPrice"].to_numpy()[order].astype("float32")
+        dates = df["InvoiceDate"].to_numpy().astype("datetime64[us]")
+        self.timestamp = dates[order].view("int64")
+        self.position = order.astype("int32" if n <= np.iinfo("int32").max else "int64")
+
+        self.invoice_offsets = offsets_of(self.invoice, len(self.invoices))
+        # One more bucket than customers: its invoices have no customer
+        self.customer_invoices = offsets_of(np.sort(owner_key), len(self.customers) + 1)[:-1]
+        self.invoice_index = None   # InvoiceNo -> code, built on first lookup
+
+    def __len__(self):
+        return len(self.invoice)
+
+    # -----------------------------------------------------
+    # O(1) SLICES
+    # -----------------------------------------------------
+    def invoice_lines(self, invoice):
+        # Line range of an invoice code
+        return slice(int(self.invoice_offsets[invoice]), int(self.invoice_offsets[invoice + 1]))
+
+    def customer_invoice_range(self, customer):
+        return range(int(self.customer_invoices[customer]), int(self.customer_invoices[customer + 1]))
+
+    def customer_lines(self, customer):
+        invoices = self.customer_invoice_range(customer)
+        return slice(int(self.invoice_offsets[invoices.start]), int(self.invoice_offsets[invoices.stop]))
+
+    def customer_line_offsets(self):
+        # Line offsets of every customer (customer_lines for all of them)
+        return self.invoice_offsets[self.customer_invoices]
+
+    def invoice_codes(self, invoice_nos):
+        # Codes of many InvoiceNos at once (-1 = unknown)
+        if self.invoice_index is None:
+            self.invoice_index = pd.Index(self.invoices)
+        return self.invoice_index.get_indexer(pd.Index(invoice_nos).astype(str))
+
+    def invoice_code(self, invoice_no):
+        # Code of an InvoiceNo, else None
+        position = self.invoice_codes([invoice_no])[0]
+        return None if position < 0 else int(position)
+
+    def customer_code(self, customer_id):
+        position = int(np.searchsorted(self.customers, customer_id))
+        if position < len(self.customers) and self.customers[position] == customer_id:
+            return position
+        return None
+
+    # -----------------------------------------------------
+    # DERIVED VIEWS
+    # -----------------------------------------------------
+    def amount(self, df=None):
+        """
+        Line amounts in store order: taken from df's Amount column when the
+        source frame is given (exact float64), else quantity x price.
+        """
+        if df is not None and "Amount" in df.columns:
+            return df["Amount"].to_numpy()[self.position]
+        return self.quantity.astype("float64") * self.price.astype("float64")
+
+    def basket(self, positive=True):
+        """
+        Invoice x product basket as a boolean CSR matrix, straight from the
+        codes (lines with a description; with positive, a quantity above 0).
+        Rows are the invoices with such lines, in store order; columns the
+        products in order of first appearance in the source, like a
+        factorize of the raw column. Returns (basket, invoice codes, items).
+        """
+        keep = self.product >= 0
+        if positive:
+            keep &= self.quantity > 0
+        invoice = self.invoice[keep]
+        product = self.product[keep]
+
+        # Lines are sorted by invoice: the row pointers are run lengths
+        counts = np.bincount(invoice, minlength=len(self.invoices))
+        rows = np.flatnonzero(counts)
+        indptr = np.zeros(len(rows) + 1, dtype="int64")
+        np.cumsum(counts[rows], out=indptr[1:])
+
+        # Products in the order a scan of the source meets them
+        in_source = np.full(len(self), -1, dtype="int32")
+        in_source[self.position[keep]] = product
+        columns = pd.unique(in_source[in_source >= 0])
+        column_of = np.full(len(self.products), -1, dtype="int32")
+        column_of[columns] = np.arange(len(columns), dtype="int32")
+
+        from scipy.sparse import csr_matrix   # deferred: keeps scipy out of startup
+        basket = csr_matrix(
+            (np.ones(len(product), dtype=bool), column_of[product], indptr),
+            shape=(len(rows), len(columns)),
+        )
+        # Duplicate (invoice, item) lines are merged; it's a set
+        basket.sum_duplicates()
+        basket.data[:] = True
+        return basket, rows, np.asarray(self.products[columns], dtype=object)
+
+    def nbytes(self):
+        arrays = [
+            self.invoice, self.product, self.customer, self.country, self.quantity, self.price,
+            self.timestamp, self.position, self.invoice_offsets, self.customer_invoices, self.invoice_customer,
+        ]
+        return sum(a.nbytes for a in arrays)
+
+    def status(self):
+        return {
+            "lines": len(self),
+            "invoices": len(self.invoices),
+            "products": len(self.products),
+            "customers": len(self.customers),
+            "countries": len(self.countries),
+            "mb": round(self.nbytes() / 2 ** 20, 2),
+        }
+
+
+_stores = {}   # data version -> store
+_order = {}    # base version -> its versions with a store, oldest first
+_lock = threading.Lock()
+
+
+def get_transaction_store(df):
+    """
+    The TransactionStore of a loaded frame (plus its appended lines),
+    built once per dataset version. Frames without a version get a fresh
+    store every time.
+    """
+    version = data_version(df)
+    if version is None:
+        return TransactionStore(df)
+
+    with _lock:
+        store = _stores.get(version)
+        if store is None:
+            store = TransactionStore(with_appended_rows(df))
+            _stores[version] = store
+            versions = _order.setdefault(version.partition("+")[0], [])
+            versions.append(version)
+            while len(versions) > MAX_STORES:
+                _stores.pop(versions.pop(0), None)
+    return store
+
+
+def drop_dataset(base_version):
+    # Registry eviction hook: stores of every revision of an evicted dataset
+    with _lock:
+        for version in _order.pop(base_version, []):
+            _stores.pop(version, None)
+
+
+DATASETS.on_evict(drop_dataset)
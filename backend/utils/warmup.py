@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+
+# background: the server accepts requests at once, resources load in a thread
+# eager:      startup waits until every resource is loaded
+# lazy:       nothing is loaded before the first request that needs it
+STARTUP_MODES = ("background", "eager", "lazy")
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background")
+
+
+# ---------------------------------------------------------
+# RESOURCE
+# ---------------------------------------------------------
+class Resource:
+    """
+    Heavy state (data, indexes, models) loaded once, on first use or by the
+    warm-up. state: cold -> loading -> ready | failed (a failed resource is
+    tried again on the next get()).
+    """
+
+    def __init__(self, name, load, required=True):
+        self.name = name
+        self.load = load
+        self.required = required
+        self.state = "cold"
+        self.value = None
+        self.error = None
+        self.seconds = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.state == "ready":
+            return self.value
+
+        with self.lock:
+            if self.state != "ready":
+                self.state = "loading"
+                start = time.perf_counter()
+                try:
+                    self.value = self.load()
+                except Exception as e:
+                    self.state = "failed"
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    self.seconds = round(time.perf_counter() - start, 4)
+                self.error = None
+                self.state = "ready"
+        return self.value
+
+    def peek(self):
+        # The value when ready, else None without waiting
+        return self.value if self.state == "ready" else None
+
+    def status(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "seconds": self.seconds,
+            "error": self.error,
+        }
+
+
+# ---------------------------------------------------------
+# RESOURCES + WARM-UP
+# ---------------------------------------------------------
+class Resources:
+    """
+    The named resources of the app, warmed in registration order.
+    """
+
+    def __init__(self):
+        self.resources = {}
+        self.started = time.time()
+        self.warming = None
+        self.mode = STARTUP_MODE
+
+    def register(self, name, load, required=True):
+        self.resources[name] = Resource(name, load, required)
+        return self.resources[name]
+
+    def get(self, name):
+        return self.resources[name].get()
+
+    def warm(self, names=None):
+        for name in names or list(self.resources):
+            try:
+                self.resources[name].get()
+            except Exception as e:
+                print(f"[ERROR] Warm-up of {name} failed: {type(e).__name__}: {e}")
+
+    def warm_in_background(self, names=None):
+        thread = threading.Thread(target=self.warm, args=(names,), name="warmup", daemon=True)
+        thread.start()
+        if names is None:
+            self.warming = thread
+        return thread
+
+    def start(self, mode=STARTUP_MODE):
+        if mode not in STARTUP_MODES:
+            raise ValueError(f"STARTUP_MODE must be one of {', '.join(STARTUP_MODES)}")
+        print(f"[INFO] Startup mode: {mode}")
+        self.mode = mode
+        if mode == "eager":
+            self.warm()
+        elif mode == "background":
+            self.warm_in_background()
+
+    def ready(self):
+        # Lazy startup loads on first use: there is nothing to wait for
+        if self.mode == "lazy":
+            return True
+        return all(r.state == "ready" for r in self.resources.values() if r.required)
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "mode": self.mode,
+            "uptime": round(time.time() - self.started, 1),
+            "warming": self.warming is not None and self.warming.is_alive(),
+            "resources": {name: r.status() for name, r in self.resources.items()},
+        }
+
+
+RESOURCES = Resources()
@@ -0,0 +1,360 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import data_version
+from utils.feature_store import get_customer_features
+from utils.metrics import STAGES
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Jobs allowed to wait for a free worker before new ones are refused
+MAX_QUEUE = 16
+# Seconds a request waits for its job (the job itself keeps running)
+JOB_TIMEOUT = 60
+# Feature tables kept in shared memory (current + previous revision, a few datasets)
+SHARED_VERSIONS = 4
+# Fit results kept per (function, args, data version)
+MAX_RESULTS = 16
+
+
+_in_worker = False
+
+
+def mark_worker():
+    # Pool initializer: code running in a worker never starts a nested pool
+    global _in_worker
+    _in_worker = True
+
+
+def in_worker_process():
+    return _in_worker
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+class JobTimeout(Exception):
+    pass
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+# ---------------------------------------------------------
+# FRAMES IN SHARED MEMORY
+# ---------------------------------------------------------
+def share_frame(df):
+    """
+    Copy the numeric / datetime columns of df into one shared memory block.
+    Returns the block and a small picklable layout workers attach with.
+    """
+    columns = []
+    offset = 0
+    for col in df.columns:
+        values = df[col].to_numpy()
+        if values.dtype.kind not in "biufM":
+            raise ValueError(f"Column {col} can not be shared ({values.dtype})")
+        columns.append((col, values.dtype.str, offset))
+        offset += -(-values.nbytes // 8) * 8
+
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    for col, dtype, start in columns:
+        target = np.ndarray(len(df), dtype=dtype, buffer=shm.buf, offset=start)
+        target[:] = df[col].to_numpy()
+        del target   # no exported buffer may outlive close()
+
+    return shm, {"name": shm.name, "rows": len(df), "columns": columns}
+
+
+# Worker side: the block attached last, reused while jobs keep naming it
+_attached = {}
+_retired = []   # blocks still referenced by a live frame, closed later
+
+
+def release_retired():
+    for shm in list(_retired):
+        try:
+            shm.close()
+            _retired.remove(shm)
+        except BufferError:
+            pass
+
+
+def attached_frame(layout):
+    entry = _attached.get(layout["name"])
+    if entry is None:
+        _retired.extend(shm for shm, _ in _attached.values())
+        _attached.clear()
+        release_retired()
+
+        shm = SharedMemory(name=layout["name"])
+        columns = {}
+        for col, dtype, start in layout["columns"]:
+            arr = np.ndarray(layout["rows"], dtype=dtype, buffer=shm.buf, offset=start)
+            arr.flags.writeable = False
+            columns[col] = arr
+        frame = pd.DataFrame(columns, copy=False)
+        frame.attrs["data_version"] = layout["version"]
+        entry = (shm, frame)
+        _attached[layout["name"]] = entry
+
+    # Shallow copy: jobs may add columns without touching the shared block
+    return entry[1].copy(deep=False)
+
+
+def run_job(layout, func, args):
+    # The stages timed in the worker go back with the result (see finished)
+    started = time.time()
+    with STAGES.recording() as stages:
+        result = func(attached_frame(layout), *args)
+    return started, time.time() - started, result, stages
+
+
+# ---------------------------------------------------------
+# SCHEDULER
+# ---------------------------------------------------------
+class Scheduler:
+    """
+    Bounded process pool for CPU-bound fits. Identical jobs (same key)
+    that are already in flight are shared instead of submitted again; a
+    request gives up after `timeout` seconds but its job finishes and
+    later identical requests still join it. A worker that dies (e.g. the
+    OOM killer) breaks the pool: the next job starts a fresh one.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queue=MAX_QUEUE, timeout=JOB_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pool = None
+        self.inflight = {}   # key -> asyncio future
+        self.lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    def executor(self):
+        if self.pool is None:
+            # spawn: uvicorn has threads running, forking them is unsafe
+            self.pool = ProcessPoolExecutor(self.max_workers, mp_context=get_context("spawn"), initializer=mark_worker)
+        return self.pool
+
+    async def run(self, key, layout, func, *args, release=None):
+        """
+        func(frame of layout, *args) in a worker. release() is called once
+        the job is over (also when this request gave up waiting for it),
+        or right away when the job is refused.
+        Raises SchedulerBusy, JobTimeout, WorkerCrashed, or what func raised.
+        """
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                if len(self.inflight) >= self.max_workers + self.max_queue:
+                    self.rejected += 1
+                    if release is not None:
+                        release()
+                    raise SchedulerBusy(f"{len(self.inflight)} jobs already queued")
+
+                submitted = time.time()
+                pool = self.executor()
+                try:
+                    job = pool.submit(run_job, layout, func, args)
+                except BrokenProcessPool:
+                    # Broke after its last job finished: once more on a fresh pool
+                    self.pool = None
+                    pool = self.executor()
+                    job = pool.submit(run_job, layout, func, args)
+                future = asyncio.wrap_future(job)
+                future.add_done_callback(lambda f: self.finished(key, f, submitted, pool))
+                self.inflight[key] = future
+                self.submitted += 1
+        if release is not None:
+            future.add_done_callback(lambda f: release())
+
+        try:
+            _, _, result, _ = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            raise JobTimeout(f"Job did not finish within {self.timeout}s")
+        except BrokenProcessPool:
+            raise WorkerCrashed("A worker process died while running the job, try again")
+        return result
+
+    def worker_pool(self):
+        """
+        The pool itself, for blocks of a computation the caller waits for
+        (not counted as jobs): every CPU-heavy part of the server shares
+        the MAX_WORKERS processes. Pass it to pool_broken on BrokenProcessPool.
+        """
+        with self.lock:
+            return self.executor()
+
+    def pool_broken(self, pool):
+        # A worker died: the next caller starts a fresh pool
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+
+    def map(self, func, items):
+        # [func(item) for item in items] on the worker pool, in order
+        if in_worker_process():
+            return [func(item) for item in items]
+        pool = self.worker_pool()
+        try:
+            return list(pool.map(func, items))
+        except BrokenProcessPool:
+            self.pool_broken(pool)
+            raise
+
+    def finished(self, key, future, submitted, pool):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+                if isinstance(future.exception(), BrokenProcessPool) and self.pool is pool:
+                    self.pool = None   # a worker died; start a fresh pool next time
+                return
+
+            started, elapsed, _, stages = future.result()
+            STAGES.add_records(stages)
+            self.completed += 1
+            self.wait_seconds += max(0.0, started - submitted)
+            self.run_seconds += elapsed
+            self.max_run_seconds = max(self.max_run_seconds, elapsed)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def stats(self):
+        with self.lock:
+            in_flight = len(self.inflight)
+            done = max(self.completed, 1)
+            return {
+                "workers": self.max_workers,
+                "in_flight": in_flight,
+                "queue_depth": max(0, in_flight - self.max_workers),
+                "max_queue": self.max_queue,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_wait_seconds": round(self.wait_seconds / done, 4),
+                "avg_run_seconds": round(self.run_seconds / done, 4),
+                "max_run_seconds": round(self.max_run_seconds, 4),
+            }
+
+
+SCHEDULER = Scheduler()
+
+
+# ---------------------------------------------------------
+# CUSTOMER FEATURES FOR WORKERS
+# ---------------------------------------------------------
+_shared = OrderedDict()   # data version -> [shm, layout, jobs using it]
+_draining = {}            # versions out of _shared that jobs still use
+_results = OrderedDict()  # job key -> result (only touched on the event loop)
+_shared_lock = threading.Lock()
+
+
+def shared_customer_features(df):
+    """
+    Layout of the customer feature table of df in shared memory, published
+    once per data version, counting one more job that uses it: pair every
+    call with release_shared(version) once that job is over. Versions
+    pushed out by newer ones are unlinked when no queued or running job
+    still has to attach to them (workers that have them mapped keep a
+    valid view until they move on).
+    """
+    version = data_version(df)
+    with _shared_lock:
+        entry = _shared.get(version)
+        if entry is None:
+            shm, layout = share_frame(get_customer_features(df))
+            layout["version"] = version
+            entry = [shm, layout, 0]
+            _shared[version] = entry
+            while len(_shared) > SHARED_VERSIONS:
+                old_version, old = _shared.popitem(last=False)
+                if old[2]:
+                    _draining[old_version] = old
+                else:
+                    unlink(old[0])
+        _shared.move_to_end(version)
+        entry[2] += 1
+        return entry[1]
+
+
+def release_shared(version):
+    with _shared_lock:
+        entry = _shared.get(version) or _draining.get(version)
+        if entry is None:
+            return
+        entry[2] -= 1
+        if entry[2] == 0 and version in _draining:
+            del _draining[version]
+            unlink(entry[0])
+
+
+def unlink(shm):
+    shm.close()
+    shm.unlink()
+
+
+async def fit_customer_model(df, func, *args):
+    """
+    func(customer_features, *args) in a worker process. func must be a
+    module-level function (it is sent to the worker by reference).
+    """
+    version = data_version(df)
+    if version is None:
+        # Nothing to key the shared table on: fit in a thread instead
+        return await asyncio.to_thread(lambda: func(get_customer_features(df), *args))
+
+    key = (func.__module__, func.__name__, args, version)
+    result = _results.get(key)
+    if result is not None:
+        _results.move_to_end(key)
+        return result
+
+    layout = await asyncio.to_thread(shared_customer_features, df)
+    result = await SCHEDULER.run(key, layout, func, *args, release=lambda: release_shared(version))
+
+    _results[key] = result
+    while len(_results) > MAX_RESULTS:
+        _results.popitem(last=False)
+    return result
+
+
+def shutdown_workers():
+    SCHEDULER.shutdown()
+    with _shared_lock:
+        for shm, _, _ in [*_shared.values(), *_draining.values()]:
+            unlink(shm)
+        _shared.clear()
+        _draining.clear()
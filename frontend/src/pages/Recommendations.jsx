@@ -13,9 +13,9 @@ export default function SimilarProductsDashboard() {
     async function load() {
       try {
         const res = await API.allSimilarProducts();
-        setData(res);
-        if (Object.keys(res).length > 0) {
-          setSelectedProduct(Object.keys(res)[0]);
+        setData(res.products);
+        if (Object.keys(res.products).length > 0) {
+          setSelectedProduct(Object.keys(res.products)[0]);
         }
       } catch (err) {
         console.error(err);
@@ -28,7 +28,9 @@ export const API = {
   // KNN - Similar products
   similarProducts: (product) => get(`/similar-products?product=${product}`),
 
-  allSimilarProducts: () => get("/similar-products/all"),
+  // Paged: { products, next_cursor, total }
+  allSimilarProducts: (cursor = 0, limit = 50) =>
+    get(`/similar-products/all?cursor=${cursor}&limit=${limit}`),
 
   // K-Means customer segmentation
   customerSegmentation: (k = 3) => get(`/customer-segmentation?k=${k}`),
@@ -86,8 +88,9 @@ const peak = await API.peakSales();
 // Similar products
 const rec = await API.similarProducts("Laptop");
 
-// All similar products (first 50 only)
-const all = await API.allSimilarProducts();
+// All similar products, one page at a time
+const page = await API.allSimilarProducts(0, 50);
+const next = await API.allSimilarProducts(page.next_cursor, 50);
 
 // K-Means Segmentation
 const clusters = await API.customerSegmentation(3);